@@ -0,0 +1,352 @@
+"""
+Cohort analytics: daily decision and severity distributions by region.
+
+Grouping and percentiles run in the database: raw rows are grouped into a
+histogram - check-ins per (day, region, decision, score), environment rows
+per (day, region, severity) - and aggregated from there. Percentiles are
+nearest-rank (percentile_disc) over the score histogram, using window sums
+that every supported database runs.
+
+The daily rollup tables store those results for complete days (decisions
+per region and across all users, severity counts per region), so a year of
+dashboard is a few hundred rows. Days covered by the rollup are read from
+it; the rest (typically today) from raw rows. Keep it current from cron:
+
+    python -m app.analytics refresh [--days N | --start YYYY-MM-DD --end YYYY-MM-DD]
+
+Rollups record each user's region at refresh time; raw rows use the
+region the user is in now.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import Date, case, delete, func, insert, literal, select, union_all
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from . import database, models, engine, migrations
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", 400))
+# Days re-rolled by a default refresh: late write-behind flushes land in them
+ROLLUP_REFRESH_DAYS = int(os.getenv("ROLLUP_REFRESH_DAYS", 2))
+
+PERCENTILES = {"p10_readiness": 0.1, "p50_readiness": 0.5, "p90_readiness": 0.9}
+
+class utc_day(FunctionElement):
+    """UTC calendar day of a timestamp column."""
+    type = Date()
+    inherit_cache = True
+
+@compiles(utc_day)
+def _utc_day(element, compiler, **kw):
+    # SQLite stores timestamps as UTC text
+    return f"date({compiler.process(element.clauses, **kw)})"
+
+@compiles(utc_day, "postgresql")
+def _utc_day_postgresql(element, compiler, **kw):
+    return f"CAST(timezone('UTC', {compiler.process(element.clauses, **kw)}) AS DATE)"
+
+def _bounds(start: date, end: date) -> Tuple[datetime, datetime]:
+    return (
+        datetime.combine(start, datetime.min.time(), timezone.utc),
+        datetime.combine(end, datetime.min.time(), timezone.utc)
+    )
+
+# ============================================================
+# HISTOGRAMS
+# ============================================================
+
+def readiness_histogram(start: date, end: date, region_id: Optional[int] = None):
+    """Check-ins per (day, region_id, decision, readiness_score) from raw rows, start <= day < end."""
+    readiness, user = models.DailyReadiness, models.User
+    day = utc_day(readiness.date)
+    start_at, end_at = _bounds(start, end)
+    stmt = select(
+        day.label("day"),
+        user.region_id.label("region_id"),
+        readiness.decision.label("decision"),
+        readiness.readiness_score.label("readiness_score"),
+        func.count().label("checkins")
+    ).join(user, user.id == readiness.user_id)\
+        .where(readiness.date >= start_at, readiness.date < end_at)\
+        .group_by(day, user.region_id, readiness.decision, readiness.readiness_score)
+    if region_id is not None:
+        stmt = stmt.where(user.region_id == region_id)
+    return stmt
+
+def severity_histogram(start: date, end: date, region_id: Optional[int] = None):
+    """Environment rows per (day, region_id, severity) from raw rows, start <= day < end."""
+    policy, user = models.EnvironmentPolicy, models.User
+    day = utc_day(policy.date)
+    start_at, end_at = _bounds(start, end)
+    stmt = select(
+        day.label("day"),
+        user.region_id.label("region_id"),
+        policy.severity.label("severity"),
+        func.count().label("records")
+    ).join(user, user.id == policy.user_id)\
+        .where(policy.date >= start_at, policy.date < end_at)\
+        .group_by(day, user.region_id, policy.severity)
+    if region_id is not None:
+        stmt = stmt.where(user.region_id == region_id)
+    return stmt
+
+SEVERITY_COLUMNS = ("day", "region_id", "severity", "records")
+
+def _rollup_histogram(start: date, end: date, region_id: Optional[int]):
+    rollup = models.SeverityRollup
+    stmt = select(*(getattr(rollup, name) for name in SEVERITY_COLUMNS))\
+        .where(rollup.day >= start, rollup.day < end)
+    if region_id is not None:
+        stmt = stmt.where(rollup.region_id == region_id)
+    return stmt
+
+def coverage(db, rollup) -> Optional[Tuple[date, date]]:
+    """(first, last) days the rollup holds complete data for, if any."""
+    row = db.get(models.RollupCoverage, rollup.__tablename__)
+    return (row.first_day, row.last_day) if row is not None else None
+
+def _split(db, rollup, start: date, end: date, use_rollup: bool):
+    """[start, end) as (rolled-up range or None, raw ranges)."""
+    covered = coverage(db, rollup) if use_rollup else None
+    if covered is None:
+        return None, [(start, end)]
+    first, last = max(covered[0], start), min(covered[1] + timedelta(days=1), end)
+    if first >= last:
+        return None, [(start, end)]
+    raw = [(a, b) for a, b in ((start, first), (last, end)) if a < b]
+    return (first, last), raw
+
+def _sorted(entries) -> list:
+    return sorted(entries, key=lambda e: (e["day"], e["region_id"] is None, e["region_id"] or 0))
+
+# ============================================================
+# QUERIES
+# ============================================================
+
+def date_range(start: Optional[date], end: Optional[date]) -> Tuple[date, date]:
+    """[start, end) defaulting to the last ANALYTICS_DEFAULT_DAYS days including today."""
+    end = end or datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = start or end - timedelta(days=ANALYTICS_DEFAULT_DAYS)
+    if start >= end:
+        raise ValueError("start must be before end")
+    if (end - start).days > ANALYTICS_MAX_DAYS:
+        raise ValueError(f"At most {ANALYTICS_MAX_DAYS} days per request")
+    return start, end
+
+def _decision_days(db, hist, by_region: bool) -> list:
+    """Per day (and region) decision counts, score sum and percentiles of a histogram subquery."""
+    group = [hist.c.day, hist.c.region_id] if by_region else [hist.c.day]
+    counts = db.execute(
+        select(
+            *group, hist.c.decision,
+            func.sum(hist.c.checkins).label("checkins"),
+            func.sum(hist.c.readiness_score * hist.c.checkins).label("score_sum")
+        ).group_by(*group, hist.c.decision)
+    ).all()
+
+    # Nearest-rank percentiles: the lowest score whose running count reaches p of the day's total
+    scores = select(*group, hist.c.readiness_score, func.sum(hist.c.checkins).label("n"))\
+        .group_by(*group, hist.c.readiness_score).subquery()
+    partition = [scores.c.day, scores.c.region_id] if by_region else [scores.c.day]
+    running = select(
+        *partition, scores.c.readiness_score,
+        func.sum(scores.c.n).over(partition_by=partition, order_by=scores.c.readiness_score).label("running"),
+        func.sum(scores.c.n).over(partition_by=partition).label("total")
+    ).subquery()
+    key = [running.c.day, running.c.region_id] if by_region else [running.c.day]
+    percentiles = db.execute(
+        select(*key, *(
+            func.min(case((running.c.running >= running.c.total * literal(p), running.c.readiness_score))).label(name)
+            for name, p in PERCENTILES.items()
+        )).group_by(*key)
+    ).all()
+
+    days = {}
+    for row in counts:
+        region = row.region_id if by_region else None
+        entry = days.setdefault((row.day, region), {
+            "day": row.day, "region_id": region, "checkins": 0,
+            "decisions": dict.fromkeys(engine.DECISIONS, 0), "score_sum": 0
+        })
+        entry["checkins"] += row.checkins
+        entry["decisions"][row.decision] = entry["decisions"].get(row.decision, 0) + row.checkins
+        entry["score_sum"] += row.score_sum or 0
+    for row in percentiles:
+        entry = days.get((row.day, row.region_id if by_region else None))
+        if entry is not None:
+            entry.update({name: getattr(row, name) for name in PERCENTILES})
+    return list(days.values())
+
+def _rolled_up_decisions(db, start: date, end: date, region_id: Optional[int], by_region: bool) -> list:
+    rollup = models.DecisionRollup
+    stmt = select(rollup).where(rollup.day >= start, rollup.day < end)
+    if by_region or region_id is not None:
+        stmt = stmt.where(rollup.all_regions.is_(False))
+        if region_id is not None:
+            stmt = stmt.where(rollup.region_id == region_id)
+    else:
+        stmt = stmt.where(rollup.all_regions.is_(True))
+    return [
+        {
+            "day": row.day, "region_id": row.region_id if by_region else None,
+            "checkins": row.checkins, "decisions": row.decisions, "score_sum": row.score_sum,
+            **{name: getattr(row, name) for name in PERCENTILES}
+        }
+        for row in db.execute(stmt).scalars()
+    ]
+
+def decision_analytics(db, start: date, end: date, region_id: Optional[int] = None,
+                       by_region: bool = False, use_rollup: bool = True) -> dict:
+    rolled_up, raw_ranges = _split(db, models.DecisionRollup, start, end, use_rollup)
+    entries = []
+    for raw_start, raw_end in raw_ranges:
+        hist = readiness_histogram(raw_start, raw_end, region_id).subquery()
+        entries.extend(_decision_days(db, hist, by_region))
+    if rolled_up is not None:
+        entries.extend(_rolled_up_decisions(db, *rolled_up, region_id, by_region))
+    for entry in entries:
+        score_sum = entry.pop("score_sum")
+        entry["avg_readiness"] = round(score_sum / entry["checkins"], 1) if entry["checkins"] else None
+    return {
+        "start": start,
+        "end": end,
+        "rollup_days": (rolled_up[1] - rolled_up[0]).days if rolled_up else 0,
+        "days": _sorted(entries)
+    }
+
+def severity_analytics(db, start: date, end: date, region_id: Optional[int] = None,
+                       by_region: bool = False, use_rollup: bool = True) -> dict:
+    # Counts add up across days and regions, so the rollup keeps the histogram itself
+    rolled_up, raw_ranges = _split(db, models.SeverityRollup, start, end, use_rollup)
+    parts = [severity_histogram(a, b, region_id) for a, b in raw_ranges]
+    if rolled_up is not None:
+        parts.append(_rollup_histogram(*rolled_up, region_id))
+    hist = (parts[0] if len(parts) == 1 else union_all(*parts)).subquery()
+
+    group = [hist.c.day, hist.c.region_id] if by_region else [hist.c.day]
+    rows = db.execute(
+        select(*group, hist.c.severity, func.sum(hist.c.records).label("records"))
+        .group_by(*group, hist.c.severity)
+    ).all()
+
+    days = {}
+    for row in rows:
+        region = row.region_id if by_region else None
+        entry = days.setdefault((row.day, region), {"day": row.day, "region_id": region, "records": 0, "severities": {}})
+        entry["records"] += row.records
+        entry["severities"][row.severity or "unknown"] = row.records
+    return {
+        "start": start,
+        "end": end,
+        "rollup_days": (rolled_up[1] - rolled_up[0]).days if rolled_up else 0,
+        "days": _sorted(days.values())
+    }
+
+# ============================================================
+# ROLLUP
+# ============================================================
+
+def _refresh_decisions(db, start: date, end: date) -> int:
+    rows = []
+    for all_regions in (False, True):
+        hist = readiness_histogram(start, end).subquery()
+        for entry in _decision_days(db, hist, by_region=not all_regions):
+            rows.append({"all_regions": all_regions, **entry})
+    if rows:
+        db.execute(insert(models.DecisionRollup), rows)
+    return len(rows)
+
+def _refresh_severity(db, start: date, end: date) -> int:
+    return db.execute(
+        insert(models.SeverityRollup).from_select(list(SEVERITY_COLUMNS), severity_histogram(start, end))
+    ).rowcount
+
+ROLLUPS = (
+    (models.DecisionRollup, _refresh_decisions),
+    (models.SeverityRollup, _refresh_severity),
+)
+
+def refresh_rollups(start: Optional[date] = None, end: Optional[date] = None) -> dict:
+    """
+    Re-aggregate [start, end) into the rollup tables, replacing those days,
+    in one transaction. Defaults to the last ROLLUP_REFRESH_DAYS complete days.
+    Coverage grows when the range touches what is already covered.
+    """
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=ROLLUP_REFRESH_DAYS)
+    report = {}
+    db = database.SessionLocal()
+    try:
+        for rollup, refresh in ROLLUPS:
+            started = time.perf_counter()
+            db.execute(delete(rollup).where(rollup.day >= start, rollup.day < end))
+            inserted = refresh(db, start, end)
+
+            last = end - timedelta(days=1)
+            state = db.get(models.RollupCoverage, rollup.__tablename__)
+            if state is None:
+                db.add(models.RollupCoverage(name=rollup.__tablename__, first_day=start, last_day=last))
+            elif start <= state.last_day + timedelta(days=1) and last >= state.first_day - timedelta(days=1):
+                state.first_day, state.last_day = min(state.first_day, start), max(state.last_day, last)
+            else:
+                # Disjoint from what was covered: only the new range is known complete
+                state.first_day, state.last_day = start, last
+            report[rollup.__tablename__] = {
+                "rows": inserted,
+                "elapsed_s": round(time.perf_counter() - started, 3)
+            }
+        db.commit()
+    finally:
+        db.close()
+    return report
+
+def first_day(db) -> Optional[date]:
+    """Day of the oldest stored row, for a full backfill."""
+    oldest = [
+        db.execute(select(func.min(model.date))).scalar()
+        for model in (models.DailyReadiness, models.EnvironmentPolicy)
+    ]
+    oldest = [value for value in oldest if value is not None]
+    if not oldest:
+        return None
+    value = min(oldest)
+    if isinstance(value, str):  # SQLite aggregates come back as text
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the analytics rollup tables")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    refresh = subcommands.add_parser("refresh", help="re-aggregate complete days into the rollups")
+    refresh.add_argument("--days", type=int, help="days before today to refresh (default ROLLUP_REFRESH_DAYS)")
+    refresh.add_argument("--start", type=date.fromisoformat, help="first day (inclusive)")
+    refresh.add_argument("--end", type=date.fromisoformat, help="last day (exclusive, default today)")
+    refresh.add_argument("--all", action="store_true", help="backfill from the oldest stored row")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    migrations.upgrade(database.engine, models.Base.metadata)
+    end = args.end or datetime.now(timezone.utc).date()
+    start = args.start
+    if args.all:
+        db = database.SessionLocal()
+        try:
+            start = first_day(db) or end
+        finally:
+            db.close()
+    elif args.days is not None:
+        start = end - timedelta(days=args.days)
+    if start is not None and start >= end:
+        parser.error("nothing to refresh: start must be before end")
+    print(json.dumps(refresh_rollups(start, end)))
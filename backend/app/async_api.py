@@ -0,0 +1,326 @@
+"""
+Async versions of the database-backed endpoints in main.py, on async
+SQLAlchemy sessions. main.py serves these instead of its sync handlers
+when database.async_engine is available (DB_ASYNC). Cache reads and
+invalidations use the blocking Redis client, so they go through the
+services.a* helpers, which run them in the threadpool.
+tests/test_async_api.py checks the two sets of handlers respond alike.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime
+from typing import List, Optional
+
+from . import models, schemas, database, export, cache, services, write_behind, precompute, trends, analytics, profiling, singleflight, fast_json
+from .services import HISTORY_DEFAULT_LIMIT, HISTORY_MAX_LIMIT
+
+router = APIRouter(route_class=profiling.ProfiledRoute)
+
+@router.post("/users/", response_model=schemas.User)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    db_user = models.User(username=user.username, email=user.email)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+@router.post("/readiness/", response_model=schemas.DailyReadinessResponse)
+async def submit_readiness(
+    data: schemas.DailyReadinessCreate,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    db_readiness = services.readiness_row(data)
+    if write_behind.buffer is not None:
+        await services.abuffer_row(db_readiness)
+        return fast_json.response(fast_json.render(schemas.DailyReadinessResponse, db_readiness))
+    db.add(db_readiness)
+    await db.run_sync(trends.record, [db_readiness])
+    await db.flush()
+    await db.run_sync(precompute.refresh_decision, db_readiness, db_readiness.decision)
+    await db.commit()
+    await db.refresh(db_readiness)
+    await services.ainvalidate(data.user_id, cache.READINESS_PAGE, cache.DAILY_DECISION)
+    return fast_json.response(fast_json.render(schemas.DailyReadinessResponse, db_readiness))
+
+@router.get("/readiness/{user_id}", response_model=List[schemas.DailyReadinessResponse])
+async def get_user_history(
+    user_id: int,
+    before: Optional[int] = Query(None, description="Return rows older than this row id (the X-Next-Cursor header of the previous page)"),
+    limit: int = Query(HISTORY_DEFAULT_LIMIT, ge=1, le=HISTORY_MAX_LIMIT),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return, e.g. readiness_score,decision"),
+    since: Optional[datetime] = Query(None, description="Only rows dated at or after this; keeps the query on recent partitions"),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Readiness history, newest first. Follow X-Next-Cursor to page back.
+    The default first page (what dashboards poll) is served from cache.
+    """
+    projection = services.parse_fields(fields, schemas.DailyReadinessResponse)
+    if projection is not None:
+        stmt = services.history_page(
+            services.readiness_projection_statement(projection), models.DailyReadiness, user_id, before, limit, since
+        )
+        rows = (await db.execute(stmt)).all()
+        return services.projected_readiness_response(rows, projection, limit)
+
+    cacheable = before is None and since is None and limit == HISTORY_DEFAULT_LIMIT
+    if cacheable:
+        cached, generation = await services.acached_response(cache.READINESS_PAGE, user_id)
+        if cached is not None:
+            return cached
+        payload, shared = await singleflight.async_readers.do(
+            (cache.READINESS_PAGE, user_id, generation), lambda: _readiness_page_payload(db, user_id, generation)
+        )
+        return services.coalesced_response(payload, shared)
+
+    stmt = services.history_page(select(models.DailyReadiness), models.DailyReadiness, user_id, before, limit, since)
+    rows = (await db.execute(stmt)).scalars().all()
+    body = fast_json.render_many(schemas.DailyReadinessResponse, rows)
+    return fast_json.response(body, services.next_cursor(rows, limit))
+
+async def _readiness_page_payload(db: AsyncSession, user_id: int, generation: Optional[str]) -> str:
+    stmt = services.history_page(
+        select(models.DailyReadiness), models.DailyReadiness, user_id, None, HISTORY_DEFAULT_LIMIT, None
+    )
+    rows = (await db.execute(stmt)).scalars().all()
+    body = fast_json.render_many(schemas.DailyReadinessResponse, rows)
+    return services.cache_payload(cache.READINESS_PAGE, user_id, generation, body, services.next_cursor(rows, HISTORY_DEFAULT_LIMIT))
+
+@router.post("/environment-input", response_model=schemas.EnvironmentImpactResponse)
+async def submit_environment_input(
+    data: schemas.EnvironmentInputCreate,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Submit environmental and policy data.
+    Returns calculated constraints and human-readable adjustments.
+    """
+    constraints, adjustments, severity = services.evaluate_environment(data)
+    db_env = services.environment_policy_row(data, constraints, adjustments, severity)
+    db.add(db_env)
+    await db.commit()
+    await db.refresh(db_env)
+    await services.ainvalidate(data.user_id, cache.ENVIRONMENT_IMPACT)
+    return fast_json.response(fast_json.render(schemas.EnvironmentImpactResponse, services.environment_response(db_env)))
+
+@router.get("/environment-impact/{user_id}", response_model=Optional[schemas.EnvironmentImpactResponse])
+async def get_environment_impact(
+    user_id: int,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Get the latest environment impact data for a user: their own latest
+    environment input or their region's current snapshot, whichever is newer.
+    Served from cache until the user's environment changes.
+    """
+    cached, generation = await services.acached_response(cache.ENVIRONMENT_IMPACT, user_id)
+    if cached is not None:
+        return cached
+
+    payload, shared = await singleflight.async_readers.do(
+        (cache.ENVIRONMENT_IMPACT, user_id, generation), lambda: _environment_impact_payload(db, user_id, generation)
+    )
+    return services.coalesced_response(payload, shared)
+
+async def _environment_impact_payload(db: AsyncSession, user_id: int, generation: Optional[str]) -> str:
+    db_env = (await db.execute(services.latest_environment_statement(user_id))).scalars().first()
+    snapshot = (await db.execute(services.user_snapshot_statement(user_id))).scalars().first()
+
+    stale = [row for row in (db_env, snapshot) if row is not None and services.refresh_environment_policy(row)]
+    if stale:
+        await db.commit()
+
+    content = services.user_environment_response(db_env, snapshot, user_id)
+    return services.cache_payload(cache.ENVIRONMENT_IMPACT, user_id, generation, fast_json.render(schemas.EnvironmentImpactResponse, content))
+
+@router.get("/environment-history/{user_id}", response_model=List[schemas.EnvironmentImpactResponse])
+async def get_environment_history(
+    user_id: int,
+    before: Optional[int] = Query(None, description="Return rows older than this row id (the X-Next-Cursor header of the previous page)"),
+    limit: int = Query(10, ge=1, le=HISTORY_MAX_LIMIT),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return, e.g. date,severity"),
+    since: Optional[datetime] = Query(None, description="Only rows dated at or after this; keeps the query on recent partitions"),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Get environment impact history for a user, newest first.
+    Follow X-Next-Cursor to page back.
+    """
+    projection = services.parse_fields(fields, schemas.EnvironmentImpactResponse)
+    stmt = services.history_page(select(models.EnvironmentPolicy), models.EnvironmentPolicy, user_id, before, limit, since)
+    records = (await db.execute(stmt)).scalars().all()
+
+    # Rows computed with older rules are recomputed for the response only: committing
+    # here would write from a GET and reload every row. python -m app.rescore environment
+    # persists them.
+    for db_env in records:
+        services.refresh_environment_policy(db_env)
+
+    if projection is not None:
+        return services.projected_environment_response(records, projection, limit)
+
+    body = fast_json.render_many(schemas.EnvironmentImpactResponse, map(services.environment_response, records))
+    return fast_json.response(body, services.next_cursor(records, limit))
+
+@router.post("/regions/", response_model=schemas.Region)
+async def create_region(region: schemas.RegionCreate, db: AsyncSession = Depends(database.get_async_db)):
+    db_region = models.Region(name=region.name)
+    db.add(db_region)
+    await db.commit()
+    await db.refresh(db_region)
+    return db_region
+
+@router.put("/users/{user_id}/region", response_model=schemas.User)
+async def set_user_region(
+    user_id: int,
+    data: schemas.UserRegionUpdate,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Link a user to a region (or unlink with region_id null)."""
+    db_user = await db.get(models.User, user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if data.region_id is not None and await db.get(models.Region, data.region_id) is None:
+        raise HTTPException(status_code=404, detail="Region not found")
+    db_user.region_id = data.region_id
+    await db.commit()
+    await services.ainvalidate(user_id, cache.ENVIRONMENT_IMPACT)
+    return db_user
+
+@router.post("/regions/{region_id}/snapshots", response_model=schemas.EnvironmentSnapshotResponse)
+async def create_environment_snapshot(
+    region_id: int,
+    data: schemas.EnvironmentSnapshotCreate,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Publish environment conditions for every user in a region; rules are
+    evaluated once here and users read the stored result.
+    """
+    if await db.get(models.Region, region_id) is None:
+        raise HTTPException(status_code=404, detail="Region not found")
+    constraints, adjustments, severity = services.evaluate_environment(data)
+    snapshot = services.environment_snapshot_row(region_id, data, constraints, adjustments, severity)
+    db.add(snapshot)
+    await db.commit()
+    await db.refresh(snapshot)
+    user_ids = (await db.execute(services.region_user_ids_statement(region_id))).scalars().all()
+    await services.ainvalidate_many(user_ids, cache.ENVIRONMENT_IMPACT)
+    # Score the region's users ahead of their first dashboard read
+    precompute.schedule(region_id)
+    return services.snapshot_response(snapshot)
+
+@router.get("/regions/{region_id}/environment", response_model=Optional[schemas.EnvironmentSnapshotResponse])
+async def get_region_environment(region_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """The region's current snapshot, if any."""
+    snapshot = (await db.execute(services.region_snapshot_statement(region_id))).scalars().first()
+    if snapshot is None:
+        return None
+    if services.refresh_environment_policy(snapshot):
+        await db.commit()
+    return services.snapshot_response(snapshot)
+
+@router.get("/decisions/{user_id}/today", response_model=Optional[schemas.DailyDecisionResponse])
+async def get_today_decision(user_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """
+    Today's precomputed decision (see precompute.py), from the user's latest
+    check-in and current environment. null until the day's precompute has run.
+    """
+    cached, generation = await services.acached_response(cache.DAILY_DECISION, user_id)
+    if cached is not None:
+        return cached
+    decision = (await db.execute(services.daily_decision_statement(user_id, precompute.today()))).scalars().first()
+    return services.cache_response(cache.DAILY_DECISION, user_id, generation, fast_json.render(schemas.DailyDecisionResponse, decision))
+
+@router.get("/trends/{user_id}", response_model=Optional[schemas.TrendsResponse])
+async def get_trends(user_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """
+    7- and 28-day readiness, REST-day and load aggregates with acute:chronic
+    ratios, kept up to date as check-ins are stored. null before the first check-in.
+    """
+    trend = (await db.execute(trends.trend_statement(user_id))).scalars().first()
+    return trends.trends_response(trend) if trend is not None else None
+
+@router.post("/combined-readiness/", response_model=schemas.CombinedReadinessResponse)
+async def get_combined_readiness(
+    data: schemas.CombinedReadinessRequest,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Combined endpoint that calculates readiness and applies environmental constraints.
+    Returns the final decision with full explainability. Leave out the
+    environment fields to apply the user's region snapshot instead.
+    """
+    snapshot = None
+    if not data.has_environment_input():
+        snapshot = (await db.execute(services.user_snapshot_statement(data.user_id))).scalars().first()
+    content, db_readiness, db_env = services.combined_readiness(data, snapshot)
+    response = fast_json.response(fast_json.render(schemas.CombinedReadinessResponse, content))
+    rows = [row for row in (db_readiness, db_env) if row is not None]
+    if write_behind.buffer is not None:
+        for row in rows:
+            await services.abuffer_row(row)
+        return response
+    db.add_all(rows)
+    await db.run_sync(trends.record, [db_readiness])
+    await db.flush()
+    await db.run_sync(precompute.refresh_decision, db_readiness, content["base_decision"], (
+        db_env or snapshot, content["final_decision"], content["environment_severity"]
+    ))
+    await db.commit()
+    await services.ainvalidate(data.user_id)
+    return response
+
+@router.get("/analytics/decisions", response_model=schemas.DecisionAnalyticsResponse)
+async def get_decision_analytics(
+    start: Optional[date] = Query(None, description="First UTC day (default: 30 days before end)"),
+    end: Optional[date] = Query(None, description="Exclusive last UTC day (default: tomorrow)"),
+    region_id: Optional[int] = None,
+    by_region: bool = Query(False, description="One entry per day and region instead of per day"),
+    use_rollup: bool = Query(True, description="Read days covered by the daily rollup from it"),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Daily TRAIN / ACTIVE_RECOVERY / REST counts and readiness percentiles across users."""
+    start, end = services.analytics_range(start, end)
+    return await db.run_sync(analytics.decision_analytics, start, end, region_id, by_region, use_rollup)
+
+@router.get("/analytics/severity", response_model=schemas.SeverityAnalyticsResponse)
+async def get_severity_analytics(
+    start: Optional[date] = Query(None, description="First UTC day (default: 30 days before end)"),
+    end: Optional[date] = Query(None, description="Exclusive last UTC day (default: tomorrow)"),
+    region_id: Optional[int] = None,
+    by_region: bool = Query(False, description="One entry per day and region instead of per day"),
+    use_rollup: bool = Query(True, description="Read days covered by the daily rollup from it"),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Daily counts of per-user environment rows by severity."""
+    start, end = services.analytics_range(start, end)
+    return await db.run_sync(analytics.severity_analytics, start, end, region_id, by_region, use_rollup)
+
+@router.get("/export/readiness")
+async def export_readiness(
+    format: schemas.ExportFormat = schemas.ExportFormat.NDJSON,
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, description="Inclusive lower bound on date"),
+    end: Optional[datetime] = Query(None, description="Exclusive upper bound on date")
+):
+    """
+    Stream readiness history as NDJSON or CSV, in id order.
+    Rows are read through a server-side cursor, so any size of export uses constant memory.
+    """
+    stream = export.astream_readiness(format.value, user_id=user_id, start=start, end=end)
+    return services.export_response(stream, format, "readiness")
+
+@router.get("/export/environment")
+async def export_environment(
+    format: schemas.ExportFormat = schemas.ExportFormat.NDJSON,
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, description="Inclusive lower bound on date"),
+    end: Optional[datetime] = Query(None, description="Exclusive upper bound on date")
+):
+    """
+    Stream environment policy history as NDJSON or CSV, in id order.
+    """
+    stream = export.astream_environment(format.value, user_id=user_id, start=start, end=end)
+    return services.export_response(stream, format, "environment")
@@ -0,0 +1,424 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of a cached payload changes so old entries are never read
+CACHE_SCHEMA_VERSION = "v2"
+
+ENVIRONMENT_IMPACT = "environment_impact"
+READINESS_PAGE = "readiness_page"
+DAILY_DECISION = "daily_decision"
+
+CACHE_TTLS = {
+    ENVIRONMENT_IMPACT: int(os.getenv("CACHE_ENVIRONMENT_IMPACT_TTL", 300)),
+    READINESS_PAGE: int(os.getenv("CACHE_READINESS_PAGE_TTL", 300)),
+    DAILY_DECISION: int(os.getenv("CACHE_DAILY_DECISION_TTL", 900)),
+}
+
+# Redis calls happen inside request handlers, so keep them on a short leash
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.05))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.2))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("CACHE_BREAKER_FAILURES", 3))
+BREAKER_RESET_SECONDS = float(os.getenv("CACHE_BREAKER_RESET_SECONDS", 10))
+RECONNECT_INTERVAL_SECONDS = float(os.getenv("CACHE_RECONNECT_INTERVAL_SECONDS", 5))
+WRITE_QUEUE_SIZE = int(os.getenv("CACHE_WRITE_QUEUE_SIZE", 10000))
+WRITE_BATCH_SIZE = 100
+# Generation counters must outlive every value written under them
+GENERATION_TTL = 7 * 24 * 3600
+
+class InMemoryRedis:
+    """
+    In-process stand-in for the Redis commands the cache uses.
+    Select it with REDIS_HOST=memory (tests, benchmarks, local runs).
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def ping(self):
+        return True
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def mget(self, *keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value, ex=ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(k, None) is not None for k in keys)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, ("0", None))
+            value = str(int(value) + 1)
+            self._data[key] = (value, expires_at)
+            return int(value)
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if key not in self._data:
+                return False
+            self._data[key] = (self._data[key][0], time.monotonic() + seconds)
+            return True
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+        return True
+
+    def pipeline(self, transaction=True):
+        return _InMemoryPipeline(self)
+
+class _InMemoryPipeline:
+    def __init__(self, target: InMemoryRedis):
+        self._target = target
+        self._commands = []
+
+    def __getattr__(self, name):
+        def queue_command(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue_command
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return [getattr(self._target, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+def create_redis():
+    """Connect to Redis (or the in-process stand-in). Raises if unreachable."""
+    host = os.getenv("REDIS_HOST", "localhost")
+    if host == "memory":
+        return InMemoryRedis()
+    client = redis.Redis(
+        host=host,
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        db=0,
+        decode_responses=True,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        # Fail fast; the circuit breaker and reconnect loop handle recovery
+        retry=Retry(NoBackoff(), 0)
+    )
+    client.ping()
+    return client
+
+class CircuitBreaker:
+    """
+    closed: calls go through. After `failure_threshold` consecutive failures
+    it opens and calls are skipped; after `reset_seconds` one probe call is
+    let through (half_open) and its outcome closes or re-opens the breaker.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                return True  # this caller is the probe
+            return False
+
+    def record_success(self):
+        if self.state != self.CLOSED or self.consecutive_failures:
+            with self._lock:
+                self.state = self.CLOSED
+                self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened
+        }
+
+class CacheClient:
+    """
+    Owns the Redis connection for the process.
+    Reads go through the circuit breaker and fail fast as misses. setex
+    writes are queued and sent in pipelined batches by a background thread,
+    which also reconnects when Redis was unavailable, so Redis trouble never
+    blocks a request. Invalidations are sent synchronously (bounded by the
+    socket timeout); ones that can't be sent are kept and replayed by the
+    writer thread before anything else once Redis is reachable.
+    """
+
+    def __init__(self, factory=create_redis):
+        self._factory = factory
+        self._redis = None
+        self.breaker = CircuitBreaker()
+        self._writes: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._last_connect_attempt = 0.0
+        self.last_error: Optional[str] = None
+        self.writes_sent = 0
+        self.writes_dropped = 0
+        self.invalidations_replayed = 0
+        self._pending_invalidations: set = set()
+        self._pending_lock = threading.Lock()
+        self._connect()
+
+    def _connect(self) -> bool:
+        self._last_connect_attempt = time.monotonic()
+        try:
+            self._redis = self._factory()
+            self.breaker.record_success()
+            return True
+        except Exception as e:
+            self._redis = None
+            self.last_error = repr(e)
+            return False
+
+    def use(self, redis_client):
+        """Swap the backing client (e.g. InMemoryRedis() in tests)."""
+        self._redis = redis_client
+        self.breaker = CircuitBreaker()
+
+    @property
+    def available(self) -> bool:
+        return self._redis is not None
+
+    def get(self, key: str) -> Optional[str]:
+        values = self.mget(key)
+        return values[0] if values is not None else None
+
+    def mget(self, *keys: str) -> Optional[list]:
+        """Values of keys (None for missing ones), or None while Redis is unavailable."""
+        client = self._redis
+        if client is None:
+            self._ensure_worker()  # the writer thread owns reconnecting
+            return None
+        if not self.breaker.allow():
+            return None
+        try:
+            with metrics.stage("cache.get"):
+                values = client.mget(*keys)
+        except Exception as e:
+            self._fail(e)
+            return None
+        self.breaker.record_success()
+        return values
+
+    def setex(self, key: str, ttl: int, value: str):
+        self._enqueue(("setex", (key, ttl, value)))
+
+    def invalidate(self, *keys: str):
+        """
+        Bump the generation of each key and delete it, synchronously. If Redis
+        can't be reached the keys are kept and replayed by the writer thread.
+        """
+        if not self._invalidate(keys):
+            with self._pending_lock:
+                self._pending_invalidations.update(keys)
+            self._ensure_worker()
+
+    def _invalidate(self, keys) -> bool:
+        client = self._redis
+        if client is None or not self.breaker.allow():
+            return False
+        try:
+            with metrics.stage("cache.invalidate"):
+                pipe = client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.incr(generation_key(key))
+                    pipe.expire(generation_key(key), GENERATION_TTL)
+                    pipe.delete(key)
+                pipe.execute()
+        except Exception as e:
+            self._fail(e)
+            return False
+        self.breaker.record_success()
+        return True
+
+    def _replay_invalidations(self):
+        with self._pending_lock:
+            keys, self._pending_invalidations = self._pending_invalidations, set()
+        if not keys:
+            return
+        if self._invalidate(list(keys)):
+            self.invalidations_replayed += len(keys)
+            logger.info("Replayed %d cache invalidations", len(keys))
+        else:
+            with self._pending_lock:
+                self._pending_invalidations.update(keys)
+
+    def _fail(self, error: Exception):
+        self.last_error = repr(error)
+        self.breaker.record_failure()
+
+    def _enqueue(self, command):
+        with metrics.stage("cache.enqueue"):
+            self._ensure_worker()
+            try:
+                self._writes.put_nowait(command)
+            except queue.Full:
+                self.writes_dropped += 1
+
+    def _ensure_worker(self):
+        # Started lazily so importing the module (e.g. in CLI jobs or forked workers) starts no threads
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name="cache-writer", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stopping.is_set() or not self._writes.empty():
+            try:
+                batch = [self._writes.get(timeout=1.0)]
+            except queue.Empty:
+                self._maybe_reconnect()
+                self._replay_invalidations()
+                continue
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, batch):
+        self._maybe_reconnect()
+        # Before any setex, so no write lands ahead of an invalidation it predates
+        self._replay_invalidations()
+        client = self._redis
+        if client is None or not self.breaker.allow():
+            self.writes_dropped += len(batch)
+            return
+        try:
+            with metrics.stage("cache.send"):
+                pipe = client.pipeline(transaction=False)
+                for name, args in batch:
+                    getattr(pipe, name)(*args)
+                pipe.execute()
+        except Exception as e:
+            self._fail(e)
+            self.writes_dropped += len(batch)
+            return
+        self.breaker.record_success()
+        self.writes_sent += len(batch)
+
+    def _maybe_reconnect(self):
+        if self._redis is None and time.monotonic() - self._last_connect_attempt >= RECONNECT_INTERVAL_SECONDS:
+            if self._connect():
+                logger.info("Redis cache reconnected")
+
+    def close(self, timeout: float = 2.0):
+        """Flush queued writes and stop the writer thread."""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.available,
+            "breaker": self.breaker.snapshot(),
+            "queued_writes": self._writes.qsize(),
+            "writes_sent": self.writes_sent,
+            "writes_dropped": self.writes_dropped,
+            "pending_invalidations": len(self._pending_invalidations),
+            "invalidations_replayed": self.invalidations_replayed,
+            "last_error": self.last_error
+        }
+
+client = CacheClient()
+
+def use_client(redis_client):
+    """Swap the backing Redis client (e.g. InMemoryRedis() in tests)."""
+    client.use(redis_client)
+
+def cache_key(kind: str, user_id: int) -> str:
+    return f"cache:{CACHE_SCHEMA_VERSION}:{kind}:{user_id}"
+
+def generation_key(key: str) -> str:
+    return f"{key}:generation"
+
+def read(kind: str, user_id: int) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (cached value or None on a miss, the key's current generation). Pass the
+    generation to write() for a value computed after this read: values are
+    stored with it, and one invalidated meanwhile reads as a miss. Both are
+    None while Redis is unavailable.
+    """
+    key = cache_key(kind, user_id)
+    values = client.mget(key, generation_key(key))
+    if values is None:
+        return None, None
+    stored, generation = values
+    generation = generation or "0"
+    if stored is None:
+        return None, generation
+    stored_generation, _, value = stored.partition(":")
+    return (value if stored_generation == generation else None), generation
+
+def write(kind: str, user_id: int, payload, generation: Optional[str]) -> None:
+    """Cache payload under the generation read() returned before it was computed (skipped for None)."""
+    if generation is None:
+        return
+    if isinstance(payload, bytes):
+        payload = payload.decode()
+    client.setex(cache_key(kind, user_id), CACHE_TTLS[kind], f"{generation}:{payload}")
+
+def invalidate(user_id: int, *kinds: str) -> None:
+    """Drop cached reads for a user after a write (all kinds by default)."""
+    client.invalidate(*[cache_key(kind, user_id) for kind in (kinds or CACHE_TTLS)])
+
+def invalidate_many(user_ids, *kinds: str, chunk_size: int = 500) -> None:
+    """invalidate() for many users, in a few pipelined round-trips instead of one per user."""
+    keys = [cache_key(kind, user_id) for user_id in user_ids for kind in (kinds or CACHE_TTLS)]
+    for i in range(0, len(keys), chunk_size):
+        client.invalidate(*keys[i:i + chunk_size])
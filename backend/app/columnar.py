@@ -0,0 +1,290 @@
+"""
+Columnar snapshot of readiness history for offline analytics.
+
+DailyReadiness inputs and outputs are exported into fixed-width NumPy
+columns, one .npy file per column per segment, which the loader memory-maps
+instead of materialising rows:
+
+    COLUMNAR_DIR/
+        manifest.json                     segments in id order, last exported id
+        2026-10-18-000001/id.npy          one directory per export run (split
+        2026-10-18-000001/sleep_hours.npy at COLUMNAR_SEGMENT_ROWS rows)
+        ...
+
+Each export appends the rows stored since the previous one (by id), so a
+daily cron run adds a daily segment. Ids are assigned at insert but become
+visible at commit, so a lower id can appear after a higher one was
+exported; an export therefore stops before the first row dated within
+COLUMNAR_SAFETY_LAG_SECONDS of now, which must exceed the longest
+transaction that inserts check-ins. Segments are never rewritten: after a
+re-score (python -m app.rescore) or restoring archived months, rebuild.
+Segment directories a crashed export left behind (not in the manifest) are
+removed by the next export.
+
+    python -m app.columnar export [--rebuild]
+    python -m app.columnar evaluate          # re-score everything with engine.calculate_readiness_batch
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import BigInteger, case, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from . import database, models, engine
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR", "columnar")
+COLUMNAR_SEGMENT_ROWS = int(os.getenv("COLUMNAR_SEGMENT_ROWS", 1_000_000))
+COLUMNAR_SAFETY_LAG_SECONDS = float(os.getenv("COLUMNAR_SAFETY_LAG_SECONDS", 600))
+COLUMNAR_FETCH_SIZE = 20000
+
+MANIFEST = "manifest.json"
+
+# Column -> stored dtype. Scores are trunc'd ints and inputs small ranges; sleep
+# stays float64 so re-scoring sees exactly the value the engine saw.
+COLUMNS = {
+    "id": np.int64,
+    "user_id": np.int32,
+    "date": "datetime64[s]",  # UTC
+    "sleep_hours": np.float64,
+    "stress_level": np.int8,
+    "fatigue_level": np.int8,
+    "muscle_soreness": np.int8,
+    "available_time": np.int32,
+    "readiness_score": np.int16,
+    "decision": np.int8,  # index into engine.DECISIONS, -1 if unknown
+}
+
+INPUT_COLUMNS = ("sleep_hours", "stress_level", "fatigue_level", "muscle_soreness", "available_time")
+
+_DECISION_CODES = {decision: code for code, decision in enumerate(engine.DECISIONS)}
+
+# ============================================================
+# EXPORT
+# ============================================================
+
+def read_manifest(directory: str = COLUMNAR_DIR) -> dict:
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_id": 0, "segments": []}
+
+def _write_manifest(directory: str, manifest: dict):
+    # Write-then-rename: readers see the old or the new segment list, never half of one
+    path = os.path.join(directory, MANIFEST)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+class epoch_seconds(FunctionElement):
+    """Unix time of a timestamp column, computed by the database."""
+    type = BigInteger()
+    inherit_cache = True
+
+@compiles(epoch_seconds)
+def _epoch_seconds(element, compiler, **kw):
+    # SQLite stores timestamps as UTC text
+    return f"CAST(strftime('%s', {compiler.process(element.clauses, **kw)}) AS INTEGER)"
+
+@compiles(epoch_seconds, "postgresql")
+def _epoch_seconds_postgresql(element, compiler, **kw):
+    return f"CAST(extract(epoch FROM {compiler.process(element.clauses, **kw)}) AS BIGINT)"
+
+def horizon_statement(after_id: int, cutoff: datetime):
+    """Id of the first row after after_id dated at or after cutoff; export stops before it."""
+    table = models.DailyReadiness
+    return select(func.min(table.id)).where(table.id > after_id, table.date >= cutoff)
+
+def export_statement(after_id: int, before_id: Optional[int] = None):
+    """Every column as a number (dates as epoch seconds, decisions as codes), so chunks convert in one step."""
+    table = models.DailyReadiness
+    expressions = {
+        **{name: getattr(table, name) for name in COLUMNS},
+        "date": epoch_seconds(table.date),
+        "decision": case(_DECISION_CODES, value=table.decision, else_=-1),
+    }
+    stmt = select(*(expressions[name] for name in COLUMNS)).where(table.id > after_id)
+    if before_id is not None:
+        stmt = stmt.where(table.id < before_id)
+    return stmt.order_by(table.id).execution_options(stream_results=True, yield_per=COLUMNAR_FETCH_SIZE)
+
+def _chunk_arrays(rows) -> Dict[str, np.ndarray]:
+    # Plain tuples: NumPy probing Row objects for array attributes is slow.
+    # NULLs (legacy rows) become NaN here, then 0 in integer columns.
+    data = np.array([tuple(row) for row in rows], dtype=np.float64)
+    arrays = {}
+    for index, (name, dtype) in enumerate(COLUMNS.items()):
+        column = data[:, index]
+        if name == "date":
+            arrays[name] = np.nan_to_num(column).astype(np.int64).view("datetime64[s]")
+        elif dtype is np.float64:
+            arrays[name] = column
+        else:
+            arrays[name] = np.nan_to_num(column).astype(dtype)
+    return arrays
+
+def _write_segment(directory: str, name: str, chunks: List[Dict[str, np.ndarray]]) -> dict:
+    path = os.path.join(directory, name)
+    tmp = f"{path}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    for column in COLUMNS:
+        np.save(os.path.join(tmp, f"{column}.npy"), np.concatenate([chunk[column] for chunk in chunks]))
+    os.replace(tmp, path)
+    ids = [chunk["id"] for chunk in chunks]
+    return {
+        "name": name,
+        "rows": int(sum(len(i) for i in ids)),
+        "first_id": int(ids[0][0]),
+        "last_id": int(ids[-1][-1]),
+    }
+
+def _remove_stale_segments(directory: str, manifest: dict) -> int:
+    """Delete segment directories not in the manifest (left by an export that crashed before updating it)."""
+    listed = {segment["name"] for segment in manifest["segments"]}
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path) and name not in listed:
+            shutil.rmtree(path)
+            removed += 1
+    if removed:
+        logger.info("Removed %d segment directories left by an interrupted export", removed)
+    return removed
+
+def export(directory: str = COLUMNAR_DIR, rebuild: bool = False,
+           segment_rows: int = COLUMNAR_SEGMENT_ROWS,
+           safety_lag_seconds: float = COLUMNAR_SAFETY_LAG_SECONDS) -> dict:
+    """Append rows stored since the last export, up to the safety lag, as new segment(s); returns a summary."""
+    if rebuild and os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    _remove_stale_segments(directory, manifest)
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    day = now.date().isoformat()
+    added = []
+    # Core rows, no ORM loading
+    with database.engine.connect() as conn:
+        horizon = conn.execute(
+            horizon_statement(manifest["last_id"], now - timedelta(seconds=safety_lag_seconds))
+        ).scalar()
+        pending, pending_rows = [], 0
+        for rows in conn.execute(export_statement(manifest["last_id"], horizon)).partitions():
+            pending.append(_chunk_arrays(rows))
+            pending_rows += len(rows)
+            if pending_rows >= segment_rows:
+                added.append(_write_segment(directory, f"{day}-{int(pending[0]['id'][0]):09d}", pending))
+                pending, pending_rows = [], 0
+        if pending:
+            added.append(_write_segment(directory, f"{day}-{int(pending[0]['id'][0]):09d}", pending))
+
+    if added:
+        manifest["segments"].extend(added)
+        manifest["last_id"] = added[-1]["last_id"]
+        _write_manifest(directory, manifest)
+    return {
+        "segments_added": len(added),
+        "rows_added": sum(s["rows"] for s in added),
+        "total_rows": sum(s["rows"] for s in manifest["segments"]),
+        "elapsed_s": round(time.perf_counter() - started, 3)
+    }
+
+# ============================================================
+# LOADER
+# ============================================================
+
+class ReadinessHistory:
+    """Memory-mapped view of an exported snapshot."""
+
+    def __init__(self, directory: str = COLUMNAR_DIR):
+        self.directory = directory
+        self.manifest = read_manifest(directory)
+
+    def __len__(self) -> int:
+        return sum(s["rows"] for s in self.manifest["segments"])
+
+    def segments(self, columns=tuple(COLUMNS)) -> Iterator[Dict[str, np.ndarray]]:
+        """Per segment, the requested columns as read-only memory maps (no copy)."""
+        for segment in self.manifest["segments"]:
+            path = os.path.join(self.directory, segment["name"])
+            yield {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in columns}
+
+    def column(self, name: str) -> np.ndarray:
+        """One column over the whole history (concatenated into memory)."""
+        parts = [segment[name] for segment in self.segments((name,))]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=COLUMNS[name])
+
+    def columns(self, names=tuple(COLUMNS)) -> Dict[str, np.ndarray]:
+        return {name: self.column(name) for name in names}
+
+def evaluate(history: ReadinessHistory,
+             scorer: Callable = engine.calculate_readiness_batch,
+             transform: Optional[Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]] = None) -> dict:
+    """
+    Re-score every stored check-in and compare with the stored outcome.
+
+    scorer takes the five input columns and returns (scores, decisions,
+    codes) like engine.calculate_readiness_batch - pass a variant to try
+    other thresholds. transform may rewrite the inputs first (e.g. "what if
+    everyone slept an hour more"). Stored combined check-ins carry the
+    environment-adjusted decision, so some disagreement is expected there.
+    """
+    started = time.perf_counter()
+    n = len(engine.DECISIONS)
+    transitions = np.zeros((n + 1, n), dtype=np.int64)  # stored (last row: unknown) x new
+    score_delta_sum = 0
+    rows = 0
+    for segment in history.segments(INPUT_COLUMNS + ("readiness_score", "decision")):
+        inputs = {name: segment[name] for name in INPUT_COLUMNS}
+        if transform is not None:
+            inputs = transform(inputs)
+        scores, decisions, _ = scorer(*(inputs[name] for name in INPUT_COLUMNS))
+        stored = np.where(segment["decision"] < 0, n, segment["decision"])
+        np.add.at(transitions, (stored, decisions.astype(np.int64)), 1)
+        score_delta_sum += int((scores - segment["readiness_score"]).sum())
+        rows += len(scores)
+
+    changed = rows - int(np.trace(transitions[:n]))
+    labels = list(engine.DECISIONS)
+    return {
+        "rows": rows,
+        "decisions_changed": changed,
+        "changed_fraction": round(changed / rows, 6) if rows else 0.0,
+        "mean_score_delta": round(score_delta_sum / rows, 4) if rows else 0.0,
+        "new_decisions": dict(zip(labels, transitions.sum(axis=0).tolist())),
+        "transitions": {
+            (labels[i] if i < n else "unknown"): dict(zip(labels, transitions[i].tolist()))
+            for i in range(n + 1)
+        },
+        "elapsed_s": round(time.perf_counter() - started, 3)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar readiness snapshot for offline analytics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="append rows stored since the last export")
+    export_parser.add_argument("--rebuild", action="store_true", help="discard existing segments first")
+    export_parser.add_argument("--segment-rows", type=int, default=COLUMNAR_SEGMENT_ROWS)
+    export_parser.add_argument("--safety-lag", type=float, default=COLUMNAR_SAFETY_LAG_SECONDS,
+                               help="seconds; rows dated more recently (and every later id) wait for the next export")
+    commands.add_parser("evaluate", help="re-score the snapshot with the current engine")
+    for command in commands.choices.values():
+        command.add_argument("--dir", default=COLUMNAR_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.command == "export":
+        print(json.dumps(export(args.dir, args.rebuild, args.segment_rows, args.safety_lag)))
+    else:
+        print(json.dumps(evaluate(ReadinessHistory(args.dir)), indent=2))
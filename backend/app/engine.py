@@ -1,4 +1,12 @@
 from typing import Dict, Tuple
+import numpy as np
+
+REASON_SLEEP = "Sleep is critically low (< 5h). High injury risk."
+REASON_FATIGUE_SORENESS = "High fatigue or soreness detected. Prioritize recovery."
+REASON_OVERALL_LOW = "Readiness score ({readiness_score}) is too low for safe exercise."
+REASON_OVERALL_MODERATE = "Moderate readiness. Low-intensity recovery suggested."
+REASON_OVERALL_READY = "Body is well-rested and ready for a standard session."
+REASON_TIME_CONSTRAINT = "Time is limited (<30m). Short recovery session recommended."
 
 def calculate_readiness(
     sleep_hours: float, 
@@ -28,22 +36,109 @@ def calculate_readiness(
     
     if sleep_hours < 5:
         decision = "REST"
-        reasons["sleep"] = "Sleep is critically low (< 5h). High injury risk."
+        reasons["sleep"] = REASON_SLEEP
     
     if fatigue > 8 or soreness > 8:
         decision = "ACTIVE_RECOVERY" if decision != "REST" else "REST"
-        reasons["fatigue_soreness"] = "High fatigue or soreness detected. Prioritize recovery."
+        reasons["fatigue_soreness"] = REASON_FATIGUE_SORENESS
     
     if readiness_score < 40:
         decision = "REST"
-        reasons["overall"] = f"Readiness score ({readiness_score}) is too low for safe exercise."
+        reasons["overall"] = REASON_OVERALL_LOW.format(readiness_score=readiness_score)
     elif readiness_score < 65:
         if decision == "TRAIN":
             decision = "ACTIVE_RECOVERY"
-            reasons["overall"] = "Moderate readiness. Low-intensity recovery suggested."
+            reasons["overall"] = REASON_OVERALL_MODERATE
     else:
         if not reasons:
-            reasons["overall"] = "Body is well-rested and ready for a standard session."
+            reasons["overall"] = REASON_OVERALL_READY
 
     return readiness_score, decision, reasons
 
+
+# Decisions and explanation codes used by the batch scorer.
+# Codes are bit flags so one integer per row records every reason that fired.
+DECISIONS = ("TRAIN", "ACTIVE_RECOVERY", "REST")
+TRAIN, ACTIVE_RECOVERY, REST = 0, 1, 2
+
+EXPLAIN_SLEEP = 1
+EXPLAIN_FATIGUE_SORENESS = 2
+EXPLAIN_OVERALL_LOW = 4
+EXPLAIN_OVERALL_MODERATE = 8
+EXPLAIN_OVERALL_READY = 16
+EXPLAIN_TIME_CONSTRAINT = 32
+
+def calculate_readiness_batch(
+    sleep_hours,
+    stress,
+    fatigue,
+    soreness,
+    available_time
+):
+    """
+    Vectorized version of calculate_readiness plus the time constraint
+    applied by the API. Takes equal-length column arrays.
+    Returns: (scores, decisions, explanation_codes) as NumPy arrays, where
+    decisions index into DECISIONS and codes are EXPLAIN_* bit flags.
+    """
+    sleep_hours = np.asarray(sleep_hours, dtype=np.float64)
+    stress = np.asarray(stress, dtype=np.int64)
+    fatigue = np.asarray(fatigue, dtype=np.int64)
+    soreness = np.asarray(soreness, dtype=np.int64)
+    available_time = np.asarray(available_time, dtype=np.int64)
+
+    # 1. Base Score calculation (same operation order as the scalar engine)
+    sleep_score = np.minimum(np.maximum((sleep_hours - 5) / 3 * 40, 0), 40)
+    scores = np.trunc(
+        sleep_score + (10 - stress) * 2 + (10 - fatigue) * 2 + (10 - soreness) * 2
+    ).astype(np.int64)
+
+    # 2. Decision Logic & Risk Rules
+    decisions = np.full(scores.shape, TRAIN, dtype=np.int8)
+    codes = np.zeros(scores.shape, dtype=np.int8)
+
+    low_sleep = sleep_hours < 5
+    decisions[low_sleep] = REST
+    codes[low_sleep] |= EXPLAIN_SLEEP
+
+    high_fatigue = (fatigue > 8) | (soreness > 8)
+    decisions[high_fatigue & (decisions != REST)] = ACTIVE_RECOVERY
+    codes[high_fatigue] |= EXPLAIN_FATIGUE_SORENESS
+
+    low_score = scores < 40
+    decisions[low_score] = REST
+    codes[low_score] |= EXPLAIN_OVERALL_LOW
+
+    moderate = ~low_score & (scores < 65) & (decisions == TRAIN)
+    decisions[moderate] = ACTIVE_RECOVERY
+    codes[moderate] |= EXPLAIN_OVERALL_MODERATE
+
+    ready = (scores >= 65) & (codes == 0)
+    codes[ready] |= EXPLAIN_OVERALL_READY
+
+    # 3. Simple Constraint Optimization
+    short_session = (decisions == TRAIN) & (available_time < 30)
+    decisions[short_session] = ACTIVE_RECOVERY
+    codes[short_session] |= EXPLAIN_TIME_CONSTRAINT
+
+    return scores, decisions, codes
+
+def explain_codes(code: int, readiness_score: int) -> Dict[str, str]:
+    """
+    Expands batch explanation codes into the explanation dict produced by
+    calculate_readiness (and the API's time constraint).
+    """
+    reasons = {}
+    if code & EXPLAIN_SLEEP:
+        reasons["sleep"] = REASON_SLEEP
+    if code & EXPLAIN_FATIGUE_SORENESS:
+        reasons["fatigue_soreness"] = REASON_FATIGUE_SORENESS
+    if code & EXPLAIN_OVERALL_LOW:
+        reasons["overall"] = REASON_OVERALL_LOW.format(readiness_score=readiness_score)
+    elif code & EXPLAIN_OVERALL_MODERATE:
+        reasons["overall"] = REASON_OVERALL_MODERATE
+    elif code & EXPLAIN_OVERALL_READY:
+        reasons["overall"] = REASON_OVERALL_READY
+    if code & EXPLAIN_TIME_CONSTRAINT:
+        reasons["time_constraint"] = REASON_TIME_CONSTRAINT
+    return reasons
@@ -1,46 +1,310 @@
-from typing import Dict, List, Tuple
-from dataclasses import dataclass
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+# Rules live in a JSON file (see environment_rules.json) compiled at load time;
+# workers pick up edits within ENVIRONMENT_RULES_CHECK_INTERVAL seconds.
+RULES_PATH = os.getenv(
+    "ENVIRONMENT_RULES_PATH", os.path.join(os.path.dirname(__file__), "environment_rules.json")
+)
+RULES_CHECK_INTERVAL = float(os.getenv("ENVIRONMENT_RULES_CHECK_INTERVAL", 5))
+
+@dataclass(frozen=True)
 class EnvironmentAdjustment:
     rule_id: str
     trigger: str
     action: str
     reason: str
 
-@dataclass
+@dataclass(frozen=True)
 class WorkoutConstraints:
+    """Immutable: rule outcomes are precomputed and shared between calls."""
     allow_outdoor: bool = True
     max_intensity_percent: int = 100
     max_duration_minutes: int = 120
     recommended_location: str = "any"
-    blocked_workout_types: List[str] = None
-    suggested_workout_types: List[str] = None
-
-    def __post_init__(self):
-        if self.blocked_workout_types is None:
-            self.blocked_workout_types = []
-        if self.suggested_workout_types is None:
-            self.suggested_workout_types = []
-
-AQI_THRESHOLDS = {
-    "good": (0, 50),
-    "moderate": (51, 100),
-    "unhealthy_sensitive": (101, 150),
-    "unhealthy": (151, 200),
-    "very_unhealthy": (201, 300),
-    "hazardous": (301, 500)
-}
+    blocked_workout_types: Tuple[str, ...] = ()
+    suggested_workout_types: Tuple[str, ...] = ()
 
-TEMP_THRESHOLDS = {
-    "cold_extreme": (-50, 0),
-    "cold": (0, 10),
-    "cool": (10, 18),
-    "comfortable": (18, 28),
-    "warm": (28, 35),
-    "hot": (35, 38),
-    "extreme_hot": (38, 60)
+@dataclass(frozen=True)
+class ImpactTemplate:
+    """
+    Rule outcome for one band key, shared between calls.
+    Adjustment trigger/reason strings are str.format templates over aqi and temperature_celsius.
+    """
+    constraints: WorkoutConstraints
+    adjustments: Tuple[EnvironmentAdjustment, ...]
+    severity: str
+
+# Inputs rules can match on: banded numbers, then values matched exactly
+BANDED_INPUTS = ("aqi", "temperature_celsius")
+INPUT_DOMAINS = {
+    "is_heatwave": (False, True),
+    "lockdown_status": ("none", "partial", "full"),
+    "has_local_event": (False, True),
 }
+TEMPLATE_FIELDS = ("aqi", "temperature_celsius")
+
+class RuleError(ValueError):
+    """A rules file that can't be compiled."""
+
+def _compile_bands(name: str, entries: list) -> Tuple[tuple, Tuple[str, ...]]:
+    """Ordered (op, threshold, band) checks, first match wins; the last entry is the default."""
+    checks = []
+    for entry in entries[:-1]:
+        if "above" in entry:
+            checks.append((">", entry["above"], entry["band"]))
+        elif "below" in entry:
+            checks.append(("<", entry["below"], entry["band"]))
+        else:
+            raise RuleError(f"{name} band {entry['band']!r} needs 'above' or 'below' (only the last band is the default)")
+    default = entries[-1]
+    if "above" in default or "below" in default:
+        raise RuleError(f"the last {name} band must be the default (no 'above'/'below')")
+    return tuple(checks) + (("*", None, default["band"]),), tuple(e["band"] for e in entries)
+
+def _classify(checks: tuple, value) -> str:
+    for op, threshold, band in checks:
+        if op == ">":
+            if value > threshold:
+                return band
+        elif op == "<":
+            if value < threshold:
+                return band
+        else:
+            return band
+
+@dataclass
+class RuleSet:
+    """A rules file compiled into band classifiers and a flat table of outcomes per band key."""
+    version: int
+    path: str
+    mtime: float
+    adjustments: Dict[str, EnvironmentAdjustment]
+    formatted_rules: frozenset
+    bands: Dict[str, tuple]
+    table: Dict[tuple, ImpactTemplate] = field(repr=False)
+
+    def band_key(self, aqi, temperature_celsius, is_heatwave, lockdown_status, has_local_event) -> tuple:
+        """The only inputs the rule outcome depends on; raw values just fill in text."""
+        return (
+            _classify(self.bands["aqi"], aqi),
+            _classify(self.bands["temperature_celsius"], temperature_celsius),
+            bool(is_heatwave),
+            "full" if lockdown_status == "full" else "partial" if lockdown_status == "partial" else "none",
+            bool(has_local_event)
+        )
+
+    def evaluate(self, aqi, temperature_celsius, is_heatwave, lockdown_status, has_local_event):
+        global _lookups, _formatted_lookups
+        template = self.table[self.band_key(aqi, temperature_celsius, is_heatwave, lockdown_status, has_local_event)]
+        _lookups += 1
+        if not self.formatted_rules.isdisjoint(a.rule_id for a in template.adjustments):
+            _formatted_lookups += 1
+        adjustments = [
+            EnvironmentAdjustment(
+                rule_id=a.rule_id,
+                trigger=a.trigger.format(aqi=aqi, temperature_celsius=temperature_celsius),
+                action=a.action,
+                reason=a.reason.format(aqi=aqi, temperature_celsius=temperature_celsius)
+            ) if a.rule_id in self.formatted_rules else a
+            for a in template.adjustments
+        ]
+        return template.constraints, adjustments, template.severity
+
+def compile_rules(doc: dict, path: str = "<memory>", mtime: float = 0.0) -> RuleSet:
+    """
+    Compile a rules document. Every combination of bands and input values is
+    evaluated once here, so evaluating an input is a band lookup plus a dict hit.
+    """
+    try:
+        bands = {}
+        band_names = {}
+        for name in BANDED_INPUTS:
+            bands[name], band_names[name] = _compile_bands(name, doc["bands"][name])
+        domains = {**band_names, **INPUT_DOMAINS}
+
+        rules = [r for r in doc["rules"] if r.get("enabled", True)]
+        for rule in rules:
+            for name, value in rule["when"].items():
+                if name not in domains or value not in domains[name]:
+                    raise RuleError(f"rule {rule['id']}: unknown condition {name}={value!r}")
+
+        adjustments = {
+            rule["id"]: EnvironmentAdjustment(
+                rule_id=rule["id"], trigger=rule["trigger"], action=rule["action"], reason=rule["reason"]
+            )
+            for rule in doc["rules"]
+        }
+        formatted_rules = frozenset(
+            rule_id for rule_id, a in adjustments.items()
+            if any("{%s}" % name in text for name in TEMPLATE_FIELDS for text in (a.trigger, a.reason))
+        )
+        severity_levels = doc["severity"]
+
+        names = ("aqi", "temperature_celsius", "is_heatwave", "lockdown_status", "has_local_event")
+        table = {}
+        for key in itertools.product(*(domains[name] for name in names)):
+            inputs = dict(zip(names, key))
+            matched = [r for r in rules if all(inputs[n] == v for n, v in r["when"].items())]
+            table[key] = _merge(matched, adjustments, severity_levels)
+    except (KeyError, TypeError) as e:
+        raise RuleError(f"malformed rules: {e!r}")
+
+    return RuleSet(
+        version=doc["version"],
+        path=path,
+        mtime=mtime,
+        adjustments=adjustments,
+        formatted_rules=formatted_rules,
+        bands=bands,
+        table=table
+    )
+
+def _merge(rules: list, adjustments: Dict[str, EnvironmentAdjustment], severity_levels: list) -> ImpactTemplate:
+    """Combine the rules matching one band key, in file order."""
+    allow_outdoor = True
+    max_intensity_percent = 100
+    max_duration_minutes = 120
+    recommended_location = "any"
+    blocked, suggested = [], []
+    for rule in rules:
+        effect = rule.get("constraints", {})
+        if "allow_outdoor" in effect:
+            allow_outdoor = allow_outdoor and effect["allow_outdoor"]
+        if "max_intensity_percent" in effect:
+            max_intensity_percent = min(max_intensity_percent, effect["max_intensity_percent"])
+        if "max_duration_minutes" in effect:
+            max_duration_minutes = min(max_duration_minutes, effect["max_duration_minutes"])
+        if "recommended_location" in effect:
+            recommended_location = effect["recommended_location"]
+        blocked.extend(rule.get("block", []))
+        suggested.extend(rule.get("suggest", []))
+
+    # Overall severity from the highest rule score
+    severity = severity_levels[-1]["level"]
+    if rules:
+        max_severity = max(rule["severity"] for rule in rules)
+        for level in severity_levels[:-1]:
+            if max_severity >= level["min_score"]:
+                severity = level["level"]
+                break
+
+    # Deduplicate workout types, then remove blocked types from suggested
+    blocked = tuple(set(blocked))
+    suggested = tuple(w for w in set(suggested) if w not in blocked)
+    constraints = WorkoutConstraints(
+        allow_outdoor=allow_outdoor,
+        max_intensity_percent=max_intensity_percent,
+        max_duration_minutes=max_duration_minutes,
+        recommended_location=recommended_location,
+        blocked_workout_types=blocked,
+        suggested_workout_types=suggested
+    )
+
+    return ImpactTemplate(constraints, tuple(adjustments[rule["id"]] for rule in rules), severity)
+
+def load_rules(path: str = RULES_PATH) -> RuleSet:
+    mtime = os.stat(path).st_mtime
+    with open(path, encoding="utf-8") as f:
+        try:
+            doc = json.load(f)
+        except ValueError as e:
+            raise RuleError(f"{path}: {e}")
+    return compile_rules(doc, path=path, mtime=mtime)
+
+# ============================================================
+# CURRENT RULE SET (hot reload)
+# ============================================================
+
+_rules = load_rules()
+_rules_lock = threading.Lock()
+_checked_at = time.monotonic()
+_failed_mtime: Optional[float] = None
+_reloads = 0
+# Evaluations served from the compiled table, and those that also formatted
+# AQI/temperature into adjustment text. Unlocked: approximate under contention
+_lookups = 0
+_formatted_lookups = 0
+
+def current_rules() -> RuleSet:
+    """The active rule set, reloaded first if the file changed (checked every RULES_CHECK_INTERVAL)."""
+    if time.monotonic() - _checked_at >= RULES_CHECK_INTERVAL:
+        reload_rules()
+    return _rules
+
+def reload_rules(force: bool = False) -> bool:
+    """
+    Recompile the rules file if its mtime changed. A file that fails to
+    compile is logged and skipped until it changes again; the previous rules
+    stay active. Returns True if new rules were installed.
+    """
+    global _rules, _checked_at, _failed_mtime, _reloads
+    with _rules_lock:
+        _checked_at = time.monotonic()
+        try:
+            mtime = os.stat(_rules.path).st_mtime
+        except OSError:
+            logger.warning("Environment rules file %s is missing; keeping loaded rules", _rules.path)
+            return False
+        if not force and (mtime == _rules.mtime or mtime == _failed_mtime):
+            return False
+        try:
+            rules = load_rules(_rules.path)
+        except (OSError, RuleError) as e:
+            _failed_mtime = mtime
+            logger.error("Not reloading environment rules: %s", e)
+            return False
+        _rules = rules
+        _failed_mtime = None
+        _reloads += 1
+        logger.info("Loaded environment rules version %s from %s", rules.version, rules.path)
+        return True
+
+def rules_version() -> int:
+    """Version of the active rules; stored rows computed with another version are recomputed on read."""
+    return current_rules().version
+
+def rules_info() -> dict:
+    """
+    The active rules and how evaluations were served. Every input maps onto
+    a compiled band key, so there are no misses: formatted_lookups counts the
+    evaluations that did more than the table lookup.
+    """
+    rules = _rules
+    return {
+        "version": rules.version,
+        "path": rules.path,
+        "rules": len(rules.adjustments),
+        "band_keys": len(rules.table),
+        "reloads": _reloads,
+        "last_reload_failed": _failed_mtime is not None,
+        "lookups": _lookups,
+        "formatted_lookups": _formatted_lookups
+    }
+
+def aqi_band(aqi: int) -> str:
+    return _classify(current_rules().bands["aqi"], aqi)
+
+def temperature_band(temperature_celsius: float) -> str:
+    return _classify(current_rules().bands["temperature_celsius"], temperature_celsius)
+
+def environment_band_key(
+    aqi: int,
+    temperature_celsius: float,
+    is_heatwave: bool,
+    lockdown_status: str,
+    has_local_event: bool
+) -> Tuple[str, str, bool, str, bool]:
+    """The only inputs the rule outcome depends on; raw values just fill in text."""
+    return current_rules().band_key(aqi, temperature_celsius, is_heatwave, lockdown_status, has_local_event)
 
 def calculate_environment_impact(
     aqi: int,
@@ -49,172 +313,11 @@ def calculate_environment_impact(
     lockdown_status: str,
     has_local_event: bool
 ) -> Tuple[WorkoutConstraints, List[EnvironmentAdjustment], str]:
-    constraints = WorkoutConstraints()
-    adjustments: List[EnvironmentAdjustment] = []
-    severity_scores = []
-
-    # === RULE 1: AQI Rules ===
-    if aqi > 300:
-        constraints.allow_outdoor = False
-        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 50)
-        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 30)
-        constraints.recommended_location = "indoor"
-        constraints.blocked_workout_types.extend(["outdoor_running", "cycling", "hiking", "outdoor_sports"])
-        constraints.suggested_workout_types.extend(["indoor_yoga", "light_stretching", "indoor_strength"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="AQI_HAZARDOUS",
-            trigger=f"AQI is hazardous ({aqi})",
-            action="Block all outdoor workouts, reduce intensity to 50%, limit duration to 30min",
-            reason=f"Air quality is hazardous (AQI {aqi}). Outdoor exercise poses severe health risks including respiratory damage."
-        ))
-        severity_scores.append(4)
-    elif aqi > 200:
-        constraints.allow_outdoor = False
-        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 60)
-        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 45)
-        constraints.recommended_location = "indoor"
-        constraints.blocked_workout_types.extend(["outdoor_running", "cycling", "hiking"])
-        constraints.suggested_workout_types.extend(["indoor_cardio", "swimming_indoor", "yoga"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="AQI_VERY_UNHEALTHY",
-            trigger=f"AQI is very unhealthy ({aqi})",
-            action="Block outdoor workouts, reduce intensity to 60%, limit duration to 45min",
-            reason=f"Air quality is very unhealthy (AQI {aqi}). Avoid all outdoor activities to prevent respiratory issues."
-        ))
-        severity_scores.append(3)
-    elif aqi > 150:
-        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 70)
-        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 60)
-        constraints.recommended_location = "indoor"
-        constraints.blocked_workout_types.extend(["high_intensity_outdoor", "long_distance_running"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="AQI_UNHEALTHY",
-            trigger=f"AQI is unhealthy ({aqi})",
-            action="Reduce intensity to 70%, limit duration to 60min, prefer indoor",
-            reason=f"Air quality is unhealthy (AQI {aqi}). Outdoor high-intensity exercise may cause respiratory discomfort."
-        ))
-        severity_scores.append(2)
-    elif aqi > 100:
-        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 85)
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="AQI_MODERATE_SENSITIVE",
-            trigger=f"AQI is unhealthy for sensitive groups ({aqi})",
-            action="Reduce intensity to 85%",
-            reason=f"Air quality is unhealthy for sensitive groups (AQI {aqi}). Consider reducing outdoor workout intensity."
-        ))
-        severity_scores.append(1)
-
-    # === RULE 2: Temperature Rules ===
-    if temperature_celsius > 38:
-        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 50)
-        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 30)
-        constraints.recommended_location = "indoor"
-        constraints.blocked_workout_types.extend(["outdoor_running", "outdoor_hiit", "outdoor_sports"])
-        constraints.suggested_workout_types.extend(["swimming", "indoor_strength", "air_conditioned_gym"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="TEMP_EXTREME_HOT",
-            trigger=f"Temperature is extreme ({temperature_celsius}°C)",
-            action="Reduce intensity to 50%, limit duration to 30min, move indoors",
-            reason=f"Temperature is dangerously high ({temperature_celsius}°C). High risk of heat stroke and dehydration."
-        ))
-        severity_scores.append(4)
-    elif temperature_celsius > 35:
-        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 65)
-        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 45)
-        constraints.suggested_workout_types.extend(["early_morning_workout", "evening_workout", "swimming"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="TEMP_HOT",
-            trigger=f"Temperature is hot ({temperature_celsius}°C)",
-            action="Reduce intensity to 65%, limit duration to 45min",
-            reason=f"Temperature is very hot ({temperature_celsius}°C). Increase hydration and avoid peak sun hours."
-        ))
-        severity_scores.append(2)
-    elif temperature_celsius < 0:
-        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 45)
-        constraints.blocked_workout_types.extend(["outdoor_swimming"])
-        constraints.suggested_workout_types.extend(["indoor_cardio", "heated_gym", "indoor_sports"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="TEMP_EXTREME_COLD",
-            trigger=f"Temperature is extreme cold ({temperature_celsius}°C)",
-            action="Limit outdoor duration to 45min, suggest indoor alternatives",
-            reason=f"Temperature is below freezing ({temperature_celsius}°C). Risk of frostbite and hypothermia with prolonged exposure."
-        ))
-        severity_scores.append(2)
-
-    # === RULE 3: Heatwave Rules ===
-    if is_heatwave:
-        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 60)
-        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 40)
-        constraints.recommended_location = "indoor"
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="HEATWAVE_ACTIVE",
-            trigger="Heatwave warning is active",
-            action="Reduce intensity to 60%, limit duration to 40min, prioritize indoor",
-            reason="A heatwave is in effect. Outdoor exercise should be minimized. Stay hydrated and exercise in cooled environments."
-        ))
-        severity_scores.append(3)
-
-    # === RULE 4: Lockdown Rules ===
-    if lockdown_status == "full":
-        constraints.allow_outdoor = False
-        constraints.recommended_location = "home"
-        constraints.blocked_workout_types.extend(["gym", "outdoor_running", "group_classes", "swimming_public"])
-        constraints.suggested_workout_types.extend(["home_bodyweight", "home_yoga", "home_hiit", "resistance_bands"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="LOCKDOWN_FULL",
-            trigger="Full lockdown is in effect",
-            action="Home-only workouts, block all outdoor and gym activities",
-            reason="Full lockdown restrictions are active. All workouts must be done at home. No outdoor or facility access permitted."
-        ))
-        severity_scores.append(4)
-    elif lockdown_status == "partial":
-        constraints.blocked_workout_types.extend(["group_classes", "crowded_gym"])
-        constraints.suggested_workout_types.extend(["solo_outdoor", "home_workout", "outdoor_solo_running"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="LOCKDOWN_PARTIAL",
-            trigger="Partial lockdown is in effect",
-            action="Avoid group activities and crowded spaces",
-            reason="Partial lockdown restrictions are active. Avoid group fitness classes and crowded gyms. Solo outdoor exercise permitted."
-        ))
-        severity_scores.append(2)
-
-    # === RULE 5: Local Event Rules ===
-    if has_local_event:
-        constraints.blocked_workout_types.extend(["outdoor_running_streets", "cycling_roads", "public_parks"])
-        constraints.suggested_workout_types.extend(["indoor_gym", "home_workout", "private_facilities"])
-        adjustments.append(EnvironmentAdjustment(
-            rule_id="LOCAL_EVENT_ACTIVE",
-            trigger="Local event affecting safety/access",
-            action="Avoid affected outdoor areas, prefer indoor or private facilities",
-            reason="A local event may affect safety or access to outdoor workout areas. Consider indoor alternatives or different routes."
-        ))
-        severity_scores.append(2)
-
-    # === Calculate Overall Severity ===
-    if not severity_scores:
-        severity = "low"
-    else:
-        max_severity = max(severity_scores)
-        if max_severity >= 4:
-            severity = "critical"
-        elif max_severity >= 3:
-            severity = "high"
-        elif max_severity >= 2:
-            severity = "moderate"
-        else:
-            severity = "low"
-
-    # Deduplicate suggested workout types
-    constraints.blocked_workout_types = list(set(constraints.blocked_workout_types))
-    constraints.suggested_workout_types = list(set(constraints.suggested_workout_types))
-    
-    # Remove blocked types from suggested
-    constraints.suggested_workout_types = [
-        w for w in constraints.suggested_workout_types 
-        if w not in constraints.blocked_workout_types
-    ]
-
-    return constraints, adjustments, severity
+    """
+    Evaluate environment rules. Outcomes are precomputed per band key; the
+    returned constraints are frozen and shared between calls.
+    """
+    return current_rules().evaluate(aqi, temperature_celsius, is_heatwave, lockdown_status, has_local_event)
 
 def apply_environment_to_readiness(
     base_decision: str,
@@ -0,0 +1,386 @@
+"""
+Compact storage for explanation text.
+
+DailyReadiness.explanation and the adjustments of environment rows are
+stored as rule codes plus the one number their text embeds, and rendered
+back from templates when loaded. The column types below do the conversion,
+so rows read and write the same dicts and lists as before.
+
+Codes are only meaningful together with the templates they were written
+with, so every distinct set of templates (engine reasons plus the
+environment rules' text) is stored once in explanation_catalogs under a
+digest of its content, and each row names the catalog it was encoded with.
+Catalogs are append-only: editing or removing a rule adds a catalog, and
+older rows keep rendering with the text they were written with. Rows are
+only compacted against a catalog that is known to be stored; until then
+(and for text that doesn't re-render byte-for-byte from a template) the
+text is stored verbatim. Decoding never raises: a code missing from its
+catalog renders from the newest catalog that has it, or as the bare code.
+
+Stored forms:
+    explanation:  {"catalog": "<digest>", "codes": ["sleep", ["overall_low", 42], ["AQI_HAZARDOUS", 320]]}
+    adjustments:  {"catalog": "<digest>", "codes": ["HEATWAVE_ACTIVE", ["TEMP_HOT", 36.5]]}
+Verbatim fallbacks are {"key": text} entries and full adjustment dicts;
+rows written before catalogs were stored hold a bare list of codes and
+decode against the oldest stored catalog. Whole verbatim values (the plain
+explanation dict or adjustment list) load unchanged.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import JSON, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.types import TypeDecorator
+
+from . import engine, environment_engine
+
+logger = logging.getLogger(__name__)
+
+# Types of the numbers templates embed
+PARAM_TYPES = {"readiness_score": int, "aqi": int, "temperature_celsius": float}
+
+# Readiness reason code -> (explanation key, template)
+READINESS_REASONS = {
+    "sleep": ("sleep", engine.REASON_SLEEP),
+    "fatigue_soreness": ("fatigue_soreness", engine.REASON_FATIGUE_SORENESS),
+    "overall_low": ("overall", engine.REASON_OVERALL_LOW),
+    "overall_moderate": ("overall", engine.REASON_OVERALL_MODERATE),
+    "overall_ready": ("overall", engine.REASON_OVERALL_READY),
+    "time_constraint": ("time_constraint", engine.REASON_TIME_CONSTRAINT),
+}
+
+def _field(template: str) -> Optional[str]:
+    """The single field a template embeds, if any."""
+    fields = [name for _, name, _, _ in Formatter().parse(template) if name]
+    return fields[0] if fields else None
+
+def _pattern(template: str):
+    parts = []
+    for literal, name, _, _ in Formatter().parse(template):
+        parts.append(re.escape(literal))
+        if name:
+            parts.append(r"(.+?)")
+    return re.compile("".join(parts) + r"\Z")
+
+class _Catalog:
+    """One stored set of templates and their parse patterns."""
+
+    def __init__(self, templates: dict, rules_version: Optional[int] = None):
+        self.templates = templates
+        self.rules_version = rules_version
+        self.digest = catalog_digest(templates)
+        self.adjustments: Dict[str, environment_engine.EnvironmentAdjustment] = {
+            rule_id: environment_engine.EnvironmentAdjustment(rule_id, trigger, action, reason)
+            for rule_id, (trigger, action, reason) in templates["adjustments"].items()
+        }
+        # Combined check-ins add each adjustment's reason under env_<rule_id>
+        self.reasons: Dict[str, Tuple[str, str]] = {
+            **{code: tuple(reason) for code, reason in templates["readiness"].items()},
+            **{rule_id: (f"env_{rule_id.lower()}", a.reason) for rule_id, a in self.adjustments.items()}
+        }
+        self.codes_by_key: Dict[str, List[str]] = {}
+        for code, (key, _) in self.reasons.items():
+            self.codes_by_key.setdefault(key, []).append(code)
+        self.patterns = {code: _pattern(template) for code, (_, template) in self.reasons.items()}
+        self.adjustment_patterns = {rule_id: _pattern(a.reason) for rule_id, a in self.adjustments.items()}
+
+def catalog_templates(rules: environment_engine.RuleSet) -> dict:
+    """The templates rows written under rules are encoded with (JSON-serializable)."""
+    return {
+        "readiness": {code: list(reason) for code, reason in READINESS_REASONS.items()},
+        "adjustments": {rule_id: [a.trigger, a.action, a.reason] for rule_id, a in rules.adjustments.items()}
+    }
+
+def catalog_digest(templates: dict) -> str:
+    return hashlib.sha256(json.dumps(templates, sort_keys=True).encode()).hexdigest()[:16]
+
+# Every catalog this process has seen, by digest, oldest first (append-only)
+_catalogs: Dict[str, _Catalog] = {}
+# Digests known to be stored in explanation_catalogs; only these are encoded against
+_stored: set = set()
+_registering: set = set()
+_missing: set = set()
+_legacy_digest: Optional[str] = None
+_current: Optional[Tuple[environment_engine.RuleSet, _Catalog]] = None
+_lock = threading.Lock()
+
+def _remember(catalog: _Catalog) -> _Catalog:
+    with _lock:
+        return _catalogs.setdefault(catalog.digest, catalog)
+
+def _current_catalog() -> _Catalog:
+    """Catalog of the active rules; a new one is stored in the background when the rules change."""
+    global _current
+    rules = environment_engine.current_rules()
+    current = _current
+    if current is None or current[0] is not rules:
+        catalog = _remember(_Catalog(catalog_templates(rules), rules.version))
+        current = _current = (rules, catalog)
+        if catalog.digest not in _stored:
+            _store_in_background(catalog)
+    return current[1]
+
+# ============================================================
+# CATALOG STORAGE
+# ============================================================
+
+def _store(db_engine, catalog: _Catalog):
+    from . import models
+
+    table = models.ExplanationCatalog.__table__
+    try:
+        with db_engine.begin() as conn:
+            if conn.execute(select(table.c.digest).where(table.c.digest == catalog.digest)).first() is None:
+                conn.execute(insert(table).values(
+                    digest=catalog.digest, rules_version=catalog.rules_version, templates=catalog.templates
+                ))
+    except IntegrityError:
+        pass  # another worker stored it first
+    _stored.add(catalog.digest)
+
+def _store_in_background(catalog: _Catalog):
+    """
+    Store a new catalog off the request path: it can't be written inside the
+    transaction flushing the rows that use it (SQLite would wait on its own
+    lock). Rows are stored verbatim until it is.
+    """
+    with _lock:
+        if catalog.digest in _registering:
+            return
+        _registering.add(catalog.digest)
+
+    def store():
+        from . import database
+        try:
+            _store(database.engine, catalog)
+        except Exception:
+            # Not retried: rows keep being stored verbatim, which is always correct
+            logger.exception("Could not store explanation catalog %s; storing explanation text verbatim", catalog.digest)
+
+    threading.Thread(target=store, name="explanation-catalog", daemon=True).start()
+
+def _load(conn, digest: Optional[str] = None) -> List[_Catalog]:
+    from . import models
+
+    table = models.ExplanationCatalog.__table__
+    stmt = select(table.c.templates, table.c.rules_version).order_by(table.c.created_at, table.c.digest)
+    if digest is not None:
+        stmt = stmt.where(table.c.digest == digest)
+    catalogs = [_remember(_Catalog(templates, version)) for templates, version in conn.execute(stmt)]
+    _stored.update(c.digest for c in catalogs)
+    return catalogs
+
+def register_catalog(db_engine) -> str:
+    """
+    Store the active rules' catalog and load every stored one, so rows are
+    compacted from the first write. Run at startup, after the tables exist.
+    """
+    global _legacy_digest
+    catalog = _current_catalog()
+    _store(db_engine, catalog)
+    with db_engine.connect() as conn:
+        catalogs = _load(conn)
+    # Bare code lists predate stored catalogs; the first catalog stored is their best match
+    _legacy_digest = catalogs[0].digest if catalogs else catalog.digest
+    return catalog.digest
+
+def _catalog_for(digest: Optional[str]) -> Optional[_Catalog]:
+    """The catalog a stored value was encoded with, loaded from the database if another process stored it."""
+    if digest is None:
+        digest = _legacy_digest
+        if digest is None:
+            return _current_catalog()
+    catalog = _catalogs.get(digest)
+    if catalog is not None or digest in _missing:
+        return catalog
+    from . import database
+    try:
+        with database.engine.connect() as conn:
+            loaded = _load(conn, digest)
+    except Exception:
+        logger.exception("Could not load explanation catalog %s", digest)
+        loaded = []
+    if not loaded:
+        logger.warning("Explanation catalog %s not found; rendering from the newest catalog with each code", digest)
+        _missing.add(digest)
+        return None
+    return loaded[0]
+
+def _newest_with(attribute: str, code: str):
+    """A code's template from the newest catalog that has it."""
+    for catalog in reversed(list(_catalogs.values())):
+        template = getattr(catalog, attribute).get(code)
+        if template is not None:
+            return template
+    return None
+
+def _render(template: str, value) -> str:
+    field = _field(template)
+    return template.format(**{field: value}) if field else template
+
+def _parse(template: str, pattern, text: str):
+    """
+    (matched, value) for text rendered from template. Only exact
+    round-trips match, e.g. "36" never matches a float field rendered as "36.0".
+    """
+    match = pattern.match(text)
+    if match is None:
+        return False, None
+    field = _field(template)
+    if field is None:
+        return True, None
+    try:
+        value = PARAM_TYPES[field](match.group(1))
+    except ValueError:
+        return False, None
+    return _render(template, value) == text, value
+
+def _unpack(entry) -> Tuple[str, object]:
+    return (entry, None) if isinstance(entry, str) else (entry[0], entry[1])
+
+def _bare(code: str, value) -> str:
+    """Text for a code no catalog has."""
+    return code if value is None else f"{code} ({value})"
+
+def _envelope(stored) -> Tuple[Optional[str], list]:
+    """(catalog digest, codes) of a stored compact value; digest None for the pre-catalog bare list."""
+    if isinstance(stored, dict):
+        return stored.get("catalog"), stored["codes"]
+    return None, stored
+
+def is_compact(stored) -> bool:
+    return isinstance(stored, list) or (isinstance(stored, dict) and isinstance(stored.get("codes"), list))
+
+# ============================================================
+# EXPLANATION DICTS
+# ============================================================
+
+@lru_cache(maxsize=8192)
+def _encode_reason(catalog: _Catalog, key: str, text: str):
+    for code in catalog.codes_by_key.get(key, ()):
+        matched, value = _parse(catalog.reasons[code][1], catalog.patterns[code], text)
+        if matched:
+            return code if value is None else [code, value]
+    return {key: text}
+
+def encode_explanation(explanation: Dict[str, str]):
+    """Compact form of an explanation dict, or the dict itself until the catalog is stored."""
+    catalog = _current_catalog()
+    if catalog.digest not in _stored:
+        return explanation
+    return {"catalog": catalog.digest, "codes": [_encode_reason(catalog, key, text) for key, text in explanation.items()]}
+
+def decode_explanation(stored) -> Dict[str, str]:
+    digest, entries = _envelope(stored)
+    catalog = _catalog_for(digest)
+    explanation = {}
+    for entry in entries:
+        if isinstance(entry, dict):
+            explanation.update(entry)
+            continue
+        code, value = _unpack(entry)
+        reason = catalog.reasons.get(code) if catalog is not None else None
+        if reason is None:
+            reason = _newest_with("reasons", code)
+        if reason is None:
+            explanation[code] = _bare(code, value)
+            continue
+        key, template = reason
+        explanation[key] = _render(template, value)
+    return explanation
+
+# ============================================================
+# ENVIRONMENT ADJUSTMENTS
+# ============================================================
+
+def _encode_adjustment(catalog: _Catalog, adjustment: dict):
+    if adjustment.keys() != {"rule_id", "trigger", "action", "reason"}:
+        return adjustment
+    entry = _encode_adjustment_text(
+        catalog, adjustment["rule_id"], adjustment["trigger"], adjustment["action"], adjustment["reason"]
+    )
+    return adjustment if entry is None else entry
+
+@lru_cache(maxsize=8192)
+def _encode_adjustment_text(catalog: _Catalog, rule_id: str, trigger: str, action: str, reason: str):
+    template = catalog.adjustments.get(rule_id)
+    if template is None:
+        return None
+    matched, value = _parse(template.reason, catalog.adjustment_patterns[rule_id], reason)
+    if not matched:
+        return None
+    entry = rule_id if value is None else [rule_id, value]
+    # trigger/action must round-trip too
+    rendered = _decode_adjustment(entry, catalog)
+    return entry if (rendered["trigger"], rendered["action"]) == (trigger, action) else None
+
+def encode_adjustments(adjustments: list):
+    """Compact form of a list of adjustment dicts, or the list itself until the catalog is stored."""
+    catalog = _current_catalog()
+    if catalog.digest not in _stored or not adjustments or not all(isinstance(a, dict) for a in adjustments):
+        return adjustments
+    return {
+        "catalog": catalog.digest,
+        "codes": [_encode_adjustment(catalog, a) if isinstance(a, dict) else a for a in adjustments]
+    }
+
+def _decode_adjustment(entry, catalog: Optional[_Catalog]) -> dict:
+    if isinstance(entry, dict):
+        return entry
+    rule_id, value = _unpack(entry)
+    template = catalog.adjustments.get(rule_id) if catalog is not None else None
+    if template is None:
+        template = _newest_with("adjustments", rule_id)
+    if template is None:
+        return {"rule_id": rule_id, "trigger": _bare(rule_id, value), "action": "", "reason": ""}
+    return {
+        "rule_id": rule_id,
+        "trigger": _render(template.trigger, value),
+        "action": template.action,
+        "reason": _render(template.reason, value)
+    }
+
+def decode_adjustments(stored) -> list:
+    digest, entries = _envelope(stored)
+    catalog = _catalog_for(digest)
+    return [_decode_adjustment(entry, catalog) for entry in entries]
+
+# ============================================================
+# COLUMN TYPES
+# ============================================================
+
+class CompactExplanation(TypeDecorator):
+    """JSON explanation dict stored as reason codes. Verbatim dict rows load unchanged."""
+    impl = JSON
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, dict) and not is_compact(value):
+            return encode_explanation(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if is_compact(value):
+            return decode_explanation(value)
+        return value
+
+class CompactAdjustments(TypeDecorator):
+    """JSON list of adjustment dicts stored as rule IDs. Verbatim lists load unchanged."""
+    impl = JSON
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, list):
+            return encode_adjustments(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if is_compact(value):
+            return decode_adjustments(value)
+        return value
@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, Iterator, Optional
+
+from sqlalchemy import select
+
+from . import database, models
+
+# Rows fetched per server-side cursor round-trip; also the unit of each streamed chunk
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+
+READINESS_COLUMNS = [
+    "id", "user_id", "date",
+    "sleep_hours", "stress_level", "fatigue_level", "muscle_soreness", "available_time",
+    "readiness_score", "decision", "explanation"
+]
+
+ENVIRONMENT_COLUMNS = [
+    "id", "user_id", "date",
+    "aqi", "temperature_celsius", "is_heatwave", "lockdown_status", "has_local_event",
+    "allow_outdoor", "max_intensity_percent", "max_duration_minutes", "recommended_location",
+    "blocked_workout_types", "suggested_workout_types", "severity", "adjustments"
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def export_statement(model, columns, user_id: Optional[int] = None,
+                     start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Column-only select (no ORM identity map) in primary-key order."""
+    stmt = select(*[getattr(model, c) for c in columns])
+    if user_id is not None:
+        stmt = stmt.where(model.user_id == user_id)
+    if start is not None:
+        stmt = stmt.where(model.date >= start)
+    if end is not None:
+        stmt = stmt.where(model.date < end)
+    return stmt.order_by(model.id)
+
+def csv_header(columns) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(columns)
+    return buffer.getvalue()
+
+def encode_chunk(rows, columns, fmt: str) -> str:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([_csv_value(v) for v in row] for row in rows)
+        return buffer.getvalue()
+    return "".join(
+        json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+        for row in rows
+    )
+
+def stream_export(model, columns, fmt: str = "ndjson", user_id: Optional[int] = None,
+                  start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Stream a table as NDJSON or CSV text chunks.
+    Uses a server-side cursor (stream_results + yield_per), so memory stays
+    bounded by chunk_size regardless of how many rows match. Owns its own
+    session because streaming outlives the request's dependency scope.
+    """
+    db = database.SessionLocal()
+    try:
+        if fmt == "csv":
+            yield csv_header(columns)
+
+        result = db.execute(
+            export_statement(model, columns, user_id, start, end)
+            .execution_options(stream_results=True, yield_per=chunk_size)
+        )
+        for rows in result.partitions():
+            yield encode_chunk(rows, columns, fmt)
+    finally:
+        db.close()
+
+def stream_readiness(fmt: str = "ndjson", **filters) -> Iterator[str]:
+    return stream_export(models.DailyReadiness, READINESS_COLUMNS, fmt, **filters)
+
+def stream_environment(fmt: str = "ndjson", **filters) -> Iterator[str]:
+    return stream_export(models.EnvironmentPolicy, ENVIRONMENT_COLUMNS, fmt, **filters)
+
+async def astream_export(model, columns, fmt: str = "ndjson", user_id: Optional[int] = None,
+                         start: Optional[datetime] = None, end: Optional[datetime] = None,
+                         chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[str]:
+    """Async counterpart of stream_export on an AsyncSession server-side cursor."""
+    async with database.AsyncSessionLocal() as db:
+        if fmt == "csv":
+            yield csv_header(columns)
+
+        result = await db.stream(
+            export_statement(model, columns, user_id, start, end)
+            .execution_options(yield_per=chunk_size)
+        )
+        async for rows in result.partitions():
+            yield encode_chunk(rows, columns, fmt)
+
+def astream_readiness(fmt: str = "ndjson", **filters) -> AsyncIterator[str]:
+    return astream_export(models.DailyReadiness, READINESS_COLUMNS, fmt, **filters)
+
+def astream_environment(fmt: str = "ndjson", **filters) -> AsyncIterator[str]:
+    return astream_export(models.EnvironmentPolicy, ENVIRONMENT_COLUMNS, fmt, **filters)
@@ -0,0 +1,202 @@
+"""
+JSON responses rendered straight from engine dataclasses, ORM rows and dicts.
+
+Returning data (or pydantic models built from it) from a handler means
+validating it against the response model and then walking the result again
+in jsonable_encoder; on history pages that is most of the request's CPU.
+render() instead converts each value once, following a plan compiled per
+response model (field order, defaults, per-type conversion), and hands plain
+data to orjson. Handlers keep their response_model, so the OpenAPI document
+is unchanged.
+
+Output is byte-for-byte what JSONResponse(jsonable_encoder(...)) produces for
+the validated model (tests/test_fast_json_parity.py checks). Values are
+converted, not validated: anything the plan doesn't expect (a wrong type, a
+missing field, a float that orjson and json spell differently) renders
+through the pydantic model instead, which also raises the same validation
+errors as before. FAST_JSON=0 renders everything through the models.
+"""
+import functools
+import os
+import types
+import typing
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Callable, Iterable, Optional, Tuple, Type
+
+import orjson
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from . import metrics
+
+FAST_JSON_ENABLED = os.getenv("FAST_JSON", "1") == "1"
+
+MEDIA_TYPE = "application/json"
+
+# orjson and json.dumps (repr) agree on finite floats in this range, and on 0
+_FLOAT_MIN = 1e-4
+_FLOAT_MAX = 1e16
+
+_REQUIRED = object()
+
+class _Unrenderable(Exception):
+    """A value the plan doesn't convert exactly; render it through pydantic."""
+
+_FALLBACK = (_Unrenderable, AttributeError, TypeError, ValueError, KeyError)
+
+# ============================================================
+# CONVERTERS
+# ============================================================
+
+def _int(value):
+    if type(value) is int:
+        return value
+    raise _Unrenderable(value)
+
+def _bool(value):
+    if type(value) is bool:
+        return value
+    raise _Unrenderable(value)
+
+def _float(value):
+    if type(value) is int:
+        value = float(value)
+    elif type(value) is not float:
+        raise _Unrenderable(value)
+    if value and not (_FLOAT_MIN <= abs(value) < _FLOAT_MAX):
+        raise _Unrenderable(value)  # also NaN and infinities
+    return value
+
+def _str(value):
+    if type(value) is str:
+        return value
+    if isinstance(value, Enum) and isinstance(value.value, str):
+        return value.value
+    raise _Unrenderable(value)
+
+def _datetime(value):
+    if type(value) is not datetime:
+        raise _Unrenderable(value)
+    offset = value.utcoffset()
+    if offset is None:
+        return value.isoformat()
+    if not offset:
+        return value.replace(tzinfo=None).isoformat() + "Z"
+    if offset.seconds % 60 or offset.microseconds:
+        raise _Unrenderable(value)  # pydantic drops sub-minute offsets
+    return value.isoformat()
+
+def _date(value):
+    if type(value) is not date:
+        raise _Unrenderable(value)
+    return value.isoformat()
+
+_SCALARS = {int: _int, bool: _bool, float: _float, str: _str, datetime: _datetime, date: _date}
+
+def _enum(enum: Type[Enum]) -> Callable:
+    return lambda value: enum(value).value
+
+def _optional(convert: Callable) -> Callable:
+    return lambda value: None if value is None else convert(value)
+
+def _list(convert: Callable) -> Callable:
+    return lambda values: [convert(v) for v in values]
+
+def _dict(convert_key: Callable, convert_value: Callable) -> Callable:
+    return lambda values: {convert_key(k): convert_value(v) for k, v in values.items()}
+
+def _converter(annotation) -> Callable:
+    """Conversion to JSON-ready data for one field annotation."""
+    if annotation in _SCALARS:
+        return _SCALARS[annotation]
+    if isinstance(annotation, type):
+        if issubclass(annotation, BaseModel):
+            return functools.partial(_fields, _plan(annotation))
+        if issubclass(annotation, Enum):
+            return _enum(annotation)
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin in (typing.Union, types.UnionType) and len(args) == 2 and type(None) in args:
+        return _optional(_converter(args[0] if args[1] is type(None) else args[1]))
+    if origin is list and len(args) == 1:
+        return _list(_converter(args[0]))
+    if origin is dict and len(args) == 2:
+        return _dict(_converter(args[0]), _converter(args[1]))
+    raise TypeError(f"fast_json has no converter for {annotation!r}; render this model through pydantic")
+
+# ============================================================
+# PLANS
+# ============================================================
+
+Plan = Tuple[Tuple[str, str, Any, Callable], ...]  # (output key, attribute, default, converter)
+
+@functools.lru_cache(maxsize=None)
+def _plan(model: Type[BaseModel]) -> Plan:
+    """Per-field conversion for a response model, in its serialization order."""
+    plan = []
+    for name, field in model.model_fields.items():
+        default = _REQUIRED if field.is_required() else field.get_default(call_default_factory=True)
+        key = field.serialization_alias or field.alias or name
+        plan.append((key, name, default, _converter(field.annotation)))
+    return tuple(plan)
+
+def _fields(plan: Plan, value) -> dict:
+    """One model's JSON object from a dict or any object with the fields as attributes."""
+    get = value.get if isinstance(value, dict) else functools.partial(getattr, value)
+    content = {}
+    for key, name, default, convert in plan:
+        item = get(name, default)
+        if item is _REQUIRED:
+            raise _Unrenderable(name)
+        content[key] = convert(item)
+    return content
+
+# ============================================================
+# RENDERING
+# ============================================================
+
+def reference(model: Type[BaseModel], value, many: bool = False) -> bytes:
+    """The body FastAPI renders for value validated as model (a list of them with many)."""
+    if many:
+        content = [model.model_validate(v, from_attributes=True) for v in value]
+    else:
+        content = model.model_validate(value, from_attributes=True) if value is not None else None
+    return JSONResponse(jsonable_encoder(content)).body
+
+def try_render(model: Type[BaseModel], value) -> Optional[bytes]:
+    """render() without the fallback: None when value needs the pydantic path."""
+    plan = _plan(model)
+    try:
+        return orjson.dumps(None if value is None else _fields(plan, value))
+    except _FALLBACK:
+        return None
+
+def render(model: Type[BaseModel], value) -> bytes:
+    """JSON body for one value shaped like model (None renders null)."""
+    if FAST_JSON_ENABLED:
+        with metrics.stage("response.render"):
+            body = try_render(model, value)
+        if body is not None:
+            return body
+    with metrics.stage("response.render_models"):
+        return reference(model, value)
+
+def render_many(model: Type[BaseModel], values: Iterable) -> bytes:
+    """JSON array body for values shaped like model."""
+    values = list(values)
+    if FAST_JSON_ENABLED:
+        plan = _plan(model)
+        with metrics.stage("response.render"):
+            try:
+                return orjson.dumps([_fields(plan, v) for v in values])
+            except _FALLBACK:
+                pass
+    with metrics.stage("response.render_models"):
+        return reference(model, values, many=True)
+
+def response(body: bytes, next_cursor: Optional[str] = None) -> Response:
+    """A JSON response for a rendered body, with the history pages' cursor header."""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(content=body, media_type=MEDIA_TYPE, headers=headers)
@@ -0,0 +1,162 @@
+"""
+Bulk environment ingestion (POST /environment-input/bulk).
+
+Provider feeds carry the same few readings for many users, so rules are
+evaluated once per distinct input combination and rows are written with
+multi-row INSERTs in chunks, one transaction per chunk. Bad rows are
+reported by index and skipped; they never fail the rest of the request.
+"""
+import json
+import os
+import time
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+
+from . import database, models, schemas, services, cache
+
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", 200000))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 5000))
+# Per-row errors listed in the response; the counts always cover every row
+BULK_MAX_ERRORS = 1000
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+class _Report:
+    def __init__(self):
+        self.errors: List[dict] = []
+        self.rejected = 0
+
+    def reject(self, index: int, status: str, detail: str):
+        self.rejected += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append({"index": index, "status": status, "detail": detail})
+
+def parse_body(body: bytes, content_type: str, report: _Report) -> List[Optional[object]]:
+    """
+    Decode a JSON array or NDJSON body into a list of items. NDJSON lines that
+    aren't valid JSON are rejected individually and kept as None, so indexes
+    still match the input lines.
+    """
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Body is not valid UTF-8: {e.reason} at byte {e.start}")
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == "application/json" or (media_type not in NDJSON_MEDIA_TYPES and text.lstrip().startswith("[")):
+        try:
+            items = json.loads(text)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON array: {e}")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON")
+        return items
+
+    items = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            report.reject(len(items), "invalid_json", str(e))
+            items.append(None)
+    return items
+
+def validate_items(items, report: _Report) -> List[tuple]:
+    """(index, EnvironmentInputCreate) for every item that validates."""
+    valid = []
+    for index, item in enumerate(items):
+        if item is None:
+            continue
+        try:
+            valid.append((index, schemas.EnvironmentInputCreate.model_validate(item)))
+        except ValidationError as e:
+            error = e.errors()[0]
+            location = ".".join(str(part) for part in error["loc"])
+            report.reject(index, "invalid", f"{location}: {error['msg']}" if location else error["msg"])
+    return valid
+
+def existing_user_ids(db, user_ids) -> set:
+    user_ids = list(user_ids)
+    found = set()
+    for i in range(0, len(user_ids), 1000):
+        found.update(db.execute(
+            select(models.User.id).where(models.User.id.in_(user_ids[i:i + 1000]))
+        ).scalars())
+    return found
+
+def ingest_environment(body: bytes, content_type: str = "") -> dict:
+    """Validate, evaluate and insert a bulk environment feed; returns the status summary."""
+    started = time.perf_counter()
+    report = _Report()
+    items = parse_body(body, content_type, report)
+    if len(items) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ROWS} rows per request")
+    valid = validate_items(items, report)
+
+    # Rule evaluation is memoised per distinct input tuple
+    evaluated = {}
+    rows = []
+    for index, data in valid:
+        key = (data.aqi, data.temperature_celsius, data.is_heatwave,
+               data.lockdown_status.value, data.has_local_event)
+        fields = evaluated.get(key)
+        if fields is None:
+            fields = evaluated[key] = services.environment_policy_fields(*services.evaluate_environment(data))
+        rows.append((index, {
+            "user_id": data.user_id,
+            "aqi": data.aqi,
+            "temperature_celsius": data.temperature_celsius,
+            "is_heatwave": data.is_heatwave,
+            "lockdown_status": data.lockdown_status.value,
+            "has_local_event": data.has_local_event,
+            **fields
+        }))
+
+    inserted = 0
+    chunks = 0
+    users = set()
+    db = database.SessionLocal()
+    try:
+        known = existing_user_ids(db, {values["user_id"] for _, values in rows})
+        for i in range(0, len(rows), BULK_CHUNK_SIZE):
+            chunk = []
+            for index, values in rows[i:i + BULK_CHUNK_SIZE]:
+                if values["user_id"] in known:
+                    chunk.append((index, values))
+                else:
+                    report.reject(index, "unknown_user", f"User {values['user_id']} does not exist")
+            if not chunk:
+                continue
+            try:
+                # Core insert on the table: skips the ORM's per-row bookkeeping
+                db.execute(insert(models.EnvironmentPolicy.__table__), [values for _, values in chunk])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                for index, _ in chunk:
+                    report.reject(index, "failed", type(e).__name__)
+                continue
+            chunks += 1
+            inserted += len(chunk)
+            users.update(values["user_id"] for _, values in chunk)
+    finally:
+        db.close()
+
+    cache.invalidate_many(users, cache.ENVIRONMENT_IMPACT)
+
+    report.errors.sort(key=lambda error: error["index"])
+    return {
+        "received": len(items),
+        "inserted": inserted,
+        "rejected": report.rejected,
+        "distinct_inputs": len(evaluated),
+        "users": len(users),
+        "chunks": chunks,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        "errors": report.errors,
+        "errors_truncated": report.rejected > len(report.errors)
+    }
@@ -1,17 +1,38 @@
-import json
 import os
-from fastapi import FastAPI, Depends, HTTPException
+import time
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, text
 from sqlalchemy.orm import Session
+from datetime import date, datetime
 from typing import List, Optional
-import redis
 
-from . import models, schemas, engine, database, environment_engine
+from . import models, schemas, engine, environment_engine, database, export, cache, services, write_behind, precompute, ingest, trends, analytics, metrics, profiling, singleflight, fast_json, explanations
+from .services import HISTORY_DEFAULT_LIMIT, HISTORY_MAX_LIMIT
 
-# Initialize DB
-models.Base.metadata.create_all(bind=database.engine)
+# The schema is created and upgraded by `python -m app.migrations upgrade` (deploy step), not at import:
+# every worker would race the others into the same DDL
+explanations.register_catalog(database.engine)
+# Monthly partitions are created by `python -m app.partitions ensure` (cron), not here:
+# every worker running the DDL at import would contend for the parent tables' locks
 
-app = FastAPI(title="AI Exercise Personalization System")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Write buffered rows first: each flush queues cache invalidations
+    if write_behind.buffer is not None:
+        write_behind.buffer.close()
+    # Flush queued cache writes before the worker exits
+    cache.client.close()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+
+app = FastAPI(title="AI Exercise Personalization System", lifespan=lifespan)
+# Routes declared on app below (and on the routers) can be profiled on demand
+app.router.route_class = profiling.ProfiledRoute
 
 # CORS middleware
 app.add_middleware(
@@ -21,25 +42,73 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last, so it is outermost and request times include CORS handling
+app.add_middleware(metrics.MetricsMiddleware)
 
-# Redis setup (optional, graceful fallback)
-try:
-    redis_client = redis.Redis(
-        host=os.getenv("REDIS_HOST", "localhost"),
-        port=int(os.getenv("REDIS_PORT", 6379)),
-        db=0,
-        decode_responses=True,
-        socket_connect_timeout=2
-    )
-    redis_client.ping()
-except Exception:
-    redis_client = None
+# Database-backed endpoints. These sync handlers run in the threadpool and are
+# the fallback when async SQLAlchemy is disabled or its driver is missing;
+# async_api.router mirrors them (see the bottom of this module).
+router = APIRouter(route_class=profiling.ProfiledRoute)
 
 @app.get("/")
 def root():
     return {"status": "healthy", "service": "AI Exercise Personalization System"}
 
-@app.post("/users/", response_model=schemas.User)
+@app.get("/health/db")
+def db_health():
+    """
+    Database round-trip plus this worker's pool usage: checked-out vs idle
+    connections, overflow in use, and how long checkouts waited.
+    """
+    started = time.perf_counter()
+    try:
+        with database.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        status = "healthy"
+    except Exception:
+        status = "unavailable"
+    body = {
+        "status": status,
+        "ping_ms": round((time.perf_counter() - started) * 1000, 3),
+        "worker_pid": os.getpid(),
+        "config": {
+            "pool_size": database.DB_POOL_SIZE,
+            "max_overflow": database.DB_MAX_OVERFLOW,
+            "pool_timeout": database.DB_POOL_TIMEOUT,
+            "pool_recycle": database.DB_POOL_RECYCLE,
+            "pool_pre_ping": database.DB_POOL_PRE_PING
+        },
+        "pools": database.pool_stats()
+    }
+    return JSONResponse(body, status_code=200 if status == "healthy" else 503)
+
+@app.get("/health/cache")
+def cache_health():
+    """Redis connection, circuit breaker state and write queue counters."""
+    return cache.client.stats()
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """
+    Request and stage latency histograms (see app.metrics) plus this worker's
+    cache, pool, rules, write-behind and read-coalescing stats as gauges and
+    counters, in the Prometheus text format.
+    """
+    body = metrics.render({
+        "app_cache": cache.client.stats(),
+        "app_db_pool": database.pool_stats(),
+        "app_environment_rules": environment_engine.rules_info(),
+        "app_write_behind": write_behind.stats(),
+        "app_singleflight": singleflight.stats()
+    })
+    return Response(content=body, media_type=metrics.CONTENT_TYPE)
+
+@app.get("/health/write-behind")
+def write_behind_health():
+    """Write-behind buffer depth and flush counters (WRITE_BEHIND=1)."""
+    return write_behind.stats()
+
+@router.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
     db_user = models.User(username=user.username, email=user.email)
     db.add(db_user)
@@ -47,62 +116,114 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
     db.refresh(db_user)
     return db_user
 
-@app.post("/readiness/", response_model=schemas.DailyReadinessResponse)
+@router.post("/readiness/", response_model=schemas.DailyReadinessResponse)
 def submit_readiness(
     data: schemas.DailyReadinessCreate, 
     db: Session = Depends(database.get_db)
 ):
-    # 1. Check Cache
-    cache_key = f"readiness:{data.user_id}:{database.func.now().date()}"
-    # Note: In a real app, date logic would be more robust
-    
-    # 2. Calculate using Engine
-    score, decision, explanation = engine.calculate_readiness(
-        data.sleep_hours,
-        data.stress_level,
-        data.fatigue_level,
-        data.muscle_soreness
-    )
-    
-    # 3. Simple Constraint Optimization (Step 9)
-    if decision == "TRAIN" and data.available_time < 30:
-        decision = "ACTIVE_RECOVERY"
-        explanation["time_constraint"] = "Time is limited (<30m). Short recovery session recommended."
-
-    # 4. Save to DB
-    db_readiness = models.DailyReadiness(
-        **data.dict(),
-        readiness_score=score,
-        decision=decision,
-        explanation=explanation
-    )
+    # 1. Calculate using Engine and save to DB
+    db_readiness = services.readiness_row(data)
+    if write_behind.buffer is not None:
+        # Inserted by the next flush, which also invalidates the cache; no id yet
+        services.buffer_row(db_readiness)
+        return fast_json.response(fast_json.render(schemas.DailyReadinessResponse, db_readiness))
     db.add(db_readiness)
+    trends.record(db, [db_readiness])
+    db.flush()
+    precompute.refresh_decision(db, db_readiness, base_decision=db_readiness.decision)
     db.commit()
     db.refresh(db_readiness)
     
-    # 5. Update Cache
-    if redis_client:
-        try:
-            redis_client.setex(
-                f"user_last_decision:{data.user_id}", 
-                86400, # 24h
-                json.dumps({"decision": decision, "score": score})
-            )
-        except Exception:
-            pass # Allow DB success even if Redis fails
+    # 2. Invalidate cached reads after commit. This bumps the key's generation, so a
+    #    concurrent read that queried before the commit caches its result as a miss
+    cache.invalidate(data.user_id, cache.READINESS_PAGE, cache.DAILY_DECISION)
         
-    return db_readiness
+    return fast_json.response(fast_json.render(schemas.DailyReadinessResponse, db_readiness))
+
+@app.post("/readiness/batch", response_model=schemas.ReadinessBatchResponse)
+def score_readiness_batch(
+    data: schemas.ReadinessBatchRequest,
+    include_explanations: bool = False
+):
+    """
+    Score many check-ins in one vectorized pass. Nothing is stored.
+    Explanation codes are engine.EXPLAIN_* bit flags; pass
+    include_explanations=true to also get the expanded text per row.
+    """
+    columns = [
+        data.sleep_hours,
+        data.stress_level,
+        data.fatigue_level,
+        data.muscle_soreness,
+        data.available_time
+    ]
+    if len({len(c) for c in columns}) > 1:
+        raise HTTPException(status_code=422, detail="All input columns must have the same length")
+
+    with metrics.stage("engine.readiness_batch"):
+        scores, decisions, codes = engine.calculate_readiness_batch(*columns)
+
+    scores = scores.tolist()
+    codes = codes.tolist()
+    return schemas.ReadinessBatchResponse(
+        readiness_scores=scores,
+        decisions=[engine.DECISIONS[d] for d in decisions.tolist()],
+        explanation_codes=codes,
+        explanations=[
+            engine.explain_codes(code, score) for code, score in zip(codes, scores)
+        ] if include_explanations else None
+    )
+
+@router.get("/readiness/{user_id}", response_model=List[schemas.DailyReadinessResponse])
+def get_user_history(
+    user_id: int,
+    before: Optional[int] = Query(None, description="Return rows older than this row id (the X-Next-Cursor header of the previous page)"),
+    limit: int = Query(HISTORY_DEFAULT_LIMIT, ge=1, le=HISTORY_MAX_LIMIT),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return, e.g. readiness_score,decision"),
+    since: Optional[datetime] = Query(None, description="Only rows dated at or after this; keeps the query on recent partitions"),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Readiness history, newest first. Follow X-Next-Cursor to page back.
+    The default first page (what dashboards poll) is served from cache.
+    """
+    projection = services.parse_fields(fields, schemas.DailyReadinessResponse)
+    if projection is not None:
+        stmt = services.history_page(
+            services.readiness_projection_statement(projection), models.DailyReadiness, user_id, before, limit, since
+        )
+        return services.projected_readiness_response(db.execute(stmt).all(), projection, limit)
 
-@app.get("/readiness/{user_id}", response_model=List[schemas.DailyReadinessResponse])
-def get_user_history(user_id: int, db: Session = Depends(database.get_db)):
-    return db.query(models.DailyReadiness).filter(models.DailyReadiness.user_id == user_id).all()
+    cacheable = before is None and since is None and limit == HISTORY_DEFAULT_LIMIT
+    if cacheable:
+        cached, generation = services.cached_response(cache.READINESS_PAGE, user_id)
+        if cached is not None:
+            return cached
+        # Concurrent misses for the same first page share one query
+        payload, shared = singleflight.readers.do(
+            (cache.READINESS_PAGE, user_id, generation), lambda: _readiness_page_payload(db, user_id, generation)
+        )
+        return services.coalesced_response(payload, shared)
+
+    stmt = services.history_page(select(models.DailyReadiness), models.DailyReadiness, user_id, before, limit, since)
+    rows = db.execute(stmt).scalars().all()
+    body = fast_json.render_many(schemas.DailyReadinessResponse, rows)
+    return fast_json.response(body, services.next_cursor(rows, limit))
+
+def _readiness_page_payload(db: Session, user_id: int, generation: Optional[str]) -> str:
+    stmt = services.history_page(
+        select(models.DailyReadiness), models.DailyReadiness, user_id, None, HISTORY_DEFAULT_LIMIT, None
+    )
+    rows = db.execute(stmt).scalars().all()
+    body = fast_json.render_many(schemas.DailyReadinessResponse, rows)
+    return services.cache_payload(cache.READINESS_PAGE, user_id, generation, body, services.next_cursor(rows, HISTORY_DEFAULT_LIMIT))
 
 
 # ============================================================
 # ENVIRONMENT & POLICY AWARENESS ENDPOINTS
 # ============================================================
 
-@app.post("/environment-input", response_model=schemas.EnvironmentImpactResponse)
+@router.post("/environment-input", response_model=schemas.EnvironmentImpactResponse)
 def submit_environment_input(
     data: schemas.EnvironmentInputCreate,
     db: Session = Depends(database.get_db)
@@ -112,278 +233,290 @@ def submit_environment_input(
     Returns calculated constraints and human-readable adjustments.
     """
     # Calculate impact using rule-based engine
-    constraints, adjustments, severity = environment_engine.calculate_environment_impact(
-        aqi=data.aqi,
-        temperature_celsius=data.temperature_celsius,
-        is_heatwave=data.is_heatwave,
-        lockdown_status=data.lockdown_status.value,
-        has_local_event=data.has_local_event
-    )
-    
-    # Convert adjustments to dict format for JSON storage
-    adjustments_dict = [
-        {"rule_id": a.rule_id, "trigger": a.trigger, "action": a.action, "reason": a.reason}
-        for a in adjustments
-    ]
+    constraints, adjustments, severity = services.evaluate_environment(data)
     
     # Save to database
-    db_env = models.EnvironmentPolicy(
-        user_id=data.user_id,
-        aqi=data.aqi,
-        temperature_celsius=data.temperature_celsius,
-        is_heatwave=data.is_heatwave,
-        lockdown_status=data.lockdown_status.value,
-        has_local_event=data.has_local_event,
-        allow_outdoor=constraints.allow_outdoor,
-        max_intensity_percent=constraints.max_intensity_percent,
-        max_duration_minutes=constraints.max_duration_minutes,
-        recommended_location=constraints.recommended_location,
-        adjustments=adjustments_dict
-    )
+    db_env = services.environment_policy_row(data, constraints, adjustments, severity)
     db.add(db_env)
     db.commit()
     db.refresh(db_env)
+    cache.invalidate(data.user_id, cache.ENVIRONMENT_IMPACT)
     
-    # Build response with proper schema types
-    return schemas.EnvironmentImpactResponse(
-        id=db_env.id,
-        user_id=db_env.user_id,
-        date=db_env.date,
-        aqi=db_env.aqi,
-        temperature_celsius=db_env.temperature_celsius,
-        is_heatwave=db_env.is_heatwave,
-        lockdown_status=db_env.lockdown_status,
-        has_local_event=db_env.has_local_event,
-        constraints=schemas.WorkoutConstraints(
-            allow_outdoor=constraints.allow_outdoor,
-            max_intensity_percent=constraints.max_intensity_percent,
-            max_duration_minutes=constraints.max_duration_minutes,
-            recommended_location=schemas.RecommendedLocation(constraints.recommended_location),
-            blocked_workout_types=constraints.blocked_workout_types,
-            suggested_workout_types=constraints.suggested_workout_types
-        ),
-        adjustments=[
-            schemas.EnvironmentAdjustment(
-                rule_id=a.rule_id,
-                trigger=a.trigger,
-                action=a.action,
-                reason=a.reason
-            ) for a in adjustments
-        ],
-        severity=severity
-    )
+    return fast_json.response(fast_json.render(schemas.EnvironmentImpactResponse, services.environment_response(db_env)))
 
-@app.get("/environment-impact/{user_id}", response_model=Optional[schemas.EnvironmentImpactResponse])
+@app.post(
+    "/environment-input/bulk",
+    response_model=schemas.EnvironmentBulkResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/EnvironmentInputCreate"}}},
+        "application/x-ndjson": {"schema": {"$ref": "#/components/schemas/EnvironmentInputCreate"}}
+    }}}
+)
+async def submit_environment_bulk(request: Request):
+    """
+    Submit environment data for many users at once, as a JSON array or NDJSON
+    (one EnvironmentInputCreate per line). Valid rows are stored; rejected rows
+    are listed by index. Runs on the sync engine in the threadpool whichever
+    handlers are being served.
+    """
+    body = await request.body()
+    return await run_in_threadpool(ingest.ingest_environment, body, request.headers.get("content-type", ""))
+
+@router.get("/environment-impact/{user_id}", response_model=Optional[schemas.EnvironmentImpactResponse])
 def get_environment_impact(
     user_id: int,
     db: Session = Depends(database.get_db)
 ):
     """
-    Get the latest environment impact data for a user.
+    Get the latest environment impact data for a user: their own latest
+    environment input or their region's current snapshot, whichever is newer.
     Returns constraints and adjustments that affect workout recommendations.
+    Served from cache until the user's environment changes.
     """
-    # Get latest environment policy for user
-    db_env = db.query(models.EnvironmentPolicy)\
-        .filter(models.EnvironmentPolicy.user_id == user_id)\
-        .order_by(models.EnvironmentPolicy.date.desc())\
-        .first()
-    
-    if not db_env:
-        return None
-    
-    # Recalculate constraints to ensure fresh data
-    constraints, adjustments, severity = environment_engine.calculate_environment_impact(
-        aqi=db_env.aqi,
-        temperature_celsius=db_env.temperature_celsius,
-        is_heatwave=db_env.is_heatwave,
-        lockdown_status=db_env.lockdown_status,
-        has_local_event=db_env.has_local_event
+    cached, generation = services.cached_response(cache.ENVIRONMENT_IMPACT, user_id)
+    if cached is not None:
+        return cached
+
+    # Concurrent misses for the same user share one lookup and rule evaluation
+    payload, shared = singleflight.readers.do(
+        (cache.ENVIRONMENT_IMPACT, user_id, generation), lambda: _environment_impact_payload(db, user_id, generation)
     )
+    return services.coalesced_response(payload, shared)
+
+def _environment_impact_payload(db: Session, user_id: int, generation: Optional[str]) -> str:
+    # Latest environment policy for user, and their region's current snapshot
+    db_env = db.execute(services.latest_environment_statement(user_id)).scalars().first()
+    snapshot = db.execute(services.user_snapshot_statement(user_id)).scalars().first()
     
-    return schemas.EnvironmentImpactResponse(
-        id=db_env.id,
-        user_id=db_env.user_id,
-        date=db_env.date,
-        aqi=db_env.aqi,
-        temperature_celsius=db_env.temperature_celsius,
-        is_heatwave=db_env.is_heatwave,
-        lockdown_status=db_env.lockdown_status,
-        has_local_event=db_env.has_local_event,
-        constraints=schemas.WorkoutConstraints(
-            allow_outdoor=constraints.allow_outdoor,
-            max_intensity_percent=constraints.max_intensity_percent,
-            max_duration_minutes=constraints.max_duration_minutes,
-            recommended_location=schemas.RecommendedLocation(constraints.recommended_location),
-            blocked_workout_types=constraints.blocked_workout_types,
-            suggested_workout_types=constraints.suggested_workout_types
-        ),
-        adjustments=[
-            schemas.EnvironmentAdjustment(
-                rule_id=a.rule_id,
-                trigger=a.trigger,
-                action=a.action,
-                reason=a.reason
-            ) for a in adjustments
-        ],
-        severity=severity
-    )
+    # Stored constraints are only recomputed when the rules changed
+    stale = [row for row in (db_env, snapshot) if row is not None and services.refresh_environment_policy(row)]
+    if stale:
+        db.commit()
+    
+    content = services.user_environment_response(db_env, snapshot, user_id)
+    return services.cache_payload(cache.ENVIRONMENT_IMPACT, user_id, generation, fast_json.render(schemas.EnvironmentImpactResponse, content))
 
-@app.get("/environment-history/{user_id}", response_model=List[schemas.EnvironmentImpactResponse])
+@router.get("/environment-history/{user_id}", response_model=List[schemas.EnvironmentImpactResponse])
 def get_environment_history(
     user_id: int,
-    limit: int = 10,
+    before: Optional[int] = Query(None, description="Return rows older than this row id (the X-Next-Cursor header of the previous page)"),
+    limit: int = Query(10, ge=1, le=HISTORY_MAX_LIMIT),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of fields to return, e.g. date,severity"),
+    since: Optional[datetime] = Query(None, description="Only rows dated at or after this; keeps the query on recent partitions"),
     db: Session = Depends(database.get_db)
 ):
     """
-    Get environment impact history for a user.
+    Get environment impact history for a user, newest first.
+    Follow X-Next-Cursor to page back.
     """
-    records = db.query(models.EnvironmentPolicy)\
-        .filter(models.EnvironmentPolicy.user_id == user_id)\
-        .order_by(models.EnvironmentPolicy.date.desc())\
-        .limit(limit)\
-        .all()
+    projection = services.parse_fields(fields, schemas.EnvironmentImpactResponse)
+    stmt = services.history_page(select(models.EnvironmentPolicy), models.EnvironmentPolicy, user_id, before, limit, since)
+    records = db.execute(stmt).scalars().all()
     
-    results = []
+    # Rows computed with older rules are recomputed for the response only: committing
+    # here would write from a GET and reload every row. python -m app.rescore environment
+    # persists them.
     for db_env in records:
-        constraints, adjustments, severity = environment_engine.calculate_environment_impact(
-            aqi=db_env.aqi,
-            temperature_celsius=db_env.temperature_celsius,
-            is_heatwave=db_env.is_heatwave,
-            lockdown_status=db_env.lockdown_status,
-            has_local_event=db_env.has_local_event
-        )
-        
-        results.append(schemas.EnvironmentImpactResponse(
-            id=db_env.id,
-            user_id=db_env.user_id,
-            date=db_env.date,
-            aqi=db_env.aqi,
-            temperature_celsius=db_env.temperature_celsius,
-            is_heatwave=db_env.is_heatwave,
-            lockdown_status=db_env.lockdown_status,
-            has_local_event=db_env.has_local_event,
-            constraints=schemas.WorkoutConstraints(
-                allow_outdoor=constraints.allow_outdoor,
-                max_intensity_percent=constraints.max_intensity_percent,
-                max_duration_minutes=constraints.max_duration_minutes,
-                recommended_location=schemas.RecommendedLocation(constraints.recommended_location),
-                blocked_workout_types=constraints.blocked_workout_types,
-                suggested_workout_types=constraints.suggested_workout_types
-            ),
-            adjustments=[
-                schemas.EnvironmentAdjustment(
-                    rule_id=a.rule_id,
-                    trigger=a.trigger,
-                    action=a.action,
-                    reason=a.reason
-                ) for a in adjustments
-            ],
-            severity=severity
-        ))
+        services.refresh_environment_policy(db_env)
     
-    return results
+    if projection is not None:
+        return services.projected_environment_response(records, projection, limit)
+
+    body = fast_json.render_many(schemas.EnvironmentImpactResponse, map(services.environment_response, records))
+    return fast_json.response(body, services.next_cursor(records, limit))
+
+
+# ============================================================
+# REGIONAL ENVIRONMENT ENDPOINTS
+# ============================================================
+
+@router.post("/regions/", response_model=schemas.Region)
+def create_region(region: schemas.RegionCreate, db: Session = Depends(database.get_db)):
+    db_region = models.Region(name=region.name)
+    db.add(db_region)
+    db.commit()
+    db.refresh(db_region)
+    return db_region
+
+@router.put("/users/{user_id}/region", response_model=schemas.User)
+def set_user_region(
+    user_id: int,
+    data: schemas.UserRegionUpdate,
+    db: Session = Depends(database.get_db)
+):
+    """Link a user to a region (or unlink with region_id null)."""
+    db_user = db.get(models.User, user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if data.region_id is not None and db.get(models.Region, data.region_id) is None:
+        raise HTTPException(status_code=404, detail="Region not found")
+    db_user.region_id = data.region_id
+    db.commit()
+    db.refresh(db_user)
+    cache.invalidate(user_id, cache.ENVIRONMENT_IMPACT)
+    return db_user
+
+@router.post("/regions/{region_id}/snapshots", response_model=schemas.EnvironmentSnapshotResponse)
+def create_environment_snapshot(
+    region_id: int,
+    data: schemas.EnvironmentSnapshotCreate,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Publish environment conditions for every user in a region. Rules are
+    evaluated once here; users read the stored result. Cached environment of
+    the region's users is dropped now; a snapshot whose valid_from is in the
+    future reaches cached readers when their cache entry expires.
+    """
+    if db.get(models.Region, region_id) is None:
+        raise HTTPException(status_code=404, detail="Region not found")
+    constraints, adjustments, severity = services.evaluate_environment(data)
+    snapshot = services.environment_snapshot_row(region_id, data, constraints, adjustments, severity)
+    db.add(snapshot)
+    db.commit()
+    db.refresh(snapshot)
+    user_ids = db.execute(services.region_user_ids_statement(region_id)).scalars().all()
+    cache.invalidate_many(user_ids, cache.ENVIRONMENT_IMPACT)
+    # Score the region's users ahead of their first dashboard read
+    precompute.schedule(region_id)
+    return services.snapshot_response(snapshot)
+
+@router.get("/regions/{region_id}/environment", response_model=Optional[schemas.EnvironmentSnapshotResponse])
+def get_region_environment(region_id: int, db: Session = Depends(database.get_db)):
+    """The region's current snapshot, if any."""
+    snapshot = db.execute(services.region_snapshot_statement(region_id)).scalars().first()
+    if snapshot is None:
+        return None
+    if services.refresh_environment_policy(snapshot):
+        db.commit()
+    return services.snapshot_response(snapshot)
+
+@router.get("/decisions/{user_id}/today", response_model=Optional[schemas.DailyDecisionResponse])
+def get_today_decision(user_id: int, db: Session = Depends(database.get_db)):
+    """
+    Today's precomputed decision (see precompute.py), from the user's latest
+    check-in and current environment. null until the day's precompute has run.
+    """
+    cached, generation = services.cached_response(cache.DAILY_DECISION, user_id)
+    if cached is not None:
+        return cached
+    decision = db.execute(services.daily_decision_statement(user_id, precompute.today())).scalars().first()
+    return services.cache_response(cache.DAILY_DECISION, user_id, generation, fast_json.render(schemas.DailyDecisionResponse, decision))
+
+@router.get("/trends/{user_id}", response_model=Optional[schemas.TrendsResponse])
+def get_trends(user_id: int, db: Session = Depends(database.get_db)):
+    """
+    7- and 28-day readiness, REST-day and load aggregates with acute:chronic
+    ratios, kept up to date as check-ins are stored. null before the first check-in.
+    """
+    trend = db.execute(trends.trend_statement(user_id)).scalars().first()
+    return trends.trends_response(trend) if trend is not None else None
 
 
 # ============================================================
 # COMBINED READINESS + ENVIRONMENT ENDPOINT
 # ============================================================
 
-@app.post("/combined-readiness/", response_model=schemas.CombinedReadinessResponse)
+@router.post("/combined-readiness/", response_model=schemas.CombinedReadinessResponse)
 def get_combined_readiness(
     data: schemas.CombinedReadinessRequest,
     db: Session = Depends(database.get_db)
 ):
     """
     Combined endpoint that calculates readiness and applies environmental constraints.
-    Returns the final decision with full explainability.
+    Returns the final decision with full explainability. Leave out the
+    environment fields to apply the user's region snapshot instead.
     """
-    # 1. Calculate base readiness
-    readiness_score, base_decision, readiness_explanation = engine.calculate_readiness(
-        data.sleep_hours,
-        data.stress_level,
-        data.fatigue_level,
-        data.muscle_soreness
-    )
-    
-    # 2. Apply time constraint
-    if base_decision == "TRAIN" and data.available_time < 30:
-        base_decision = "ACTIVE_RECOVERY"
-        readiness_explanation["time_constraint"] = "Time is limited (<30m). Short recovery session recommended."
-    
-    # 3. Calculate environment impact
-    constraints, adjustments, severity = environment_engine.calculate_environment_impact(
-        aqi=data.aqi,
-        temperature_celsius=data.temperature_celsius,
-        is_heatwave=data.is_heatwave,
-        lockdown_status=data.lockdown_status.value,
-        has_local_event=data.has_local_event
-    )
-    
-    # 4. Apply environment constraints to decision
-    final_decision = environment_engine.apply_environment_to_readiness(
-        base_decision=base_decision,
-        readiness_score=readiness_score,
-        constraints=constraints,
-        severity=severity
-    )
-    
-    # 5. Store both records
-    # Store readiness
-    db_readiness = models.DailyReadiness(
-        user_id=data.user_id,
-        sleep_hours=data.sleep_hours,
-        stress_level=data.stress_level,
-        fatigue_level=data.fatigue_level,
-        muscle_soreness=data.muscle_soreness,
-        available_time=data.available_time,
-        readiness_score=readiness_score,
-        decision=final_decision,
-        explanation=environment_engine.get_combined_explanation(readiness_explanation, adjustments)
-    )
-    db.add(db_readiness)
+    # Without environment fields in the request, use the user's region
+    snapshot = None
+    if not data.has_environment_input():
+        snapshot = db.execute(services.user_snapshot_statement(data.user_id)).scalars().first()
+    content, db_readiness, db_env = services.combined_readiness(data, snapshot)
+    response = fast_json.response(fast_json.render(schemas.CombinedReadinessResponse, content))
     
-    # Store environment
-    adjustments_dict = [
-        {"rule_id": a.rule_id, "trigger": a.trigger, "action": a.action, "reason": a.reason}
-        for a in adjustments
-    ]
-    db_env = models.EnvironmentPolicy(
-        user_id=data.user_id,
-        aqi=data.aqi,
-        temperature_celsius=data.temperature_celsius,
-        is_heatwave=data.is_heatwave,
-        lockdown_status=data.lockdown_status.value,
-        has_local_event=data.has_local_event,
-        allow_outdoor=constraints.allow_outdoor,
-        max_intensity_percent=constraints.max_intensity_percent,
-        max_duration_minutes=constraints.max_duration_minutes,
-        recommended_location=constraints.recommended_location,
-        adjustments=adjustments_dict
-    )
-    db.add(db_env)
+    # Store both records (there is no per-user environment row when a snapshot was used)
+    rows = [row for row in (db_readiness, db_env) if row is not None]
+    if write_behind.buffer is not None:
+        for row in rows:
+            services.buffer_row(row)
+        return response
+    db.add_all(rows)
+    trends.record(db, [db_readiness])
+    db.flush()
+    precompute.refresh_decision(db, db_readiness, base_decision=content["base_decision"], environment=(
+        db_env or snapshot, content["final_decision"], content["environment_severity"]
+    ))
     db.commit()
+    cache.invalidate(data.user_id)
     
-    # 6. Return combined response
-    return schemas.CombinedReadinessResponse(
-        readiness_score=readiness_score,
-        base_decision=base_decision,
-        final_decision=final_decision,
-        readiness_explanation=readiness_explanation,
-        environment_adjustments=[
-            schemas.EnvironmentAdjustment(
-                rule_id=a.rule_id,
-                trigger=a.trigger,
-                action=a.action,
-                reason=a.reason
-            ) for a in adjustments
-        ],
-        constraints=schemas.WorkoutConstraints(
-            allow_outdoor=constraints.allow_outdoor,
-            max_intensity_percent=constraints.max_intensity_percent,
-            max_duration_minutes=constraints.max_duration_minutes,
-            recommended_location=schemas.RecommendedLocation(constraints.recommended_location),
-            blocked_workout_types=constraints.blocked_workout_types,
-            suggested_workout_types=constraints.suggested_workout_types
-        ),
-        environment_severity=severity
-    )
+    return response
+
+
+# ============================================================
+# ANALYTICS
+# ============================================================
+
+@router.get("/analytics/decisions", response_model=schemas.DecisionAnalyticsResponse)
+def get_decision_analytics(
+    start: Optional[date] = Query(None, description="First UTC day (default: 30 days before end)"),
+    end: Optional[date] = Query(None, description="Exclusive last UTC day (default: tomorrow)"),
+    region_id: Optional[int] = None,
+    by_region: bool = Query(False, description="One entry per day and region instead of per day"),
+    use_rollup: bool = Query(True, description="Read days covered by the daily rollup from it"),
+    db: Session = Depends(database.get_db)
+):
+    """Daily TRAIN / ACTIVE_RECOVERY / REST counts and readiness percentiles across users."""
+    start, end = services.analytics_range(start, end)
+    return analytics.decision_analytics(db, start, end, region_id, by_region, use_rollup)
+
+@router.get("/analytics/severity", response_model=schemas.SeverityAnalyticsResponse)
+def get_severity_analytics(
+    start: Optional[date] = Query(None, description="First UTC day (default: 30 days before end)"),
+    end: Optional[date] = Query(None, description="Exclusive last UTC day (default: tomorrow)"),
+    region_id: Optional[int] = None,
+    by_region: bool = Query(False, description="One entry per day and region instead of per day"),
+    use_rollup: bool = Query(True, description="Read days covered by the daily rollup from it"),
+    db: Session = Depends(database.get_db)
+):
+    """Daily counts of per-user environment rows by severity."""
+    start, end = services.analytics_range(start, end)
+    return analytics.severity_analytics(db, start, end, region_id, by_region, use_rollup)
+
+# ============================================================
+# DATA EXPORT ENDPOINTS
+# ============================================================
+
+@router.get("/export/readiness")
+def export_readiness(
+    format: schemas.ExportFormat = schemas.ExportFormat.NDJSON,
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, description="Inclusive lower bound on date"),
+    end: Optional[datetime] = Query(None, description="Exclusive upper bound on date")
+):
+    """
+    Stream readiness history as NDJSON or CSV, in id order.
+    Rows are read through a server-side cursor, so any size of export uses constant memory.
+    """
+    stream = export.stream_readiness(format.value, user_id=user_id, start=start, end=end)
+    return services.export_response(stream, format, "readiness")
+
+@router.get("/export/environment")
+def export_environment(
+    format: schemas.ExportFormat = schemas.ExportFormat.NDJSON,
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, description="Inclusive lower bound on date"),
+    end: Optional[datetime] = Query(None, description="Exclusive upper bound on date")
+):
+    """
+    Stream environment policy history as NDJSON or CSV, in id order.
+    """
+    stream = export.stream_environment(format.value, user_id=user_id, start=start, end=end)
+    return services.export_response(stream, format, "environment")
+
+
+# Serve the database endpoints from the async handlers when available
+if database.async_engine is not None:
+    from . import async_api
+    app.include_router(async_api.router)
+else:
+    app.include_router(router)
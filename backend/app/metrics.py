@@ -0,0 +1,241 @@
+"""
+Request and stage latency histograms, exposed on GET /metrics in the
+Prometheus text format.
+
+MetricsMiddleware times every request by route template and status. Inside
+a request, named stages time the parts of it (engine calls, DB
+flush/commit/queries, cache reads):
+
+    with metrics.stage("engine.readiness"):
+        ...
+
+Stage observations are labelled with the route of the request they ran in
+("" outside a request, e.g. write-behind flushes). Stages can nest (a commit
+includes its flush), so stage times don't add up to the request time.
+
+Histograms are per process, like the other /health stats: scrape every
+worker, or run a single one. METRICS_ENABLED=0 turns the middleware and
+every stage timer into no-ops; /metrics then only reports the stats.
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Seconds; fine at the low end, where engine and cache stages sit
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+# ASGI scope of the request being served; routing adds scope["route"] later,
+# so stages look it up when they finish rather than when the request starts
+_request_scope: ContextVar[Optional[dict]] = ContextVar("metrics_request_scope", default=None)
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last: +Inf), sum]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in sorted(series):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = label_text + "," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total!r}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+REQUEST_LATENCY = Histogram(
+    "app_request_duration_seconds",
+    "Time from receiving a request to sending the last of its response.",
+    ("method", "route", "status")
+)
+STAGE_LATENCY = Histogram(
+    "app_stage_duration_seconds",
+    "Time spent in a named stage of request handling.",
+    ("stage", "route")
+)
+
+def current_route() -> str:
+    scope = _request_scope.get()
+    if scope is None:
+        return ""
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE) if route is not None else UNMATCHED_ROUTE
+
+# ============================================================
+# STAGE TIMERS
+# ============================================================
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_LATENCY.observe((self.name, current_route()), time.perf_counter() - self.started)
+        return False
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_STAGE = _NoStage()
+
+def stage(name: str):
+    """Context manager timing one stage (a shared no-op when metrics are off)."""
+    return _Stage(name) if METRICS_ENABLED else _NO_STAGE
+
+def timed(name: str) -> Callable:
+    """Decorator form of stage()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def observe_stage(name: str, seconds: float):
+    """Record a stage timed elsewhere (e.g. between two SQLAlchemy events)."""
+    if METRICS_ENABLED:
+        STAGE_LATENCY.observe((name, current_route()), seconds)
+
+# ============================================================
+# MIDDLEWARE
+# ============================================================
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (no per-request task or body buffering) timing HTTP requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]  # if the app raises before starting a response
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _request_scope.reset(token)
+            route = scope.get("route")
+            REQUEST_LATENCY.observe(
+                (scope["method"], getattr(route, "path", UNMATCHED_ROUTE), str(status[0])),
+                time.perf_counter() - started
+            )
+
+# ============================================================
+# EXPOSITION
+# ============================================================
+
+# Stats entries that only ever count up (per process); exported as counters
+# so rate() and increase() handle worker restarts
+COUNTERS = frozenset({
+    "writes_sent", "writes_dropped", "invalidations_replayed", "times_opened",  # cache
+    "checkouts", "timeouts",  # db pool
+    "reloads", "lookups", "formatted_lookups",  # environment rules
+    "enqueued", "rows_written", "rows_failed", "flushes", "flush_retries", "batch_splits",
+    "backpressure_waits", "rejected",  # write-behind
+    "calls", "executions", "coalesced",  # singleflight
+})
+
+def _gauge_lines(name: str, value) -> List[str]:
+    if isinstance(value, bool):
+        value = int(value)
+    if not isinstance(value, (int, float)):
+        return []
+    return [f"# TYPE {name} gauge", f"{name} {value!r}"]
+
+def _counter_lines(name: str, value) -> List[str]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return []
+    return [f"# TYPE {name}_total counter", f"{name}_total {value!r}"]
+
+def _flatten(prefix: str, values: dict) -> List[str]:
+    """
+    Numeric (and bool) entries of a stats dict as gauges, or as `_total`
+    counters for the keys in COUNTERS; text entries are skipped.
+    """
+    lines = []
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            lines.extend(_flatten(name, value))
+        elif key in COUNTERS:
+            lines.extend(_counter_lines(name, value))
+        else:
+            lines.extend(_gauge_lines(name, value))
+    return lines
+
+def render(gauges: Dict[str, dict]) -> str:
+    """Histograms plus the given stats dicts (prefix -> stats) in the text exposition format."""
+    lines = REQUEST_LATENCY.render() + STAGE_LATENCY.render()
+    for prefix, values in gauges.items():
+        lines.extend(_flatten(prefix, values))
+    return "\n".join(lines) + "\n"
+
+def reset():
+    REQUEST_LATENCY.reset()
+    STAGE_LATENCY.reset()
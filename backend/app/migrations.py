@@ -0,0 +1,135 @@
+"""
+Schema upgrades and data maintenance. Run as a deploy step before the app
+starts (the app itself runs no DDL):
+
+    python -m app.migrations upgrade
+    python -m app.migrations compact-explanations [--dry-run]
+"""
+import json
+
+from sqlalchemy import JSON, bindparam, inspect, select, text, type_coerce, update
+from sqlalchemy.schema import CreateIndex
+
+# pg_advisory_lock key serializing upgrade runs
+UPGRADE_LOCK_KEY = 0x6d696772
+
+def _create_index(index, dialect) -> str:
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+    if dialect.name == "postgresql":
+        # Builds without blocking writes to the table; can't run inside a transaction
+        ddl = ddl.replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+    return ddl
+
+def upgrade(engine, metadata):
+    """
+    Bring a database up to the current models: create missing tables, then
+    add columns and indexes added to existing tables since they were created.
+    New columns are added as nullable; code reading them treats NULL as "not
+    computed yet". On Postgres concurrent runs take turns on an advisory
+    lock, and indexes are built CONCURRENTLY. Every statement commits on its
+    own, so a run that fails part way is resumed by the next.
+    """
+    preparer = engine.dialect.identifier_preparer
+    postgres = engine.dialect.name == "postgresql"
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": UPGRADE_LOCK_KEY})
+        try:
+            metadata.create_all(conn)
+            inspector = inspect(conn)
+            for table in metadata.sorted_tables:
+                existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    conn.execute(text(
+                        f"ALTER TABLE {preparer.format_table(table)} "
+                        f"ADD COLUMN {preparer.format_column(column)} "
+                        f"{column.type.compile(dialect=engine.dialect)}"
+                    ))
+
+                existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing_indexes:
+                        conn.execute(text(_create_index(index, engine.dialect)))
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": UPGRADE_LOCK_KEY})
+
+def compact_explanations(engine, dry_run: bool = False, chunk_size: int = 1000) -> dict:
+    """
+    Rewrite explanation / adjustments JSON stored as full text into the
+    compact form of explanations.py, reporting JSON bytes before and after
+    per table. A row is only rewritten if it decodes back to exactly the
+    stored value. With dry_run nothing is written (size comparison only).
+    """
+    from . import models
+
+    targets = [
+        (models.DailyReadiness.__table__, "explanation"),
+        (models.EnvironmentPolicy.__table__, "adjustments"),
+        (models.EnvironmentSnapshot.__table__, "adjustments"),
+    ]
+    report = {}
+    for table, column_name in targets:
+        column = table.c[column_name]
+        compact_type = column.type
+        # Raw JSON in and out, bypassing the compacting column type
+        raw = type_coerce(column, JSON)
+        stmt = update(table).where(table.c.id == bindparam("row_id"))\
+            .values({column_name: bindparam("compact", type_=JSON)})
+
+        stats = {"rows": 0, "converted": 0, "bytes_before": 0, "bytes_after": 0}
+        last_id = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(table.c.id, raw).where(table.c.id > last_id).order_by(table.c.id).limit(chunk_size)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                updates = []
+                for row_id, value in rows:
+                    stats["rows"] += 1
+                    size = len(json.dumps(value))
+                    stats["bytes_before"] += size
+                    compact = compact_type.process_bind_param(value, engine.dialect)
+                    if compact == value or compact_type.process_result_value(compact, engine.dialect) != value:
+                        stats["bytes_after"] += size
+                        continue
+                    stats["converted"] += 1
+                    stats["bytes_after"] += len(json.dumps(compact))
+                    updates.append({"row_id": row_id, "compact": compact})
+
+                if updates and not dry_run:
+                    conn.execute(stmt, updates)
+        report[table.name] = stats
+    return report
+
+if __name__ == "__main__":
+    import argparse
+
+    from . import database, explanations, models
+
+    parser = argparse.ArgumentParser(description="Database maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("upgrade", help="add missing tables, columns and indexes (deploy step)")
+    compact = commands.add_parser("compact-explanations", help="store explanation text as rule codes")
+    compact.add_argument("--dry-run", action="store_true", help="only report the size comparison")
+    compact.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    upgrade(database.engine, models.Base.metadata)
+    explanations.register_catalog(database.engine)
+    if args.command == "compact-explanations":
+        report = compact_explanations(database.engine, dry_run=args.dry_run, chunk_size=args.chunk_size)
+        for name, stats in report.items():
+            before, after = stats["bytes_before"], stats["bytes_after"]
+            print(
+                f"{name}: {stats['converted']}/{stats['rows']} rows compacted, "
+                f"{before} -> {after} bytes ({(1 - after / before) * 100 if before else 0:.1f}% smaller)"
+                + (" [dry run]" if args.dry_run else "")
+            )
@@ -1,12 +1,34 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Boolean
+from sqlalchemy import (
+    DDL, Column, Integer, String, Float, Date, DateTime, ForeignKey, JSON, Boolean, Index,
+    PrimaryKeyConstraint, UniqueConstraint, event
+)
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql import func
 from .database import Base
+from .explanations import CompactExplanation, CompactAdjustments
+
+# daily_readiness and environment_policy are range-partitioned by month on
+# Postgres (partitions.py manages the partitions); other databases keep one table.
+PARTITION_BY_DATE = {"postgresql_partition_by": "RANGE (date)"}
 
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
+    region_id = Column(Integer, ForeignKey("regions.id"), index=True)  # shared environment, if any
+
+class ExplanationCatalog(Base):
+    """
+    Templates that stored explanation and adjustment codes render from
+    (explanations.py), one row per distinct set. Append-only: rows written
+    under older rules keep rendering with their own text.
+    """
+    __tablename__ = "explanation_catalogs"
+    digest = Column(String, primary_key=True)  # of the templates
+    rules_version = Column(Integer)  # environment rules version the templates came from
+    templates = Column(JSON)  # {"readiness": {code: [key, text]}, "adjustments": {rule_id: [trigger, action, reason]}}
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class DailyReadiness(Base):
     __tablename__ = "daily_readiness"
@@ -24,14 +46,18 @@ class DailyReadiness(Base):
     # Calculated Outputs
     readiness_score = Column(Integer)
     decision = Column(String) # TRAIN, ACTIVE_RECOVERY, REST
-    explanation = Column(JSON)
+    explanation = Column(CompactExplanation)  # stored as reason codes, see explanations.py
+    environment_snapshot_id = Column(Integer, ForeignKey("environment_snapshots.id"))  # region environment applied, if any
 
-class EnvironmentPolicy(Base):
-    __tablename__ = "environment_policy"
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    date = Column(DateTime(timezone=True), server_default=func.now())
-    
+    # Newest-first history pages per user (keyset on date, id); date ranges across users (analytics)
+    __table_args__ = (
+        Index("ix_daily_readiness_user_date", user_id, date.desc(), id.desc()),
+        Index("ix_daily_readiness_date", date),
+        PARTITION_BY_DATE,
+    )
+
+class EnvironmentConditions:
+    """Environment inputs and the constraints computed from them, shared by per-user and regional rows."""
     # Environmental Inputs
     aqi = Column(Integer, default=50)
     temperature_celsius = Column(Float, default=25.0)
@@ -45,9 +71,151 @@ class EnvironmentPolicy(Base):
     max_duration_minutes = Column(Integer, default=120)
     recommended_location = Column(String, default="any")  # any, indoor, outdoor, home
     
+    severity = Column(String)  # low, moderate, high, critical
+    blocked_workout_types = Column(JSON)
+    suggested_workout_types = Column(JSON)
+    rules_version = Column(Integer)  # environment_engine.rules_version() used to compute the above
+    
     # Explainability
-    adjustments = Column(JSON, default=[])
+    adjustments = Column(CompactAdjustments, default=[])  # stored as rule IDs
+
+class EnvironmentPolicy(EnvironmentConditions, Base):
+    __tablename__ = "environment_policy"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    date = Column(DateTime(timezone=True), server_default=func.now())
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Newest-first history pages per user (keyset on date, id); date ranges across users (analytics)
+    __table_args__ = (
+        Index("ix_environment_policy_user_date", user_id, date.desc(), id.desc()),
+        Index("ix_environment_policy_date", date),
+        PARTITION_BY_DATE,
+    )
+
+class Region(Base):
+    __tablename__ = "regions"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)
+
+class EnvironmentSnapshot(EnvironmentConditions, Base):
+    """
+    Environment for every user in a region, evaluated once. A snapshot applies
+    from `date` until `valid_until` (open-ended when NULL) or a newer snapshot.
+    """
+    __tablename__ = "environment_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    region_id = Column(Integer, ForeignKey("regions.id"))
+    date = Column(DateTime(timezone=True), server_default=func.now())
+    valid_until = Column(DateTime(timezone=True))
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Current snapshot per region
+    __table_args__ = (
+        Index("ix_environment_snapshots_region_date", region_id, date.desc(), id.desc()),
+    )
+
+class DailyDecision(Base):
+    """
+    Today's decision per active user, precomputed (precompute.py) from their
+    latest check-in and current environment so dashboard reads don't score.
+    """
+    __tablename__ = "daily_decisions"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    day = Column(Date)
+    # No foreign keys into partitioned tables: Postgres can't enforce them on id alone
+    readiness_id = Column(Integer)  # baseline check-in
+    environment_snapshot_id = Column(Integer, ForeignKey("environment_snapshots.id"))
+    environment_policy_id = Column(Integer)
+    
+    readiness_score = Column(Integer)
+    base_decision = Column(String)
+    final_decision = Column(String)
+    environment_severity = Column(String)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", name="uq_daily_decisions_user_day"),
+    )
+
+class UserTrend(Base):
+    """
+    Rolling per-user aggregates (trends.py): one slot per day for the last
+    TREND_SLOTS days, in ring-buffer arrays indexed by day ordinal, so a
+    check-in updates a constant number of values however long the history.
+    """
+    __tablename__ = "user_trends"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    last_day = Column(Date)  # newest day in the slots; older slots are cleared as days pass
+    
+    score_sums = Column(JSON)  # sum of readiness scores per day
+    checkins = Column(JSON)  # check-ins per day
+    rest_days = Column(JSON)  # 1 if any check-in that day was prescribed REST
+    load_minutes = Column(JSON)  # available_time of check-ins not prescribed REST
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class DecisionRollup(Base):
+    """
+    Daily decision counts and readiness percentiles (analytics.py), per region
+    and across all users. Percentiles don't combine, so both groupings are stored.
+    """
+    __tablename__ = "decision_rollup"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date)
+    all_regions = Column(Boolean)  # every user that day; region_id is unused
+    region_id = Column(Integer)  # user's region when rolled up; NULL without one
+    checkins = Column(Integer)
+    decisions = Column(JSON)  # decision -> check-ins
+    score_sum = Column(Integer)
+    p10_readiness = Column(Integer)
+    p50_readiness = Column(Integer)
+    p90_readiness = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_decision_rollup_day_region", day, all_regions, region_id),
+    )
+
+class SeverityRollup(Base):
+    """Environment rows per UTC day, region and severity (analytics.py)."""
+    __tablename__ = "severity_rollup"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date)
+    region_id = Column(Integer)
+    severity = Column(String)
+    records = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_severity_rollup_day_region", day, region_id),
+    )
+
+class RollupCoverage(Base):
+    """Days a rollup table holds complete data for; analytics reads raw rows outside them."""
+    __tablename__ = "rollup_coverage"
+    name = Column(String, primary_key=True)  # rollup table name
+    first_day = Column(Date)
+    last_day = Column(Date)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# ============================================================
+# PARTITIONING (Postgres)
+# ============================================================
+
+@compiles(PrimaryKeyConstraint, "postgresql")
+def _partitioned_primary_key(constraint, compiler, **kw):
+    # A partitioned table's primary key must include the partition key; the
+    # ORM keeps identifying rows by id alone
+    table = constraint.table
+    if table is None or not table.dialect_options["postgresql"].get("partition_by"):
+        return compiler.visit_primary_key_constraint(constraint, **kw)
+    columns = [c.name for c in constraint.columns] + ["date"]
+    return f"PRIMARY KEY ({', '.join(compiler.preparer.quote(name) for name in columns)})"
+
+for _table in (DailyReadiness.__table__, EnvironmentPolicy.__table__):
+    # Rows outside every monthly partition land here until partitions.ensure_partitions() moves them
+    event.listen(_table, "after_create", DDL(
+        "CREATE TABLE IF NOT EXISTS %(table)s_default PARTITION OF %(table)s DEFAULT"
+    ).execute_if(dialect="postgresql"))
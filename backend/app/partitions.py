@@ -0,0 +1,404 @@
+"""
+Monthly partitions and retention for daily_readiness and environment_policy.
+
+On Postgres both tables are range-partitioned on `date`, one partition per
+UTC month (`daily_readiness_p2026_10`) plus a DEFAULT partition; queries
+filtered on date only touch the months they need. Other databases (SQLite
+in tests) keep one table per model, indexed on date, and the same month
+boundaries apply logically: archiving a month deletes its date range.
+
+Months older than RETENTION_MONTHS are archived: written to gzip NDJSON
+under ARCHIVE_DIR as stored (explanations stay in compact form), then the
+partition is dropped. Archives can be queried in place or re-imported.
+Partitions are created ahead by cron, never at app startup; rows for a month
+without one land in DEFAULT and are moved out by the next `ensure`.
+
+    python -m app.partitions ensure                    # create upcoming partitions (cron, at least monthly)
+    python -m app.partitions convert                   # partition existing Postgres tables
+    python -m app.partitions archive [--retention-months N] [--dry-run]
+    python -m app.partitions list
+    python -m app.partitions query TABLE YYYY-MM [--user-id ID]
+    python -m app.partitions restore TABLE YYYY-MM
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import JSON, DateTime, delete, func, insert, inspect, select, text, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+from . import database, models, cache
+
+logger = logging.getLogger(__name__)
+
+RETENTION_MONTHS = int(os.getenv("RETENTION_MONTHS", 13))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# Partitions created ahead of time, so rows never wait on DDL
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 2))
+ARCHIVE_CHUNK_SIZE = 5000
+
+# pg_advisory_xact_lock key serializing ensure_partitions runs
+ENSURE_LOCK_KEY = 0x70617274
+
+PARTITIONED = {model.__tablename__: model for model in (models.DailyReadiness, models.EnvironmentPolicy)}
+
+# Cached reads that may include a table's rows
+INVALIDATES = {
+    "daily_readiness": cache.READINESS_PAGE,
+    "environment_policy": cache.ENVIRONMENT_IMPACT,
+}
+
+# ============================================================
+# MONTHS
+# ============================================================
+
+def month_of(value) -> date:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        value = value.date()
+    return value.replace(day=1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def month_bounds(month: date):
+    """[start, end) of a UTC month as timestamps."""
+    return (
+        datetime.combine(month, datetime.min.time(), timezone.utc),
+        datetime.combine(add_months(month, 1), datetime.min.time(), timezone.utc)
+    )
+
+def parse_month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+def partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_p{month:%Y_%m}"
+
+def _postgres(engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+def _oldest_month(conn, table_name: str) -> Optional[date]:
+    oldest = conn.execute(select(func.min(PARTITIONED[table_name].date))).scalar()
+    if isinstance(oldest, str):  # SQLite aggregates come back as text
+        oldest = datetime.fromisoformat(oldest)
+    return month_of(oldest) if oldest is not None else None
+
+# ============================================================
+# POSTGRES PARTITIONS
+# ============================================================
+
+def is_partitioned(conn, table_name: str) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {"name": table_name}).first() is not None
+
+def _first_month(oldest: Optional[datetime]) -> date:
+    """First month needing a partition: the oldest row's, or this month."""
+    current = month_of(datetime.now(timezone.utc))
+    return min(month_of(oldest), current) if oldest is not None else current
+
+def _exists(conn, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None
+
+def _create_partition(conn, table_name: str, month: date):
+    """
+    Create one month's partition. Rows already sitting in the DEFAULT
+    partition for that month are moved into it (Postgres refuses to create
+    the partition while DEFAULT holds rows in its range).
+    """
+    name = partition_name(table_name, month)
+    start, end = month_bounds(month)
+    bounds = {"start": start, "end": end}
+    default = f"{table_name}_default"
+    stray = conn.execute(
+        text(f"SELECT 1 FROM {default} WHERE date >= :start AND date < :end LIMIT 1"), bounds
+    ).first() is not None
+    values = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    if not stray:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} {values}"))
+        return
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE {table_name} INCLUDING DEFAULTS)"))
+    conn.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE date >= :start AND date < :end"), bounds)
+    conn.execute(text(f"DELETE FROM {default} WHERE date >= :start AND date < :end"), bounds)
+    conn.execute(text(f"ALTER TABLE {table_name} ATTACH PARTITION {name} {values}"))
+    logger.info("%s: moved rows from %s into new partition %s", table_name, default, name)
+
+def ensure_partitions(engine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """
+    Create missing monthly partitions from the oldest row in each DEFAULT
+    partition through months_ahead months from now. No-op except on Postgres.
+    Concurrent runs (overlapping cron jobs, deploys) take turns on an
+    advisory lock, so each sees the partitions the previous one created.
+    Returns the partitions created.
+    """
+    if not _postgres(engine):
+        return []
+    created = []
+    last = add_months(month_of(datetime.now(timezone.utc)), months_ahead)
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ENSURE_LOCK_KEY})
+        for table_name in PARTITIONED:
+            if not is_partitioned(conn, table_name):
+                continue
+            oldest = conn.execute(text(f"SELECT min(date) FROM {table_name}_default")).scalar()
+            month = _first_month(oldest)
+            while month <= last:
+                name = partition_name(table_name, month)
+                if not _exists(conn, name):
+                    _create_partition(conn, table_name, month)
+                    created.append(name)
+                month = add_months(month, 1)
+    return created
+
+def convert(engine) -> Dict[str, int]:
+    """
+    Turn existing unpartitioned Postgres tables into partitioned ones, copying
+    every row, in one transaction per table. Writes to the table block while it
+    runs. Foreign keys that other tables declared on it are dropped.
+    """
+    if not _postgres(engine):
+        raise RuntimeError("Partitioning is only supported on Postgres")
+    report = {}
+    for table_name, model in PARTITIONED.items():
+        with engine.begin() as conn:
+            if not inspect(conn).has_table(table_name) or is_partitioned(conn, table_name):
+                continue
+            started = time.perf_counter()
+            legacy = f"{table_name}_unpartitioned"
+            conn.execute(text(f"LOCK TABLE {table_name} IN ACCESS EXCLUSIVE MODE"))
+            # Free the index, constraint and sequence names for the new table
+            for index in inspect(conn).get_indexes(table_name):
+                conn.execute(text(f'ALTER INDEX "{index["name"]}" RENAME TO "{index["name"]}_unpartitioned"'))
+            conn.execute(text(f"ALTER TABLE {table_name} RENAME CONSTRAINT {table_name}_pkey TO {legacy}_pkey"))
+            conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {legacy}"))
+            sequence = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": legacy}).scalar()
+
+            model.__table__.create(conn)
+            month = _first_month(conn.execute(text(f"SELECT min(date) FROM {legacy}")).scalar())
+            last = add_months(month_of(datetime.now(timezone.utc)), PARTITION_MONTHS_AHEAD)
+            while month <= last:
+                _create_partition(conn, table_name, month)
+                month = add_months(month, 1)
+
+            columns = ", ".join(f'"{c.name}"' for c in model.__table__.columns)
+            copied = conn.execute(text(f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {legacy}")).rowcount
+            # New ids continue after the copied ones
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+                f"(SELECT coalesce(max(id), 0) + 1 FROM {table_name}), false)"
+            ))
+            conn.execute(text(f"DROP TABLE {legacy} CASCADE"))
+            if sequence:
+                conn.execute(text(f"DROP SEQUENCE IF EXISTS {sequence}"))
+            report[table_name] = copied
+            logger.info("%s: partitioned, %d rows copied in %.1fs", table_name, copied, time.perf_counter() - started)
+    return report
+
+# ============================================================
+# ARCHIVES
+# ============================================================
+
+def archive_path(table_name: str, month: date, archive_dir: str = ARCHIVE_DIR) -> str:
+    return os.path.join(archive_dir, table_name, f"{month:%Y-%m}.ndjson.gz")
+
+def _stored_columns(table):
+    """Columns as stored: compact explanation/adjustment JSON is archived without decoding."""
+    return [
+        type_coerce(column, JSON).label(column.name) if isinstance(column.type, TypeDecorator) else column
+        for column in table.columns
+    ]
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _write_archive(conn, table, month: date, path: str):
+    """Write the month's rows to path; returns (rows, user ids)."""
+    start, end = month_bounds(month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    rows, user_ids = 0, set()
+    result = conn.execute(
+        select(*_stored_columns(table))
+        .where(table.c.date >= start, table.c.date < end)
+        .order_by(table.c.id)
+        .execution_options(stream_results=True, yield_per=ARCHIVE_CHUNK_SIZE)
+    )
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for chunk in result.partitions():
+            for row in chunk:
+                values = row._asdict()
+                user_ids.add(values["user_id"])
+                f.write(json.dumps(values, default=_json_default) + "\n")
+            rows += len(chunk)
+    os.replace(tmp, path)
+    return rows, user_ids
+
+def archive_month(engine, table_name: str, month: date, archive_dir: str = ARCHIVE_DIR) -> dict:
+    """
+    Archive one month of a table, then remove it from the database: drop the
+    partition on Postgres, delete the date range elsewhere. The rows are only
+    removed if the month still has exactly the rows written.
+    """
+    model = PARTITIONED[table_name]
+    table = model.__table__
+    path = archive_path(table_name, month, archive_dir)
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists; restore or move it before archiving {month:%Y-%m} again")
+    start, end = month_bounds(month)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        rows, user_ids = _write_archive(conn, table, month, path)
+        in_range = select(func.count()).select_from(table).where(table.c.date >= start, table.c.date < end)
+        if conn.execute(in_range).scalar() != rows:
+            os.remove(path)
+            raise RuntimeError(f"{table_name} {month:%Y-%m} changed while archiving; nothing removed")
+        partition = partition_name(table_name, month)
+        if _postgres(engine) and _exists(conn, partition):
+            conn.execute(text(f"DROP TABLE {partition}"))
+        # Stray rows in the DEFAULT partition, or the whole month without partitioning
+        conn.execute(delete(table).where(table.c.date >= start, table.c.date < end))
+    cache.invalidate_many(user_ids, INVALIDATES[table_name])
+    return {
+        "table": table_name,
+        "month": f"{month:%Y-%m}",
+        "rows": rows,
+        "bytes": os.path.getsize(path),
+        "path": path,
+        "elapsed_s": round(time.perf_counter() - started, 3)
+    }
+
+def archive_cold(engine, retention_months: int = RETENTION_MONTHS, archive_dir: str = ARCHIVE_DIR,
+                 dry_run: bool = False) -> List[dict]:
+    """Archive every month that ended more than retention_months months ago."""
+    cutoff = add_months(month_of(datetime.now(timezone.utc)), -retention_months)
+    report = []
+    for table_name in PARTITIONED:
+        with engine.connect() as conn:
+            month = _oldest_month(conn, table_name)
+        while month is not None and month < cutoff:
+            if dry_run:
+                start, end = month_bounds(month)
+                table = PARTITIONED[table_name].__table__
+                with engine.connect() as conn:
+                    rows = conn.execute(
+                        select(func.count()).select_from(table).where(table.c.date >= start, table.c.date < end)
+                    ).scalar()
+                report.append({"table": table_name, "month": f"{month:%Y-%m}", "rows": rows, "dry_run": True})
+            else:
+                report.append(archive_month(engine, table_name, month, archive_dir))
+            month = add_months(month, 1)
+    return report
+
+def archived_months(archive_dir: str = ARCHIVE_DIR) -> Dict[str, List[str]]:
+    suffix = ".ndjson.gz"
+    found = {}
+    for table_name in PARTITIONED:
+        directory = os.path.join(archive_dir, table_name)
+        names = os.listdir(directory) if os.path.isdir(directory) else []
+        found[table_name] = sorted(name[:-len(suffix)] for name in names if name.endswith(suffix))
+    return found
+
+def read_archive(table_name: str, month: date, user_id: Optional[int] = None,
+                 archive_dir: str = ARCHIVE_DIR) -> Iterator[dict]:
+    """Rows of an archived month as stored (explanations in compact form), optionally for one user."""
+    with gzip.open(archive_path(table_name, month, archive_dir), "rt", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            if user_id is None or row["user_id"] == user_id:
+                yield row
+
+def restore_month(engine, table_name: str, month: date, archive_dir: str = ARCHIVE_DIR) -> dict:
+    """
+    Re-import an archived month with its original ids. Refuses if the month
+    already has rows. The archive file is kept.
+    """
+    model = PARTITIONED[table_name]
+    table = model.__table__
+    start, end = month_bounds(month)
+    datetime_columns = [c.name for c in table.columns if isinstance(c.type, DateTime)]
+    started = time.perf_counter()
+    rows, user_ids = 0, set()
+    with engine.begin() as conn:
+        existing = conn.execute(
+            select(func.count()).select_from(table).where(table.c.date >= start, table.c.date < end)
+        ).scalar()
+        if existing:
+            raise RuntimeError(f"{table_name} already has {existing} rows in {month:%Y-%m}")
+        if _postgres(engine) and is_partitioned(conn, table_name) and not _exists(conn, partition_name(table_name, month)):
+            _create_partition(conn, table_name, month)
+
+        # Compact values pass through the column types unchanged
+        stmt = insert(table)
+        batch = []
+        for row in read_archive(table_name, month, archive_dir=archive_dir):
+            for name in datetime_columns:
+                if row.get(name) is not None:
+                    row[name] = datetime.fromisoformat(row[name])
+            user_ids.add(row["user_id"])
+            batch.append(row)
+            if len(batch) >= ARCHIVE_CHUNK_SIZE:
+                conn.execute(stmt, batch)
+                rows += len(batch)
+                batch = []
+        if batch:
+            conn.execute(stmt, batch)
+            rows += len(batch)
+    cache.invalidate_many(user_ids, INVALIDATES[table_name])
+    return {
+        "table": table_name,
+        "month": f"{month:%Y-%m}",
+        "rows": rows,
+        "elapsed_s": round(time.perf_counter() - started, 3)
+    }
+
+if __name__ == "__main__":
+    from . import migrations
+
+    parser = argparse.ArgumentParser(description="Partitions and retention for check-in history")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("ensure", help="create upcoming monthly partitions (Postgres)")
+    commands.add_parser("convert", help="partition existing unpartitioned tables (Postgres)")
+    archive = commands.add_parser("archive", help="archive months older than the retention period")
+    archive.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    archive.add_argument("--dry-run", action="store_true", help="only list what would be archived")
+    commands.add_parser("list", help="list archived months")
+    query = commands.add_parser("query", help="print an archived month's rows as NDJSON")
+    restore = commands.add_parser("restore", help="re-import an archived month")
+    for command in (query, restore):
+        command.add_argument("table", choices=list(PARTITIONED))
+        command.add_argument("month", type=parse_month, help="YYYY-MM")
+    query.add_argument("--user-id", type=int)
+    for command in commands.choices.values():
+        command.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.command == "query":
+        for row in read_archive(args.table, args.month, args.user_id, args.archive_dir):
+            sys.stdout.write(json.dumps(row) + "\n")
+        sys.exit(0)
+    if args.command == "list":
+        print(json.dumps(archived_months(args.archive_dir), indent=2))
+        sys.exit(0)
+
+    migrations.upgrade(database.engine, models.Base.metadata)
+    if args.command == "ensure":
+        print(json.dumps(ensure_partitions(database.engine)))
+    elif args.command == "convert":
+        print(json.dumps(convert(database.engine)))
+    elif args.command == "archive":
+        report = archive_cold(database.engine, args.retention_months, args.archive_dir, args.dry_run)
+        print(json.dumps(report, indent=2))
+    elif args.command == "restore":
+        print(json.dumps(restore_month(database.engine, args.table, args.month, args.archive_dir)))
@@ -0,0 +1,290 @@
+"""
+Precompute today's decision for every active user (models.DailyDecision).
+
+Run it from the command line (cron, one job for the whole deployment):
+
+    python -m app.precompute [--region ID] [--workers N] [--chunk-size N]
+
+PRECOMPUTE_ON_SNAPSHOT=1 also runs it in the web process when a region
+publishes an environment snapshot, for that region's users; runs are only
+de-duplicated within a process, so leave it off with several workers.
+A check-in updates its user's row for today as it is stored (refresh_decision).
+
+Users are split into chunks scored in a process pool; each chunk reads the
+users' latest check-ins and environment, scores the check-ins in one
+vectorized pass, applies the environment and replaces the day's rows.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+
+from . import database, models, schemas, engine, environment_engine, migrations, services, cache
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_ON_SNAPSHOT = os.getenv("PRECOMPUTE_ON_SNAPSHOT", "0") == "1"
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", min(4, os.cpu_count() or 1)))
+PRECOMPUTE_CHUNK_SIZE = int(os.getenv("PRECOMPUTE_CHUNK_SIZE", 5000))
+# Users with a check-in in this many days count as active
+PRECOMPUTE_ACTIVE_DAYS = int(os.getenv("PRECOMPUTE_ACTIVE_DAYS", 14))
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+def active_user_ids(db, region_id: Optional[int] = None, days: int = PRECOMPUTE_ACTIVE_DAYS) -> List[int]:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    stmt = select(models.DailyReadiness.user_id)\
+        .where(models.DailyReadiness.date >= cutoff)\
+        .distinct()
+    if region_id is not None:
+        stmt = stmt.join(models.User, models.User.id == models.DailyReadiness.user_id)\
+            .where(models.User.region_id == region_id)
+    return sorted(db.execute(stmt).scalars())
+
+def _latest(model, user_ids):
+    """Ids of each user's newest row (ids grow with time)."""
+    return select(func.max(model.id)).where(model.user_id.in_(user_ids)).group_by(model.user_id)
+
+def compute_chunk(user_ids: List[int], day: date) -> int:
+    """Score one chunk of users and replace their DailyDecision rows for `day`. Returns rows written."""
+    db = database.SessionLocal()
+    try:
+        checkins = db.execute(
+            select(
+                models.DailyReadiness.id,
+                models.DailyReadiness.user_id,
+                models.DailyReadiness.sleep_hours,
+                models.DailyReadiness.stress_level,
+                models.DailyReadiness.fatigue_level,
+                models.DailyReadiness.muscle_soreness,
+                models.DailyReadiness.available_time
+            ).where(models.DailyReadiness.id.in_(_latest(models.DailyReadiness, user_ids)))
+        ).all()
+        if not checkins:
+            return 0
+
+        # Environment: the user's latest policy row or their region's current snapshot
+        regions = dict(db.execute(
+            select(models.User.id, models.User.region_id).where(models.User.id.in_(user_ids))
+        ).all())
+        snapshots = {
+            region_id: db.execute(services.region_snapshot_statement(region_id)).scalars().first()
+            for region_id in set(regions.values()) if region_id is not None
+        }
+        policies = {
+            policy.user_id: policy for policy in db.execute(
+                select(models.EnvironmentPolicy)
+                .where(models.EnvironmentPolicy.id.in_(_latest(models.EnvironmentPolicy, user_ids)))
+            ).scalars()
+        }
+        # Users with neither get the default environment inputs
+        default_environment = services.evaluate_environment(schemas.EnvironmentInputCreate.model_construct(user_id=0))
+
+        scores, decisions, _ = engine.calculate_readiness_batch(*(
+            [row[i] for row in checkins] for i in range(2, 7)
+        ))
+
+        evaluated = {}
+        rows = []
+        for row, score, decision in zip(checkins, scores.tolist(), decisions.tolist()):
+            source = services.newest_environment(policies.get(row.user_id), snapshots.get(regions.get(row.user_id)))
+            if source is None:
+                constraints, _, severity = default_environment
+            else:
+                # Region snapshots are shared by many users: resolve each once
+                key = (type(source), source.id)
+                if key not in evaluated:
+                    evaluated[key] = services.stored_environment(source)
+                constraints, _, severity = evaluated[key]
+            base_decision = engine.DECISIONS[decision]
+            rows.append({
+                "user_id": row.user_id,
+                "day": day,
+                "readiness_id": row.id,
+                "environment_snapshot_id": source.id if isinstance(source, models.EnvironmentSnapshot) else None,
+                "environment_policy_id": source.id if isinstance(source, models.EnvironmentPolicy) else None,
+                "readiness_score": score,
+                "base_decision": base_decision,
+                "final_decision": environment_engine.apply_environment_to_readiness(
+                    base_decision=base_decision,
+                    readiness_score=score,
+                    constraints=constraints,
+                    severity=severity
+                ),
+                "environment_severity": severity
+            })
+
+        db.execute(
+            delete(models.DailyDecision)
+            .where(models.DailyDecision.day == day)
+            .where(models.DailyDecision.user_id.in_([r["user_id"] for r in rows]))
+        )
+        db.execute(insert(models.DailyDecision.__table__), rows)
+        db.commit()
+    finally:
+        db.close()
+    return len(rows)
+
+def precompute_decisions(region_id: Optional[int] = None, workers: int = PRECOMPUTE_WORKERS,
+                         chunk_size: int = PRECOMPUTE_CHUNK_SIZE, day: Optional[date] = None) -> dict:
+    """Precompute `day`'s (default today's) decisions for active users, optionally of one region."""
+    started = time.perf_counter()
+    day = day or today()
+    db = database.SessionLocal()
+    try:
+        user_ids = active_user_ids(db, region_id)
+    finally:
+        db.close()
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    scope = f"region {region_id}" if region_id is not None else "all regions"
+    logger.info("Precomputing %s decisions for %d active users (%s) in %d chunks",
+                day, len(user_ids), scope, len(chunks))
+
+    written = 0
+    done = 0
+
+    def progress(rows: int, chunk: List[int]):
+        nonlocal written, done
+        # Invalidated here rather than in pool workers, which may hold their own cache client
+        cache.invalidate_many(chunk, cache.DAILY_DECISION)
+        written += rows
+        done += len(chunk)
+        elapsed = time.perf_counter() - started
+        logger.info("Precompute progress: %d/%d users (%.0f%%), %.0f users/s, %.1fs elapsed",
+                    done, len(user_ids), 100 * done / len(user_ids), done / elapsed if elapsed else 0, elapsed)
+
+    # Pool workers can't see an in-memory database
+    if workers <= 1 or len(chunks) <= 1 or database.is_in_memory(database.SQLALCHEMY_DATABASE_URL):
+        for chunk in chunks:
+            progress(compute_chunk(chunk, day), chunk)
+    else:
+        # spawn: the caller may be a threaded web worker, which isn't fork-safe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            futures = {pool.submit(compute_chunk, chunk, day): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                progress(future.result(), futures[future])
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "day": day.isoformat(),
+        "region_id": region_id,
+        "users": len(user_ids),
+        "decisions_written": written,
+        "chunks": len(chunks),
+        "elapsed_s": round(elapsed, 3),
+        "users_per_s": round(len(user_ids) / elapsed, 1) if elapsed else 0.0
+    }
+    logger.info("Precompute finished: %s", summary)
+    return summary
+
+def _get(row, name: str):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+def refresh_decision(db, checkin, base_decision: Optional[str] = None, environment=None) -> bool:
+    """
+    Point the user's DailyDecision for today at a check-in being stored, in
+    db's transaction (before its commit), so a check-in made after the day's
+    precompute is reflected. Only an existing row is updated; users without
+    one are left to the next precompute. Returns whether a row was updated.
+
+    checkin is the DailyReadiness row or its values, with an id (flush first).
+    base_decision is its decision before the environment (scored from its
+    inputs if not given). environment is the (source row or None,
+    final_decision, severity) the handler applied; without it the environment
+    today's row was computed with is applied again.
+    """
+    user_id, day = _get(checkin, "user_id"), today()
+    current = db.execute(services.daily_decision_statement(user_id, day)).scalars().first()
+    if current is None:
+        return False
+    score = _get(checkin, "readiness_score")
+    if base_decision is None:
+        base_decision = services.score_checkin(SimpleNamespace(**checkin) if isinstance(checkin, dict) else checkin)[1]
+
+    if environment is not None:
+        source, final_decision, severity = environment
+    else:
+        source = None
+        if current.environment_snapshot_id is not None:
+            source = db.get(models.EnvironmentSnapshot, current.environment_snapshot_id)
+        elif current.environment_policy_id is not None:
+            source = db.get(models.EnvironmentPolicy, current.environment_policy_id)
+        if source is not None:
+            constraints, _, severity = services.stored_environment(source)
+        else:
+            constraints, _, severity = services.evaluate_environment(
+                schemas.EnvironmentInputCreate.model_construct(user_id=user_id)
+            )
+        final_decision = environment_engine.apply_environment_to_readiness(
+            base_decision=base_decision,
+            readiness_score=score,
+            constraints=constraints,
+            severity=severity
+        )
+
+    # By key rather than through `current`: a concurrent precompute may have replaced the row
+    db.execute(
+        update(models.DailyDecision)
+        .where(models.DailyDecision.user_id == user_id, models.DailyDecision.day == day)
+        .values(
+            readiness_id=_get(checkin, "id"),
+            environment_snapshot_id=source.id if isinstance(source, models.EnvironmentSnapshot) else None,
+            environment_policy_id=source.id if isinstance(source, models.EnvironmentPolicy) else None,
+            readiness_score=score,
+            base_decision=base_decision,
+            final_decision=final_decision,
+            environment_severity=severity,
+            computed_at=func.now()
+        )
+    )
+    return True
+
+_running = set()
+_running_lock = threading.Lock()
+
+def schedule(region_id: Optional[int]) -> bool:
+    """
+    Precompute in a background thread of this process (after a snapshot
+    arrives). Skipped if a run for the same region is already going.
+    """
+    if not PRECOMPUTE_ON_SNAPSHOT:
+        return False
+    with _running_lock:
+        if region_id in _running:
+            return False
+        _running.add(region_id)
+
+    def run():
+        try:
+            precompute_decisions(region_id)
+        except Exception:
+            logger.exception("Precompute for region %s failed", region_id)
+        finally:
+            with _running_lock:
+                _running.discard(region_id)
+
+    threading.Thread(target=run, name=f"precompute-{region_id}", daemon=True).start()
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute today's decision for active users")
+    parser.add_argument("--region", type=int, help="only users in this region")
+    parser.add_argument("--workers", type=int, default=PRECOMPUTE_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=PRECOMPUTE_CHUNK_SIZE)
+    parser.add_argument("--day", type=date.fromisoformat, help="YYYY-MM-DD (default: today, UTC)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    migrations.upgrade(database.engine, models.Base.metadata)
+    precompute_decisions(args.region, workers=args.workers, chunk_size=args.chunk_size, day=args.day)
+    cache.client.close()
@@ -0,0 +1,167 @@
+"""
+Opt-in cProfile capture of live requests.
+
+A request is profiled when it carries the admin header
+
+    X-Profile: <PROFILE_TOKEN>
+
+or is picked at random at PROFILE_SAMPLE_RATE (0-1; 0 by default). Either
+way at most one request per process is profiled at a time; others run
+untouched. Each profile is written as a pstats dump to PROFILE_DIR,
+
+    PROFILE_DIR/20261018T101501.123456Z-get_environment_history-41ms-1234.prof
+
+and the oldest dumps are deleted past PROFILE_MAX_FILES or PROFILE_MAX_BYTES.
+Header-requested responses name their file in X-Profile-File. Read dumps
+with pstats, snakeviz or `python -m app.profiling top FILE`.
+
+What a profile covers depends on the handler: for a sync handler the
+endpoint call in its threadpool thread (engine, services, DB), for an async
+handler the whole request on the event loop thread, which also samples any
+other coroutines that ran while it awaited. Work an async handler sends to
+the threadpool is not included.
+"""
+import argparse
+import asyncio
+import cProfile
+import functools
+import hmac
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # unset: the header is ignored
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", 100 * 1024 * 1024))
+
+PROFILE_HEADER = "x-profile"
+PROFILE_FILE_HEADER = "X-Profile-File"
+
+# cProfile hooks are per thread and one profiler at a time keeps dumps readable
+_slot = threading.Lock()
+_current: ContextVar[Optional[cProfile.Profile]] = ContextVar("profiling_current", default=None)
+
+def requested(request) -> bool:
+    token = request.headers.get(PROFILE_HEADER)
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+def sampled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+# ============================================================
+# STORAGE
+# ============================================================
+
+def save(profiler: cProfile.Profile, route_name: str, elapsed: float, directory: str = PROFILE_DIR) -> str:
+    """Dump a profile and rotate the directory; returns the file name."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
+    name = f"{stamp}-{route_name}-{round(elapsed * 1000)}ms-{os.getpid()}.prof"
+    path = os.path.join(directory, name)
+    profiler.dump_stats(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    rotate(directory)
+    return name
+
+def rotate(directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES, max_bytes: int = PROFILE_MAX_BYTES):
+    """Delete the oldest dumps until both caps hold (names sort by time)."""
+    entries = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".prof"):
+            try:
+                entries.append((name, os.path.getsize(os.path.join(directory, name))))
+            except FileNotFoundError:  # rotated by another worker
+                continue
+    total = sum(size for _, size in entries)
+    while entries and (len(entries) > max_files or total > max_bytes):
+        name, size = entries.pop(0)
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+# ============================================================
+# ROUTE CLASS
+# ============================================================
+
+def _profiled_endpoint(endpoint):
+    """Sync endpoints run in the threadpool: profile them in that thread when their request is."""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profiler = _current.get()
+        if profiler is None:
+            return endpoint(*args, **kwargs)
+        return profiler.runcall(endpoint, *args, **kwargs)
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """APIRoute that can profile its requests (see module docstring); pass as route_class."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        self._profile_in_loop = asyncio.iscoroutinefunction(endpoint)
+        if not self._profile_in_loop:
+            endpoint = _profiled_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route_name = self.name
+
+        async def profiled_handler(request):
+            header = requested(request)
+            if not (header or sampled()) or not _slot.acquire(blocking=False):
+                return await handler(request)
+            try:
+                profiler = cProfile.Profile()
+                token = _current.set(profiler)
+                started = time.perf_counter()
+                try:
+                    if self._profile_in_loop:
+                        profiler.enable()
+                        try:
+                            response = await handler(request)
+                        finally:
+                            profiler.disable()
+                    else:
+                        response = await handler(request)
+                finally:
+                    _current.reset(token)
+                name = await run_in_threadpool(save, profiler, route_name, time.perf_counter() - started)
+            finally:
+                _slot.release()
+            if header:
+                response.headers[PROFILE_FILE_HEADER] = name
+            return response
+
+        return profiled_handler
+
+if __name__ == "__main__":
+    import pstats
+
+    parser = argparse.ArgumentParser(description="Inspect captured request profiles")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="profiles in PROFILE_DIR, oldest first")
+    top_parser = commands.add_parser("top", help="print the most expensive functions of a profile")
+    top_parser.add_argument("file", help="a .prof file (or its name in PROFILE_DIR)")
+    top_parser.add_argument("--sort", default="cumulative")
+    top_parser.add_argument("--limit", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        if os.path.isdir(PROFILE_DIR):
+            for name in sorted(os.listdir(PROFILE_DIR)):
+                if name.endswith(".prof"):
+                    print(name)
+    else:
+        path = args.file if os.path.exists(args.file) else os.path.join(PROFILE_DIR, args.file)
+        pstats.Stats(path).sort_stats(args.sort).print_stats(args.limit)
@@ -0,0 +1,347 @@
+"""
+Re-score stored rows after the readiness or environment rules change.
+
+    python -m app.rescore [readiness|environment|all] [--dry-run] [--workers N]
+                          [--chunk-size N] [--rate ROWS_PER_S] [--checkpoint PATH] [--reset]
+
+Rows are read in primary-key ranges and re-scored in a process pool; rows
+whose stored outcome differs are written back with one bulk UPDATE per
+range. Progress is checkpointed after every range, so an interrupted run
+continues where it stopped. --dry-run only counts what would change, and
+--rate caps rows scanned per second for runs against a busy database.
+
+Combined check-ins whose environment isn't linked (no
+environment_snapshot_id) can't be re-derived and are left unchanged.
+
+Cached reads of the users whose rows changed are invalidated per range.
+After a run that changed rows, the tables derived from them are rebuilt:
+trends (check-ins of the last TREND_SLOTS days), today's precomputed
+decisions and the analytics rollups over the days they cover. With
+--skip-derived that is left to the equivalent commands:
+
+    python -m app.trends rebuild
+    python -m app.precompute
+    python -m app.analytics refresh --all
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, select, update
+
+from . import database, models, engine, environment_engine, services, cache, trends, precompute, analytics
+
+logger = logging.getLogger(__name__)
+
+RESCORE_WORKERS = int(os.getenv("RESCORE_WORKERS", min(4, os.cpu_count() or 1)))
+RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", 2000))
+RESCORE_CHECKPOINT = os.getenv("RESCORE_CHECKPOINT", "rescore.checkpoint.json")
+
+TARGETS = {
+    "readiness": [models.DailyReadiness],
+    "environment": [models.EnvironmentPolicy, models.EnvironmentSnapshot],
+}
+MODELS = {model.__tablename__: model for models_ in TARGETS.values() for model in models_}
+
+# Cached reads made stale by re-scoring each table's rows
+INVALIDATES = {
+    models.DailyReadiness.__tablename__: (cache.READINESS_PAGE, cache.DAILY_DECISION),
+    models.EnvironmentPolicy.__tablename__: (cache.ENVIRONMENT_IMPACT, cache.DAILY_DECISION),
+    models.EnvironmentSnapshot.__tablename__: (cache.ENVIRONMENT_IMPACT, cache.DAILY_DECISION),
+}
+
+# Stored outcome columns recomputed for environment rows
+ENVIRONMENT_OUTPUTS = (
+    "allow_outdoor", "max_intensity_percent", "max_duration_minutes", "recommended_location",
+    "blocked_workout_types", "suggested_workout_types", "severity", "rules_version", "adjustments"
+)
+
+def _readiness_updates(db, start_id: int, end_id: int) -> Dict[str, object]:
+    table = models.DailyReadiness
+    rows = db.execute(
+        select(
+            table.id, table.sleep_hours, table.stress_level, table.fatigue_level, table.muscle_soreness,
+            table.available_time, table.readiness_score, table.decision, table.explanation,
+            table.environment_snapshot_id, table.user_id
+        ).where(table.id > start_id, table.id <= end_id).order_by(table.id)
+    ).all()
+    stats = {"rows": len(rows), "skipped": 0, "scores_changed": 0, "decisions_changed": 0}
+    if not rows:
+        return {"stats": stats, "updates": [], "users": set()}
+
+    scores, decisions, codes = engine.calculate_readiness_batch(*(
+        [row[i] for row in rows] for i in range(1, 6)
+    ))
+    snapshot_ids = {row.environment_snapshot_id for row in rows if row.environment_snapshot_id is not None}
+    environments = {
+        snapshot.id: services.stored_environment(snapshot) for snapshot in db.execute(
+            select(models.EnvironmentSnapshot).where(models.EnvironmentSnapshot.id.in_(snapshot_ids))
+        ).scalars()
+    } if snapshot_ids else {}
+
+    updates = []
+    users = set()
+    for row, score, decision, code in zip(rows, scores.tolist(), decisions.tolist(), codes.tolist()):
+        decision = engine.DECISIONS[decision]
+        explanation = engine.explain_codes(code, score)
+        combined = any(key.startswith("env_") for key in (row.explanation or {}))
+        if row.environment_snapshot_id is not None:
+            if row.environment_snapshot_id not in environments:
+                stats["skipped"] += 1
+                continue
+            constraints, adjustments, severity = environments[row.environment_snapshot_id]
+            decision = environment_engine.apply_environment_to_readiness(decision, score, constraints, severity)
+            explanation = environment_engine.get_combined_explanation(explanation, adjustments)
+        elif combined:
+            stats["skipped"] += 1
+            continue
+
+        if (score, decision, explanation) == (row.readiness_score, row.decision, row.explanation):
+            continue
+        stats["scores_changed"] += score != row.readiness_score
+        stats["decisions_changed"] += decision != row.decision
+        updates.append({"row_id": row.id, "new_score": score, "new_decision": decision, "new_explanation": explanation})
+        users.add(row.user_id)
+    return {"stats": stats, "updates": updates, "users": users}
+
+def _environment_updates(db, model, start_id: int, end_id: int) -> Dict[str, object]:
+    rows = db.execute(
+        select(model).where(model.id > start_id, model.id <= end_id).order_by(model.id)
+    ).scalars().all()
+    stats = {"rows": len(rows), "skipped": 0, "severities_changed": 0, "constraints_changed": 0}
+    updates = []
+    users = set()
+    regions = set()
+    for row in rows:
+        fields = services.environment_policy_fields(*environment_engine.calculate_environment_impact(
+            aqi=row.aqi,
+            temperature_celsius=row.temperature_celsius,
+            is_heatwave=row.is_heatwave,
+            lockdown_status=row.lockdown_status,
+            has_local_event=row.has_local_event
+        ))
+        stored = {name: getattr(row, name) for name in ENVIRONMENT_OUTPUTS}
+        # Workout types come out of a set: compare them unordered
+        same = {
+            name: sorted(value or []) == sorted(stored[name] or []) if name.endswith("_workout_types")
+            else value == stored[name]
+            for name, value in fields.items()
+        }
+        if all(same.values()):
+            continue
+        stats["severities_changed"] += not same["severity"]
+        stats["constraints_changed"] += not all(
+            same[name] for name in ENVIRONMENT_OUTPUTS if name not in ("severity", "rules_version", "adjustments")
+        )
+        updates.append({"row_id": row.id, **{f"new_{name}": value for name, value in fields.items()}})
+        if model is models.EnvironmentSnapshot:
+            regions.add(row.region_id)
+        else:
+            users.add(row.user_id)
+    for region_id in regions:
+        users.update(db.execute(services.region_user_ids_statement(region_id)).scalars())
+    return {"stats": stats, "updates": updates, "users": users}
+
+def rescore_range(table_name: str, start_id: int, end_id: int,
+                  dry_run: bool = False) -> Tuple[Dict[str, int], Set[int]]:
+    """Re-score rows with start_id < id <= end_id; returns counters and the users whose rows changed."""
+    model = MODELS[table_name]
+    db = database.SessionLocal()
+    try:
+        if model is models.DailyReadiness:
+            result = _readiness_updates(db, start_id, end_id)
+            columns = {"readiness_score": "new_score", "decision": "new_decision", "explanation": "new_explanation"}
+        else:
+            result = _environment_updates(db, model, start_id, end_id)
+            columns = {name: f"new_{name}" for name in ENVIRONMENT_OUTPUTS}
+        stats, updates, users = result["stats"], result["updates"], result["users"]
+        stats["updated"] = 0
+        if updates and not dry_run:
+            table = model.__table__
+            db.execute(
+                update(table).where(table.c.id == bindparam("row_id"))
+                .values({column: bindparam(param) for column, param in columns.items()}),
+                updates
+            )
+            db.commit()
+            stats["updated"] = len(updates)
+        stats["would_update"] = len(updates)
+        return stats, (users if updates and not dry_run else set())
+    finally:
+        db.close()
+
+# ============================================================
+# CHECKPOINTS
+# ============================================================
+
+def load_checkpoint(path: str) -> Dict[str, int]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_checkpoint(path: str, checkpoint: Dict[str, int]):
+    # Write-then-rename so a crash never leaves a torn file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+def _ranges(model, after_id: int, chunk_size: int):
+    """(start, end] primary-key ranges of up to chunk_size rows, read from the id index only."""
+    db = database.SessionLocal()
+    try:
+        while True:
+            ids = db.execute(
+                select(model.id).where(model.id > after_id).order_by(model.id).limit(chunk_size)
+            ).scalars().all()
+            if not ids:
+                return
+            yield after_id, ids[-1], len(ids)
+            after_id = ids[-1]
+    finally:
+        db.close()
+
+# ============================================================
+# RUN
+# ============================================================
+
+def rescore_table(model, dry_run: bool = False, workers: int = RESCORE_WORKERS,
+                  chunk_size: int = RESCORE_CHUNK_SIZE, rate: Optional[float] = None,
+                  checkpoint_path: Optional[str] = RESCORE_CHECKPOINT) -> Dict[str, int]:
+    table_name = model.__tablename__
+    checkpoint = load_checkpoint(checkpoint_path) if checkpoint_path else {}
+    start_after = checkpoint.get(table_name, 0)
+    if start_after:
+        logger.info("%s: resuming after id %d", table_name, start_after)
+
+    started = time.perf_counter()
+    totals: Dict[str, int] = {}
+    scanned = 0
+    submitted = 0
+    # Ranges finish out of order; the checkpoint only advances past contiguous finished ranges
+    pending_ranges: List[tuple] = []
+    finished_ends = set()
+
+    def finish(start, end, result):
+        nonlocal scanned
+        stats, users = result
+        # Invalidated here rather than in pool workers, which may hold their own cache client
+        cache.invalidate_many(users, *INVALIDATES[table_name])
+        scanned += stats["rows"]
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+        finished_ends.add(end)
+        while pending_ranges and pending_ranges[0][1] in finished_ends:
+            _, done_end = pending_ranges.pop(0)
+            finished_ends.discard(done_end)
+            if checkpoint_path and not dry_run:
+                checkpoint[table_name] = done_end
+                save_checkpoint(checkpoint_path, checkpoint)
+        elapsed = time.perf_counter() - started
+        logger.info("%s: %d rows scanned up to id %d, %d to update, %.0f rows/s",
+                    table_name, scanned, end, totals.get("would_update", 0), scanned / elapsed if elapsed else 0)
+
+    def throttle(rows: int):
+        nonlocal submitted
+        submitted += rows
+        if rate:
+            ahead = submitted / rate - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    if workers <= 1 or database.is_in_memory(database.SQLALCHEMY_DATABASE_URL):
+        for start, end, count in _ranges(model, start_after, chunk_size):
+            pending_ranges.append((start, end))
+            finish(start, end, rescore_range(table_name, start, end, dry_run))
+            throttle(count)
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            in_flight = {}
+            for start, end, count in _ranges(model, start_after, chunk_size):
+                pending_ranges.append((start, end))
+                in_flight[pool.submit(rescore_range, table_name, start, end, dry_run)] = (start, end)
+                # Bounded read-ahead keeps memory flat and lets --rate take effect
+                while len(in_flight) >= workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(*in_flight.pop(future), future.result())
+                throttle(count)
+            for future in list(in_flight):
+                finish(*in_flight.pop(future), future.result())
+
+    # A finished pass needs no checkpoint; the next run starts from the beginning
+    if checkpoint_path and not dry_run and table_name in checkpoint:
+        del checkpoint[table_name]
+        if checkpoint:
+            save_checkpoint(checkpoint_path, checkpoint)
+        else:
+            os.remove(checkpoint_path)
+
+    totals["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return totals
+
+def refresh_derived(report: Dict[str, Dict[str, int]]) -> Dict[str, object]:
+    """
+    Rebuild what is derived from the tables a rescore() report changed:
+    trends, today's precomputed decisions and the analytics rollups over
+    the days they already cover.
+    """
+    changed = {name for name, totals in report.items() if totals.get("updated")}
+    derived: Dict[str, object] = {}
+    if not changed:
+        return derived
+    if models.DailyReadiness.__tablename__ in changed:
+        derived["trends"] = trends.rebuild()
+    derived["decisions"] = precompute.precompute_decisions()
+
+    db = database.SessionLocal()
+    try:
+        covered = [db.get(models.RollupCoverage, rollup.__tablename__) for rollup, _ in analytics.ROLLUPS]
+    finally:
+        db.close()
+    covered = [state for state in covered if state is not None]
+    if covered:
+        start = min(state.first_day for state in covered)
+        end = max(state.last_day for state in covered) + timedelta(days=1)
+        derived["rollups"] = analytics.refresh_rollups(start, end)
+    return derived
+
+def rescore(target: str = "all", **options) -> Dict[str, Dict[str, int]]:
+    names = list(TARGETS) if target == "all" else [target]
+    return {
+        model.__tablename__: rescore_table(model, **options)
+        for name in names for model in TARGETS[name]
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score stored rows with the current rules")
+    parser.add_argument("target", nargs="?", default="all", choices=["all", *TARGETS])
+    parser.add_argument("--dry-run", action="store_true", help="count changes without writing")
+    parser.add_argument("--workers", type=int, default=RESCORE_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE)
+    parser.add_argument("--rate", type=float, help="max rows scanned per second")
+    parser.add_argument("--checkpoint", default=RESCORE_CHECKPOINT, help="resume file")
+    parser.add_argument("--reset", action="store_true", help="ignore and clear the checkpoint")
+    parser.add_argument("--skip-derived", action="store_true",
+                        help="don't rebuild trends, today's decisions and rollups afterwards")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    report = rescore(
+        args.target, dry_run=args.dry_run, workers=args.workers, chunk_size=args.chunk_size,
+        rate=args.rate, checkpoint_path=args.checkpoint
+    )
+    derived = {} if args.dry_run or args.skip_derived else refresh_derived(report)
+    cache.client.close()
+    print(json.dumps({"dry_run": args.dry_run, "tables": report, "derived": derived}, indent=2, default=str))
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List, Dict
 from enum import Enum
 
@@ -12,9 +12,13 @@ class UserCreate(UserBase):
 
 class User(UserBase):
     id: int
+    region_id: Optional[int] = None
     class Config:
         from_attributes = True
 
+class UserRegionUpdate(BaseModel):
+    region_id: Optional[int] = None  # null unlinks the user from their region
+
 class DailyReadinessBase(BaseModel):
     sleep_hours: float
     stress_level: int
@@ -26,7 +30,7 @@ class DailyReadinessCreate(DailyReadinessBase):
     user_id: int
 
 class DailyReadinessResponse(DailyReadinessBase):
-    id: int
+    id: Optional[int] = None  # None while a write-behind row is still buffered
     user_id: int
     date: datetime
     readiness_score: int
@@ -36,6 +40,24 @@ class DailyReadinessResponse(DailyReadinessBase):
     class Config:
         from_attributes = True
 
+class ReadinessBatchRequest(BaseModel):
+    """Column-oriented check-ins; all lists must have the same length."""
+    sleep_hours: List[float]
+    stress_level: List[int]
+    fatigue_level: List[int]
+    muscle_soreness: List[int]
+    available_time: List[int]
+
+class ReadinessBatchResponse(BaseModel):
+    readiness_scores: List[int]
+    decisions: List[str]
+    explanation_codes: List[int]
+    explanations: Optional[List[Dict[str, str]]] = None
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
 class LockdownStatus(str, Enum):
     NONE = "none"
     PARTIAL = "partial"
@@ -81,10 +103,61 @@ class EnvironmentImpactResponse(BaseModel):
     constraints: WorkoutConstraints
     adjustments: List[EnvironmentAdjustment]
     severity: str  # low, moderate, high, critical
+    region_id: Optional[int] = None  # set when resolved from the user's region snapshot (id is then the snapshot id)
 
     class Config:
         from_attributes = True
 
+class RegionCreate(BaseModel):
+    name: str
+
+class Region(RegionCreate):
+    id: int
+    class Config:
+        from_attributes = True
+
+class EnvironmentSnapshotCreate(BaseModel):
+    aqi: int = Field(default=50, ge=0, le=500, description="Air Quality Index (0-500)")
+    temperature_celsius: float = Field(default=25.0, ge=-50, le=60, description="Temperature in Celsius")
+    is_heatwave: bool = Field(default=False, description="Whether a heatwave is active")
+    lockdown_status: LockdownStatus = Field(default=LockdownStatus.NONE, description="Current lockdown status")
+    has_local_event: bool = Field(default=False, description="Whether there's a local event affecting safety")
+    valid_from: Optional[datetime] = Field(default=None, description="When the snapshot starts to apply (default: now)")
+    valid_until: Optional[datetime] = Field(default=None, description="When it stops applying (default: until the next snapshot)")
+
+class EnvironmentSnapshotResponse(BaseModel):
+    id: int
+    region_id: int
+    date: datetime
+    valid_until: Optional[datetime] = None
+    aqi: int
+    temperature_celsius: float
+    is_heatwave: bool
+    lockdown_status: str
+    has_local_event: bool
+    constraints: WorkoutConstraints
+    adjustments: List[EnvironmentAdjustment]
+    severity: str
+
+class BulkRowError(BaseModel):
+    index: int  # position in the submitted array / NDJSON line (blank lines skipped)
+    status: str  # invalid_json, invalid, unknown_user, failed
+    detail: str
+
+class EnvironmentBulkResponse(BaseModel):
+    """Counts for the whole request; only rejected rows are listed individually."""
+    received: int
+    inserted: int
+    rejected: int
+    distinct_inputs: int
+    users: int
+    chunks: int
+    elapsed_ms: float
+    errors: List[BulkRowError]
+    errors_truncated: bool
+
+ENVIRONMENT_INPUT_FIELDS = ("aqi", "temperature_celsius", "is_heatwave", "lockdown_status", "has_local_event")
+
 class CombinedReadinessRequest(BaseModel):
     user_id: int
     sleep_hours: float
@@ -92,11 +165,25 @@ class CombinedReadinessRequest(BaseModel):
     fatigue_level: int
     muscle_soreness: int
     available_time: int
-    aqi: int = 50
-    temperature_celsius: float = 25.0
-    is_heatwave: bool = False
-    lockdown_status: LockdownStatus = LockdownStatus.NONE
-    has_local_event: bool = False
+    # Leave all environment fields out to use the user's region snapshot;
+    # any field given evaluates this request's environment (unset ones default)
+    aqi: Optional[int] = None
+    temperature_celsius: Optional[float] = None
+    is_heatwave: Optional[bool] = None
+    lockdown_status: Optional[LockdownStatus] = None
+    has_local_event: Optional[bool] = None
+
+    def has_environment_input(self) -> bool:
+        return any(getattr(self, name) is not None for name in ENVIRONMENT_INPUT_FIELDS)
+
+    def environment_input(self) -> "EnvironmentInputCreate":
+        """The request's environment, with defaults for fields not given."""
+        given = {
+            name: getattr(self, name) for name in ENVIRONMENT_INPUT_FIELDS
+            if getattr(self, name) is not None
+        }
+        # Not re-validated: combined requests never range-checked these fields
+        return EnvironmentInputCreate.model_construct(user_id=self.user_id, **given)
 
 class CombinedReadinessResponse(BaseModel):
     readiness_score: int
@@ -106,4 +193,67 @@ class CombinedReadinessResponse(BaseModel):
     environment_adjustments: List[EnvironmentAdjustment]
     constraints: WorkoutConstraints
     environment_severity: str
+    environment_snapshot_id: Optional[int] = None  # region snapshot applied, if any
+
+
+class DailyDecisionResponse(BaseModel):
+    user_id: int
+    day: date
+    readiness_id: int  # check-in the decision was based on
+    environment_snapshot_id: Optional[int] = None
+    environment_policy_id: Optional[int] = None
+    readiness_score: int
+    base_decision: str
+    final_decision: str
+    environment_severity: str
+    computed_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class TrendWindow(BaseModel):
+    days: int
+    checkins: int
+    avg_readiness: Optional[float] = None  # per check-in; null without check-ins
+    rest_days: int
+    load_minutes: int  # available_time on check-ins not prescribed REST
+
+class TrendsResponse(BaseModel):
+    user_id: int
+    as_of: date
+    last_checkin_day: date
+    acute: TrendWindow  # last 7 days
+    chronic: TrendWindow  # last 28 days
+    readiness_acute_chronic: Optional[float] = None  # acute / chronic average readiness
+    load_acute_chronic: Optional[float] = None  # acute load / chronic weekly average load
+    daily_readiness: List[Optional[float]]  # average per day, oldest first, ending as_of
+
+
+class DecisionDistribution(BaseModel):
+    day: date
+    region_id: Optional[int] = None  # with by_region; null groups users without a region
+    checkins: int
+    decisions: Dict[str, int]  # TRAIN / ACTIVE_RECOVERY / REST counts
+    avg_readiness: Optional[float] = None
+    p10_readiness: Optional[int] = None
+    p50_readiness: Optional[int] = None
+    p90_readiness: Optional[int] = None
+
+class DecisionAnalyticsResponse(BaseModel):
+    start: date
+    end: date  # exclusive
+    rollup_days: int  # days read from the daily rollup rather than raw rows
+    days: List[DecisionDistribution]
+
+class SeverityDistribution(BaseModel):
+    day: date
+    region_id: Optional[int] = None
+    records: int
+    severities: Dict[str, int]
 
+class SeverityAnalyticsResponse(BaseModel):
+    start: date
+    end: date  # exclusive
+    rollup_days: int
+    days: List[SeverityDistribution]
@@ -0,0 +1,478 @@
+"""
+Request logic shared by the sync (main.py) and async (async_api.py) handlers.
+Nothing here does I/O against the database: functions build statements,
+ORM rows and responses, and the handlers execute them with their session.
+"""
+import queue
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import and_, func, or_, select
+
+from . import models, schemas, engine, environment_engine, export, cache, write_behind, analytics, metrics
+
+HISTORY_DEFAULT_LIMIT = 100
+HISTORY_MAX_LIMIT = 1000
+
+# ============================================================
+# WRITE-BEHIND
+# ============================================================
+
+def buffer_row(row) -> None:
+    """Queue a row in the write-behind buffer; 503 if it stays full."""
+    try:
+        write_behind.buffer.add(row)
+    except write_behind.BufferFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Write buffer is full, retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+async def abuffer_row(row) -> None:
+    """buffer_row for async handlers: only waits for room off the event loop."""
+    try:
+        write_behind.buffer.add(row, block=False)
+    except queue.Full:
+        await run_in_threadpool(buffer_row, row)
+
+# ============================================================
+# RESPONSE CACHE
+# ============================================================
+
+def cached_response(kind: str, user_id: int) -> Tuple[Optional[Response], Optional[str]]:
+    """
+    (cached JSON response for a read-through endpoint or None on a miss, the
+    cache generation to store a freshly computed response under).
+    """
+    cached, generation = cache.read(kind, user_id)
+    if cached is None:
+        return None, generation
+    return payload_response(cached, "HIT"), generation
+
+async def acached_response(kind: str, user_id: int) -> Tuple[Optional[Response], Optional[str]]:
+    """cached_response for async handlers: the blocking Redis read runs in the threadpool."""
+    return await run_in_threadpool(cached_response, kind, user_id)
+
+async def ainvalidate(user_id: int, *kinds: str) -> None:
+    """cache.invalidate for async handlers, off the event loop."""
+    await run_in_threadpool(cache.invalidate, user_id, *kinds)
+
+async def ainvalidate_many(user_ids, *kinds: str) -> None:
+    """cache.invalidate_many for async handlers, off the event loop."""
+    await run_in_threadpool(cache.invalidate_many, user_ids, *kinds)
+
+def cache_payload(kind: str, user_id: int, generation: Optional[str], body: bytes,
+                  next_cursor: Optional[str] = None) -> str:
+    """Store a rendered body (with its next cursor) for cached_response, and return the stored text."""
+    payload = f"{next_cursor or ''}\n{body.decode()}"
+    cache.write(kind, user_id, payload, generation)
+    return payload
+
+def payload_response(payload: str, cache_status: str) -> Response:
+    """A new response for a cache payload (one per request; payloads may be shared by coalesced reads)."""
+    next_cursor, _, body = payload.partition("\n")
+    headers = {"X-Cache": cache_status}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def cache_response(kind: str, user_id: int, generation: Optional[str], body: bytes,
+                   next_cursor: Optional[str] = None) -> Response:
+    """Store a rendered body (with its next cursor) for cached_response and respond with it."""
+    return payload_response(cache_payload(kind, user_id, generation, body, next_cursor), "MISS")
+
+def coalesced_response(payload: str, shared: bool) -> Response:
+    """Response for a read-through miss computed by this request (MISS) or shared from a concurrent one."""
+    return payload_response(payload, "COALESCED" if shared else "MISS")
+
+# ============================================================
+# HISTORY PAGINATION
+# ============================================================
+
+def history_page(stmt, model, user_id: int, before: Optional[int], limit: int,
+                 since: Optional[datetime] = None):
+    """
+    Newest-first keyset page over (user_id, date DESC, id DESC).
+    `before` is the id of the last row of the previous page. `since` bounds
+    the date range, so Postgres only scans the partitions from that month on.
+    """
+    stmt = stmt.where(model.user_id == user_id)
+    if since is not None:
+        stmt = stmt.where(model.date >= since)
+    if before is not None:
+        cursor_date = select(model.date)\
+            .where(model.id == before, model.user_id == user_id)
+        if since is not None:
+            cursor_date = cursor_date.where(model.date >= since)
+        cursor_date = cursor_date.scalar_subquery()
+        stmt = stmt.where(or_(
+            model.date < cursor_date,
+            and_(model.date == cursor_date, model.id < before)
+        ))
+    return stmt.order_by(model.date.desc(), model.id.desc()).limit(limit)
+
+def readiness_projection_statement(projection: List[str]):
+    """Select only the projected columns (plus the keyset columns)."""
+    return select(*[
+        getattr(models.DailyReadiness, f) for f in dict.fromkeys(["id", "date", *projection])
+    ])
+
+def parse_fields(fields: Optional[str], response_model) -> Optional[List[str]]:
+    """Validate a comma-separated field projection against a response model."""
+    if fields is None:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in response_model.model_fields]
+    if not requested or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown) or '(none given)'}. "
+                   f"Allowed: {', '.join(response_model.model_fields)}"
+        )
+    return requested
+
+def next_cursor(rows, limit: int) -> Optional[str]:
+    return str(rows[-1].id) if len(rows) == limit else None
+
+def projected_readiness_response(rows, projection: List[str], limit: int) -> JSONResponse:
+    items = [
+        schemas.DailyReadinessResponse.model_construct(**row._asdict()).model_dump(mode="json", include=set(projection))
+        for row in rows
+    ]
+    return projected_response(items, projection, next_cursor(rows, limit))
+
+def projected_environment_response(records, projection: List[str], limit: int) -> JSONResponse:
+    items = [
+        schemas.EnvironmentImpactResponse.model_validate(environment_response(db_env)).model_dump(mode="json", include=set(projection))
+        for db_env in records
+    ]
+    return projected_response(items, projection, next_cursor(records, limit))
+
+def projected_response(items: List[dict], projection: List[str], next_cursor: Optional[str]) -> JSONResponse:
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse(
+        [{f: item[f] for f in projection} for item in items],
+        headers=headers
+    )
+
+# ============================================================
+# READINESS
+# ============================================================
+
+def score_checkin(data):
+    """Readiness engine plus the available-time constraint. Returns (score, decision, explanation)."""
+    with metrics.stage("engine.readiness"):
+        score, decision, explanation = engine.calculate_readiness(
+            data.sleep_hours,
+            data.stress_level,
+            data.fatigue_level,
+            data.muscle_soreness
+        )
+    
+    # Simple Constraint Optimization (Step 9)
+    if decision == "TRAIN" and data.available_time < 30:
+        decision = "ACTIVE_RECOVERY"
+        explanation["time_constraint"] = engine.REASON_TIME_CONSTRAINT
+
+    return score, decision, explanation
+
+def readiness_row(data) -> models.DailyReadiness:
+    score, decision, explanation = score_checkin(data)
+    return models.DailyReadiness(
+        **data.dict(),
+        readiness_score=score,
+        decision=decision,
+        explanation=explanation
+    )
+
+# ============================================================
+# ENVIRONMENT
+# ============================================================
+
+def evaluate_environment(data):
+    """Run the environment rules for a request carrying environment inputs."""
+    with metrics.stage("engine.environment"):
+        return environment_engine.calculate_environment_impact(
+            aqi=data.aqi,
+            temperature_celsius=data.temperature_celsius,
+            is_heatwave=data.is_heatwave,
+            lockdown_status=data.lockdown_status.value,
+            has_local_event=data.has_local_event
+        )
+
+def environment_policy_fields(constraints, adjustments, severity) -> dict:
+    """Computed EnvironmentPolicy columns for one rule evaluation."""
+    return {
+        "allow_outdoor": constraints.allow_outdoor,
+        "max_intensity_percent": constraints.max_intensity_percent,
+        "max_duration_minutes": constraints.max_duration_minutes,
+        "recommended_location": constraints.recommended_location,
+        "blocked_workout_types": list(constraints.blocked_workout_types),
+        "suggested_workout_types": list(constraints.suggested_workout_types),
+        "severity": severity,
+        "rules_version": environment_engine.rules_version(),
+        # Convert adjustments to dict format for JSON storage
+        "adjustments": [
+            {"rule_id": a.rule_id, "trigger": a.trigger, "action": a.action, "reason": a.reason}
+            for a in adjustments
+        ]
+    }
+
+def environment_policy_row(data, constraints, adjustments, severity) -> models.EnvironmentPolicy:
+    return models.EnvironmentPolicy(
+        user_id=data.user_id,
+        aqi=data.aqi,
+        temperature_celsius=data.temperature_celsius,
+        is_heatwave=data.is_heatwave,
+        lockdown_status=data.lockdown_status.value,
+        has_local_event=data.has_local_event,
+        **environment_policy_fields(constraints, adjustments, severity)
+    )
+
+def refresh_environment_policy(db_env: models.EnvironmentPolicy) -> bool:
+    """
+    Recompute stored constraints if they were produced by older rules
+    (or predate stored constraints). Returns True if the row changed.
+    """
+    if db_env.rules_version == environment_engine.rules_version():
+        return False
+
+    constraints, adjustments, severity = environment_engine.calculate_environment_impact(
+        aqi=db_env.aqi,
+        temperature_celsius=db_env.temperature_celsius,
+        is_heatwave=db_env.is_heatwave,
+        lockdown_status=db_env.lockdown_status,
+        has_local_event=db_env.has_local_event
+    )
+    for key, value in environment_policy_fields(constraints, adjustments, severity).items():
+        setattr(db_env, key, value)
+    return True
+
+def environment_conditions(row) -> dict:
+    """Inputs, constraints and adjustments of a stored policy row or region snapshot."""
+    return {
+        "aqi": row.aqi,
+        "temperature_celsius": row.temperature_celsius,
+        "is_heatwave": row.is_heatwave,
+        "lockdown_status": row.lockdown_status,
+        "has_local_event": row.has_local_event,
+        "constraints": {
+            "allow_outdoor": row.allow_outdoor,
+            "max_intensity_percent": row.max_intensity_percent,
+            "max_duration_minutes": row.max_duration_minutes,
+            "recommended_location": row.recommended_location,
+            "blocked_workout_types": row.blocked_workout_types,
+            "suggested_workout_types": row.suggested_workout_types
+        },
+        "adjustments": row.adjustments,
+        "severity": row.severity
+    }
+
+def environment_response(db_env: models.EnvironmentPolicy) -> dict:
+    """Map a stored row to the EnvironmentImpactResponse shape."""
+    return {
+        "id": db_env.id,
+        "user_id": db_env.user_id,
+        "date": db_env.date,
+        **environment_conditions(db_env)
+    }
+
+def region_environment_response(snapshot: models.EnvironmentSnapshot, user_id: int) -> dict:
+    """EnvironmentImpactResponse for a user whose environment comes from their region."""
+    return {
+        "id": snapshot.id,
+        "user_id": user_id,
+        "date": snapshot.date,
+        **environment_conditions(snapshot),
+        "region_id": snapshot.region_id
+    }
+
+def snapshot_response(snapshot: models.EnvironmentSnapshot) -> dict:
+    return {
+        "id": snapshot.id,
+        "region_id": snapshot.region_id,
+        "date": snapshot.date,
+        "valid_until": snapshot.valid_until,
+        **environment_conditions(snapshot)
+    }
+
+def stored_environment(row):
+    """
+    (constraints, adjustments, severity) of a stored row, without re-running
+    the rules unless they changed since the row was computed.
+    """
+    if row.rules_version != environment_engine.rules_version():
+        return environment_engine.calculate_environment_impact(
+            aqi=row.aqi,
+            temperature_celsius=row.temperature_celsius,
+            is_heatwave=row.is_heatwave,
+            lockdown_status=row.lockdown_status,
+            has_local_event=row.has_local_event
+        )
+    constraints = environment_engine.WorkoutConstraints(
+        allow_outdoor=row.allow_outdoor,
+        max_intensity_percent=row.max_intensity_percent,
+        max_duration_minutes=row.max_duration_minutes,
+        recommended_location=row.recommended_location,
+        blocked_workout_types=tuple(row.blocked_workout_types or ()),
+        suggested_workout_types=tuple(row.suggested_workout_types or ())
+    )
+    adjustments = [environment_engine.EnvironmentAdjustment(**a) for a in row.adjustments]
+    return constraints, adjustments, row.severity
+
+def latest_environment_statement(user_id: int):
+    return select(models.EnvironmentPolicy)\
+        .where(models.EnvironmentPolicy.user_id == user_id)\
+        .order_by(models.EnvironmentPolicy.date.desc())\
+        .limit(1)
+
+# ============================================================
+# REGIONS
+# ============================================================
+
+def _current(stmt):
+    """Newest snapshot that has started and not expired (by the database clock)."""
+    snapshot = models.EnvironmentSnapshot
+    return stmt\
+        .where(snapshot.date <= func.now())\
+        .where(or_(snapshot.valid_until.is_(None), snapshot.valid_until > func.now()))\
+        .order_by(snapshot.date.desc(), snapshot.id.desc())\
+        .limit(1)
+
+def region_snapshot_statement(region_id: int):
+    return _current(select(models.EnvironmentSnapshot)
+                    .where(models.EnvironmentSnapshot.region_id == region_id))
+
+def user_snapshot_statement(user_id: int):
+    """Current snapshot of the user's region."""
+    return _current(select(models.EnvironmentSnapshot)
+                    .join(models.User, models.User.region_id == models.EnvironmentSnapshot.region_id)
+                    .where(models.User.id == user_id))
+
+def region_user_ids_statement(region_id: int):
+    return select(models.User.id).where(models.User.region_id == region_id)
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Compared against the database clock, which is UTC; naive values are taken as UTC
+    return value.astimezone(timezone.utc) if value is not None and value.tzinfo else value
+
+def environment_snapshot_row(region_id: int, data, constraints, adjustments, severity) -> models.EnvironmentSnapshot:
+    window = {"date": _utc(data.valid_from)} if data.valid_from is not None else {}
+    return models.EnvironmentSnapshot(
+        region_id=region_id,
+        **window,
+        valid_until=_utc(data.valid_until),
+        aqi=data.aqi,
+        temperature_celsius=data.temperature_celsius,
+        is_heatwave=data.is_heatwave,
+        lockdown_status=data.lockdown_status.value,
+        has_local_event=data.has_local_event,
+        **environment_policy_fields(constraints, adjustments, severity)
+    )
+
+def user_environment_response(db_env: Optional[models.EnvironmentPolicy],
+                              snapshot: Optional[models.EnvironmentSnapshot], user_id: int) -> Optional[dict]:
+    """
+    Environment for a user: their own latest policy row or their region's
+    current snapshot, whichever is newer. A per-user row overrides the region
+    (also on a tie) until the region publishes a newer snapshot.
+    """
+    source = newest_environment(db_env, snapshot)
+    if source is None:
+        return None
+    if source is snapshot:
+        return region_environment_response(snapshot, user_id)
+    return environment_response(db_env)
+
+def newest_environment(db_env: Optional[models.EnvironmentPolicy], snapshot: Optional[models.EnvironmentSnapshot]):
+    """The row that applies to a user (see user_environment_response), or None."""
+    if snapshot is not None and (db_env is None or snapshot.date > db_env.date):
+        return snapshot
+    return db_env
+
+def daily_decision_statement(user_id: int, day):
+    return select(models.DailyDecision)\
+        .where(models.DailyDecision.user_id == user_id)\
+        .where(models.DailyDecision.day == day)
+
+def analytics_range(start: Optional[date], end: Optional[date]):
+    """Validated [start, end) for the analytics endpoints; 400 when out of range."""
+    try:
+        return analytics.date_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ============================================================
+# COMBINED READINESS + ENVIRONMENT
+# ============================================================
+
+def combined_readiness(data: schemas.CombinedReadinessRequest,
+                       snapshot: Optional[models.EnvironmentSnapshot] = None):
+    """
+    Calculate readiness, apply environmental constraints and build the rows to store.
+    With a region snapshot its stored constraints are used and no per-user
+    environment row is built. Returns (response fields, db_readiness, db_env or None).
+    """
+    # 1. Calculate base readiness (with time constraint)
+    readiness_score, base_decision, readiness_explanation = score_checkin(data)
+    
+    # 2. Calculate environment impact (or reuse the region's)
+    if snapshot is not None:
+        constraints, adjustments, severity = stored_environment(snapshot)
+    else:
+        environment_input = data.environment_input()
+        constraints, adjustments, severity = evaluate_environment(environment_input)
+    
+    # 3. Apply environment constraints to decision
+    with metrics.stage("engine.apply_environment"):
+        final_decision = environment_engine.apply_environment_to_readiness(
+            base_decision=base_decision,
+            readiness_score=readiness_score,
+            constraints=constraints,
+            severity=severity
+        )
+    
+    # 4. Rows for both records
+    db_readiness = models.DailyReadiness(
+        user_id=data.user_id,
+        sleep_hours=data.sleep_hours,
+        stress_level=data.stress_level,
+        fatigue_level=data.fatigue_level,
+        muscle_soreness=data.muscle_soreness,
+        available_time=data.available_time,
+        readiness_score=readiness_score,
+        decision=final_decision,
+        explanation=environment_engine.get_combined_explanation(readiness_explanation, adjustments),
+        environment_snapshot_id=snapshot.id if snapshot is not None else None
+    )
+    db_env = None
+    if snapshot is None:
+        db_env = environment_policy_row(environment_input, constraints, adjustments, severity)
+    
+    # 5. Combined response (CombinedReadinessResponse fields; rendered by fast_json)
+    response = {
+        "readiness_score": readiness_score,
+        "base_decision": base_decision,
+        "final_decision": final_decision,
+        "readiness_explanation": readiness_explanation,
+        "environment_adjustments": adjustments,
+        "constraints": constraints,
+        "environment_severity": severity,
+        "environment_snapshot_id": snapshot.id if snapshot is not None else None
+    }
+    return response, db_readiness, db_env
+
+# ============================================================
+# DATA EXPORT
+# ============================================================
+
+def export_response(stream, fmt: schemas.ExportFormat, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type=export.MEDIA_TYPES[fmt.value],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt.value}"'}
+    )
@@ -0,0 +1,145 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+While one request (the leader) computes a key, requests for the same key
+wait for its result instead of running their own queries: a dashboard
+firing several GET /environment-impact/{user_id} at once costs one DB
+round-trip and one rule evaluation. Nothing is kept once the leader
+finishes - that is the response cache's job - so results are never stale
+beyond the one computation everyone shared.
+
+Group serves the sync handlers (threadpool threads block on the leader);
+AsyncGroup serves the async ones (tasks await the leader's future). Both
+are per process. Results are handed to every waiter, so coalesce values
+that aren't mutated afterwards (the handlers share rendered payload text).
+SINGLEFLIGHT=0 turns coalescing off.
+"""
+import asyncio
+import os
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT", "1") == "1"
+
+T = TypeVar("T")
+
+class Counters:
+    """Per-kind (first element of the key) call counts."""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.executions: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, shared: bool):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            counter = self.coalesced if shared else self.executions
+            counter[kind] = counter.get(kind, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                kind: {
+                    "calls": calls,
+                    "executions": self.executions.get(kind, 0),
+                    "coalesced": self.coalesced.get(kind, 0)
+                }
+                for kind, calls in self.calls.items()
+            }
+
+def _kind(key: Hashable) -> str:
+    return str(key[0]) if isinstance(key, tuple) else str(key)
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Group:
+    """Coalesces concurrent calls across threads."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.counters = Counters()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """fn()'s result, computed once for everyone asking for key meanwhile; and whether it was shared."""
+        if not SINGLEFLIGHT_ENABLED:
+            return fn(), False
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self.counters.record(_kind(key), shared=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+class _LeaderCancelled(Exception):
+    """The leading request was cancelled (e.g. its client went away); waiters compute for themselves."""
+
+class AsyncGroup:
+    """Coalesces concurrent calls across tasks on one event loop."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.counters = Counters()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        if not SINGLEFLIGHT_ENABLED:
+            return await fn(), False
+        future = self._calls.get(key)
+        if future is not None:
+            self.counters.record(_kind(key), shared=True)
+            try:
+                # shield: a waiter's cancellation must not cancel everyone's result
+                return await asyncio.shield(future), True
+            except _LeaderCancelled:
+                return await fn(), False
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.counters.record(_kind(key), shared=False)
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
+            # Nobody may be waiting; don't warn about an unretrieved exception
+            if future.done() and not future.cancelled():
+                future.exception()
+
+# Shared by the sync handlers (main.py) and the async ones (async_api.py)
+readers = Group()
+async_readers = AsyncGroup()
+
+def stats() -> dict:
+    return {"enabled": SINGLEFLIGHT_ENABLED, "sync": readers.counters.snapshot(), "async": async_readers.counters.snapshot()}
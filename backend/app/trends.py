@@ -0,0 +1,263 @@
+"""
+Rolling 7/28-day readiness and load aggregates per user (models.UserTrend).
+
+Each check-in adds itself to its day's slot as it is stored (sync and async
+handlers, and write-behind flushes), so GET /trends/{user_id} reads one row
+instead of scanning history. Slots live in ring-buffer arrays indexed by
+day ordinal: moving to a new day clears at most TREND_SLOTS slots, so every
+update is O(1).
+
+Rebuild from DailyReadiness after backfills or a re-scoring run
+(python -m app.rescore):
+
+    python -m app.trends rebuild [--user-id ID]
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from . import database, models, metrics
+
+logger = logging.getLogger(__name__)
+
+TREND_SLOTS = 28
+ACUTE_DAYS = 7
+REST = "REST"
+
+SLOT_COLUMNS = ("score_sums", "checkins", "rest_days", "load_minutes")
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+def _day(value) -> date:
+    """UTC day of a check-in's date; unsaved rows (date not stamped yet) count as today."""
+    if value is None:
+        return today()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+def _slot(day: date) -> int:
+    return day.toordinal() % TREND_SLOTS
+
+def _get(row, name: str):
+    # Check-ins arrive as ORM rows from handlers and as value dicts from write-behind
+    return row.get(name) if isinstance(row, dict) else getattr(row, name)
+
+class Slots:
+    """Mutable copy of a UserTrend's ring buffers."""
+
+    def __init__(self, last_day: Optional[date] = None, **arrays):
+        self.last_day = last_day
+        for name in SLOT_COLUMNS:
+            values = arrays.get(name)
+            setattr(self, name, list(values) if values else [0] * TREND_SLOTS)
+
+    @classmethod
+    def of(cls, trend: models.UserTrend) -> "Slots":
+        return cls(trend.last_day, **{name: getattr(trend, name) for name in SLOT_COLUMNS})
+
+    def values(self) -> dict:
+        return {"last_day": self.last_day, **{name: getattr(self, name) for name in SLOT_COLUMNS}}
+
+    def _advance(self, day: date):
+        """Move the newest day forward, clearing the slots of the days skipped."""
+        for offset in range(1, min((day - self.last_day).days, TREND_SLOTS) + 1):
+            slot = _slot(self.last_day + timedelta(days=offset))
+            for name in SLOT_COLUMNS:
+                getattr(self, name)[slot] = 0
+        self.last_day = day
+
+    def add(self, day: date, readiness_score: int, decision: str, available_time: Optional[int]) -> bool:
+        """Add one check-in; False if its day has already left the window."""
+        if self.last_day is None:
+            self.last_day = day
+        elif day > self.last_day:
+            self._advance(day)
+        elif (self.last_day - day).days >= TREND_SLOTS:
+            return False
+        slot = _slot(day)
+        self.score_sums[slot] += readiness_score
+        self.checkins[slot] += 1
+        if decision == REST:
+            self.rest_days[slot] = 1
+        else:
+            self.load_minutes[slot] += available_time or 0
+        return True
+
+    def _days(self, as_of: date, days: int):
+        """Slots of the `days` days ending as_of, oldest first (None for days with no data kept)."""
+        for offset in range(days - 1, -1, -1):
+            day = as_of - timedelta(days=offset)
+            kept = self.last_day is not None and 0 <= (self.last_day - day).days < TREND_SLOTS
+            yield _slot(day) if kept else None
+
+    def window(self, as_of: date, days: int) -> dict:
+        slots = [slot for slot in self._days(as_of, days) if slot is not None]
+        checkins = sum(self.checkins[slot] for slot in slots)
+        score_sum = sum(self.score_sums[slot] for slot in slots)
+        return {
+            "days": days,
+            "checkins": checkins,
+            "avg_readiness": round(score_sum / checkins, 1) if checkins else None,
+            "rest_days": sum(self.rest_days[slot] for slot in slots),
+            "load_minutes": sum(self.load_minutes[slot] for slot in slots)
+        }
+
+    def daily_readiness(self, as_of: date):
+        return [
+            round(self.score_sums[slot] / self.checkins[slot], 1)
+            if slot is not None and self.checkins[slot] else None
+            for slot in self._days(as_of, TREND_SLOTS)
+        ]
+
+def _create_missing(db, user_ids) -> None:
+    """
+    Insert empty trend rows for users' first check-ins, skipping rows another
+    transaction inserted concurrently, so there is always a row to lock.
+    """
+    rows = [{"user_id": user_id} for user_id in user_ids]
+    dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(db.get_bind().dialect.name)
+    if dialect is not None:
+        db.execute(dialect.insert(models.UserTrend).on_conflict_do_nothing(index_elements=["user_id"]), rows)
+        return
+    for row in rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(models.UserTrend), [row])
+        except IntegrityError:
+            pass  # created by a concurrent first check-in
+
+def _locked(db, user_ids) -> Dict[int, models.UserTrend]:
+    return {
+        trend.user_id: trend for trend in db.execute(
+            select(models.UserTrend)
+            .where(models.UserTrend.user_id.in_(user_ids))
+            .with_for_update()
+        ).scalars()
+    }
+
+@metrics.timed("trends.record")
+def record(db, checkins: Iterable) -> None:
+    """
+    Add stored check-ins (DailyReadiness rows or their values) to their
+    users' trends in db's transaction. Trend rows are locked for the update
+    where the database supports it; a user's first trend row is created with
+    an insert that tolerates a concurrent one, so concurrent first check-ins
+    don't fail the transaction.
+    """
+    by_user: Dict[int, list] = {}
+    for row in checkins:
+        by_user.setdefault(_get(row, "user_id"), []).append(row)
+    if not by_user:
+        return
+
+    trends = _locked(db, by_user)
+    missing = [user_id for user_id in by_user if user_id not in trends]
+    if missing:
+        _create_missing(db, missing)
+        trends.update(_locked(db, missing))
+    for user_id, rows in by_user.items():
+        trend = trends[user_id]
+        slots = Slots.of(trend)
+        for row in rows:
+            slots.add(
+                _day(_get(row, "date")), _get(row, "readiness_score"),
+                _get(row, "decision"), _get(row, "available_time")
+            )
+        # New lists, so the JSON columns are seen as changed
+        for name, value in slots.values().items():
+            setattr(trend, name, value)
+
+def trend_statement(user_id: int):
+    return select(models.UserTrend).where(models.UserTrend.user_id == user_id)
+
+def trends_response(trend: models.UserTrend, as_of: Optional[date] = None) -> dict:
+    as_of = as_of or today()
+    slots = Slots.of(trend)
+    acute = slots.window(as_of, ACUTE_DAYS)
+    chronic = slots.window(as_of, TREND_SLOTS)
+    readiness_ratio = None
+    if acute["avg_readiness"] is not None and chronic["avg_readiness"]:
+        readiness_ratio = round(acute["avg_readiness"] / chronic["avg_readiness"], 2)
+    chronic_weekly_load = chronic["load_minutes"] * ACUTE_DAYS / TREND_SLOTS
+    return {
+        "user_id": trend.user_id,
+        "as_of": as_of,
+        "last_checkin_day": trend.last_day,
+        "acute": acute,
+        "chronic": chronic,
+        "readiness_acute_chronic": readiness_ratio,
+        "load_acute_chronic": round(acute["load_minutes"] / chronic_weekly_load, 2) if chronic_weekly_load else None,
+        "daily_readiness": slots.daily_readiness(as_of)
+    }
+
+# ============================================================
+# REBUILD
+# ============================================================
+
+def rebuild(user_id: Optional[int] = None, as_of: Optional[date] = None, chunk_size: int = 5000) -> dict:
+    """
+    Recompute trends from the last TREND_SLOTS days of DailyReadiness, in one
+    transaction. Check-ins stored while this runs may be missed; run it when
+    writes are quiet or re-run it.
+    """
+    started = time.perf_counter()
+    as_of = as_of or today()
+    cutoff = datetime.combine(as_of - timedelta(days=TREND_SLOTS - 1), datetime.min.time(), timezone.utc)
+    table = models.DailyReadiness
+    stmt = select(table.user_id, table.date, table.readiness_score, table.decision, table.available_time)\
+        .where(table.date >= cutoff)\
+        .order_by(table.user_id, table.id)
+    if user_id is not None:
+        stmt = stmt.where(table.user_id == user_id)
+
+    stats = {"checkins": 0, "users": 0}
+    db = database.SessionLocal()
+    try:
+        clear = delete(models.UserTrend)
+        if user_id is not None:
+            clear = clear.where(models.UserTrend.user_id == user_id)
+        db.execute(clear)
+
+        pending = []
+        current_user, slots = None, None
+        # Rows arrive grouped by user; each user's slots are written once complete
+        for row in db.execute(stmt.execution_options(yield_per=chunk_size)):
+            if row.user_id != current_user:
+                if slots is not None:
+                    pending.append({"user_id": current_user, **slots.values()})
+                current_user, slots = row.user_id, Slots()
+                stats["users"] += 1
+            slots.add(_day(row.date), row.readiness_score, row.decision, row.available_time)
+            stats["checkins"] += 1
+            if len(pending) >= chunk_size:
+                db.execute(insert(models.UserTrend), pending)
+                pending = []
+        if slots is not None:
+            pending.append({"user_id": current_user, **slots.values()})
+        if pending:
+            db.execute(insert(models.UserTrend), pending)
+        db.commit()
+    finally:
+        db.close()
+
+    stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain per-user rolling trends")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subcommands.add_parser("rebuild", help="recompute trends from stored check-ins")
+    rebuild_parser.add_argument("--user-id", type=int, help="only this user (default: everyone)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    print(json.dumps(rebuild(user_id=args.user_id)))
@@ -0,0 +1,284 @@
+"""
+Optional write-behind mode for check-in submissions (WRITE_BEHIND=1).
+
+Handlers compute the decision, hand the row to an in-process buffer and
+return immediately; a background thread inserts buffered rows with
+multi-row INSERTs whenever the batch size or flush interval is reached.
+Rows still buffered when the process dies are lost, so this trades a small
+durability window for write throughput.
+
+A batch that the database rejects for its data (IntegrityError,
+DataError) is split in halves until the rows that fail on their own are
+isolated; only those are dead-lettered: logged with their values, counted
+in rows_failed, and appended to WRITE_BEHIND_DEAD_LETTER_PATH as JSON lines
+when it is set. Any other failure (connection loss, failover, lock
+timeouts) says nothing about the rows, so the whole batch is retried with
+backoff capped at WRITE_BEHIND_RETRY_BACKOFF_MAX until it goes through;
+meanwhile the buffer fills and submits get backpressure, then 503s.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import exc, inspect, insert
+
+from . import database, models, cache, trends
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 500))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 0.5))  # seconds
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 20000))
+# How long a submit may wait for room before the request is rejected
+WRITE_BEHIND_PUT_TIMEOUT = float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT", 2.0))
+WRITE_BEHIND_RETRY_BACKOFF = float(os.getenv("WRITE_BEHIND_RETRY_BACKOFF", 0.2))  # seconds, doubled per retry
+WRITE_BEHIND_RETRY_BACKOFF_MAX = float(os.getenv("WRITE_BEHIND_RETRY_BACKOFF_MAX", 30))
+WRITE_BEHIND_DEAD_LETTER_PATH = os.getenv("WRITE_BEHIND_DEAD_LETTER_PATH")
+
+# Cached reads made stale by inserting each model
+INVALIDATES = {
+    models.DailyReadiness: (cache.READINESS_PAGE, cache.DAILY_DECISION),
+    models.EnvironmentPolicy: (cache.ENVIRONMENT_IMPACT,),
+}
+
+def _rejects_rows(error: Exception) -> bool:
+    """Whether the database refused the rows themselves, so retrying them can't succeed."""
+    return isinstance(error, (exc.IntegrityError, exc.DataError))
+
+class BufferFull(Exception):
+    """The buffer stayed full for WRITE_BEHIND_PUT_TIMEOUT; the caller should shed load."""
+
+def row_values(obj) -> dict:
+    """
+    Column values of a transient ORM object for a Core insert.
+    Unset columns that have a default are left out so the default applies.
+    """
+    values = {}
+    for attr in inspect(obj).mapper.column_attrs:
+        column = attr.columns[0]
+        value = getattr(obj, attr.key)
+        if column.primary_key:
+            continue
+        if value is None and (column.default is not None or column.server_default is not None):
+            continue
+        values[attr.key] = value
+    return values
+
+class WriteBehindBuffer:
+
+    def __init__(self, session_factory=None, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 put_timeout: float = WRITE_BEHIND_PUT_TIMEOUT,
+                 retry_backoff: float = WRITE_BEHIND_RETRY_BACKOFF,
+                 retry_backoff_max: float = WRITE_BEHIND_RETRY_BACKOFF_MAX,
+                 dead_letter_path: Optional[str] = WRITE_BEHIND_DEAD_LETTER_PATH):
+        self._session_factory = session_factory or database.SessionLocal
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.dead_letter_path = dead_letter_path
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.flushes = 0
+        self.flush_retries = 0
+        self.batch_splits = 0
+        self.backpressure_waits = 0
+        self.rejected = 0
+        self.last_flush_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def add(self, obj, block: bool = True) -> dict:
+        """
+        Queue a transient ORM object for insertion; returns the values queued.
+        Stamps `date` now so the response matches the stored row. When the
+        buffer is full this waits (backpressure) up to put_timeout, then
+        raises BufferFull. With block=False it raises queue.Full instead of waiting.
+        """
+        if getattr(obj, "date", None) is None and hasattr(obj, "date"):
+            obj.date = datetime.now(timezone.utc)
+        item = (type(obj), row_values(obj))
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if not block:
+                raise
+            with self._stats_lock:
+                self.backpressure_waits += 1
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                with self._stats_lock:
+                    self.rejected += 1
+                raise BufferFull()
+        with self._stats_lock:
+            self.enqueued += 1
+        return item[1]
+
+    def _ensure_worker(self):
+        # Started lazily so importing the module starts no threads
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stopping.is_set() or not self._queue.empty():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                if self._stopping.is_set():
+                    deadline = 0  # draining: don't wait for a full batch
+            if batch:
+                self.flush(batch)
+
+    def flush(self, batch):
+        """
+        Insert one batch. Failures caused by the rows split the batch to
+        isolate and dead-letter them; any other failure retries the whole
+        batch with capped backoff until it succeeds.
+        """
+        started = time.perf_counter()
+        self._write_retrying(batch)
+        with self._stats_lock:
+            self.flushes += 1
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def _write_retrying(self, batch):
+        error = self._write(batch)
+        attempt = 0
+        while error is not None and not _rejects_rows(error):
+            logger.warning("Write-behind flush of %d rows failed (%r); retrying", len(batch), error)
+            with self._stats_lock:
+                self.flush_retries += 1
+            time.sleep(min(self.retry_backoff * 2 ** attempt, self.retry_backoff_max))
+            attempt += 1
+            error = self._write(batch)
+        if error is not None:
+            self._split(batch, error)
+
+    def _split(self, batch, error: Exception):
+        """Write the halves of a rejected batch separately, down to single rows, which are dead-lettered."""
+        if len(batch) == 1:
+            self._dead_letter(batch[0], error)
+            return
+        with self._stats_lock:
+            self.batch_splits += 1
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            self._write_retrying(half)
+
+    def _write(self, batch) -> Optional[Exception]:
+        """
+        A multi-row INSERT per model plus the check-ins' trend and today's
+        decision updates, in one transaction. Returns the error, if any.
+        """
+        from . import precompute  # imports services, which imports this module
+
+        by_model = {}
+        for model, values in batch:
+            by_model.setdefault(model, []).append(values)
+
+        db = self._session_factory()
+        try:
+            checkins = {}
+            for model, rows in by_model.items():
+                if model is models.DailyReadiness:
+                    ids = db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows).scalars()
+                    # A user's newest check-in in the batch is the one their decision follows
+                    checkins = {r["user_id"]: {**r, "id": row_id} for r, row_id in zip(rows, ids)}
+                else:
+                    db.execute(insert(model), rows)
+            trends.record(db, by_model.get(models.DailyReadiness, ()))
+            for checkin in checkins.values():
+                precompute.refresh_decision(db, checkin)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            with self._stats_lock:
+                self.last_error = repr(e)
+            return e
+        finally:
+            db.close()
+
+        with self._stats_lock:
+            self.rows_written += len(batch)
+
+        # Reads cached while rows were buffered are stale now. The rows are
+        # committed: a failure here must not fail the batch or stop the writer
+        try:
+            for model, rows in by_model.items():
+                kinds = INVALIDATES.get(model)
+                if kinds:
+                    cache.invalidate_many({r.get("user_id") for r in rows}, *kinds)
+        except Exception:
+            logger.exception("Invalidating cached reads after a write-behind flush of %d rows failed", len(batch))
+        return None
+
+    def _dead_letter(self, item, error: Exception):
+        model, values = item
+        logger.error("Write-behind dropped a %s row the database rejected: %r; values %r", model.__tablename__, error, values)
+        with self._stats_lock:
+            self.rows_failed += 1
+        if self.dead_letter_path:
+            try:
+                with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"table": model.__tablename__, "values": values, "error": repr(error)},
+                                       default=str) + "\n")
+            except OSError:
+                logger.exception("Could not append to write-behind dead letter file %s", self.dead_letter_path)
+
+    def close(self, timeout: float = 30.0):
+        """Stop the worker once everything buffered has been written."""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "enabled": True,
+                "pending": self._queue.qsize(),
+                "max_pending": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "rows_written": self.rows_written,
+                "rows_failed": self.rows_failed,
+                "flushes": self.flushes,
+                "flush_retries": self.flush_retries,
+                "batch_splits": self.batch_splits,
+                "avg_batch_rows": round(self.rows_written / self.flushes, 1) if self.flushes else 0.0,
+                "last_flush_ms": self.last_flush_ms,
+                "backpressure_waits": self.backpressure_waits,
+                "rejected": self.rejected,
+                "last_error": self.last_error
+            }
+
+buffer: Optional[WriteBehindBuffer] = WriteBehindBuffer() if WRITE_BEHIND_ENABLED else None
+
+def stats() -> dict:
+    return buffer.stats() if buffer is not None else {"enabled": False}
@@ -0,0 +1,160 @@
+"""
+Latency summaries and JSON baselines shared by the benchmark scripts.
+
+Every script can write its results with --output and compare them against an
+earlier run with --baseline. To compare two saved runs directly:
+
+    cd backend
+    python -m benchmarks.baseline before.json after.json --threshold 10
+
+A case regresses when a compared percentile grew by more than --threshold
+percent and by more than --min-delta-ms (so sub-microsecond jitter on tiny
+cases doesn't count). Exit status is 1 when anything regressed.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMPARED = ("p50_ms", "p95_ms", "p99_ms")
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(seconds: Sequence[float], elapsed: Optional[float] = None, digits: int = 4) -> dict:
+    """Count, throughput (per second of elapsed, default: of the samples' sum) and percentiles in ms."""
+    values = sorted(seconds)
+    total = elapsed if elapsed is not None else sum(values)
+    return {
+        "count": len(values),
+        "per_s": round(len(values) / total, 1) if total else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, digits),
+        "p95_ms": round(percentile(values, 95) * 1000, digits),
+        "p99_ms": round(percentile(values, 99) * 1000, digits),
+        "mean_ms": round(statistics.fmean(values) * 1000, digits) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, digits) if values else 0.0
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    commit = result.stdout.strip()
+    dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                           cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    return f"{commit}-dirty" if dirty else commit
+
+def document(suite: str, results: Dict[str, dict], settings: Optional[dict] = None) -> dict:
+    """Results (case name -> summarize() dict) with enough context to judge a comparison."""
+    return {
+        "suite": suite,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+        "settings": settings or {},
+        "results": results
+    }
+
+def save(path: str, run: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline: dict, current: dict, threshold_pct: float = 10.0, min_delta_ms: float = 0.005,
+            metrics: Sequence[str] = COMPARED) -> List[dict]:
+    """One row per case and metric present in both runs, with its change and whether it regressed."""
+    rows = []
+    old_results, new_results = baseline["results"], current["results"]
+    for name in sorted(set(old_results) & set(new_results)):
+        for metric in metrics:
+            old, new = old_results[name].get(metric), new_results[name].get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            rows.append({
+                "case": name,
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change_pct": round(change, 1),
+                "regressed": change > threshold_pct and new - old > min_delta_ms
+            })
+    return rows
+
+def report(baseline: dict, current: dict, rows: List[dict]) -> str:
+    lines = [f"baseline {baseline.get('commit')} ({baseline.get('created')}) -> current {current.get('commit')}"]
+    if baseline.get("machine") != current.get("machine"):
+        lines.append(f"  note: baseline ran on {baseline.get('machine')}, current on {current.get('machine')}")
+    if baseline.get("settings") != current.get("settings"):
+        lines.append("  note: settings differ between the runs")
+    missing = sorted(set(baseline["results"]) ^ set(current["results"]))
+    if missing:
+        lines.append(f"  cases in only one run: {', '.join(missing)}")
+    width = max([len(row["case"]) for row in rows] + [4])
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        lines.append(
+            f"  {row['case']:<{width}}  {row['metric']:<7} {row['baseline']:>10.4f} -> {row['current']:>10.4f} ms"
+            f"  {row['change_pct']:>+7.1f}%{flag}"
+        )
+    regressed = sum(row["regressed"] for row in rows)
+    lines.append(f"{regressed} regression(s)" if regressed else "no regressions")
+    return "\n".join(lines)
+
+def check(baseline_path: str, current: dict, threshold_pct: float, min_delta_ms: float) -> bool:
+    """Print the comparison against a saved baseline; True when nothing regressed."""
+    baseline = load(baseline_path)
+    if baseline.get("suite") != current.get("suite"):
+        raise SystemExit(f"{baseline_path} is a {baseline.get('suite')} baseline, not {current.get('suite')}")
+    rows = compare(baseline, current, threshold_pct, min_delta_ms)
+    print(report(baseline, current, rows))
+    return not any(row["regressed"] for row in rows)
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """--output/--baseline/--threshold/--min-delta-ms for the benchmark scripts."""
+    parser.add_argument("--output", help="Save results as a JSON baseline to this path")
+    parser.add_argument("--baseline", help="Compare results against this saved baseline")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold, percent")
+    parser.add_argument("--min-delta-ms", type=float, default=0.005,
+                        help="Ignore changes smaller than this many milliseconds")
+
+def finish(args, suite: str, results: Dict[str, dict], settings: dict) -> int:
+    """Save and/or compare per the add_arguments() flags; returns the exit status."""
+    current = document(suite, results, settings)
+    if args.output:
+        save(args.output, current)
+        print(f"saved {args.output}")
+    if args.baseline:
+        return 0 if check(args.baseline, current, args.threshold, args.min_delta_ms) else 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold, percent")
+    parser.add_argument("--min-delta-ms", type=float, default=0.005)
+    args = parser.parse_args()
+    current = load(args.current)
+    sys.exit(0 if check(args.baseline, current, args.threshold, args.min_delta_ms) else 1)
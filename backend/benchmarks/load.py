@@ -0,0 +1,240 @@
+"""
+End-to-end load harness: drives every route of the app in-process.
+
+Generates a synthetic population (benchmarks.population) into a fresh SQLite
+database, then sends a weighted, seeded mix of requests across all routes
+through FastAPI's TestClient, with Redis replaced by the in-process stand-in
+(REDIS_HOST=memory). Requests are sent one at a time so latencies are
+reproducible; use benchmarks.async_throughput for concurrency against a
+real server.
+
+    cd backend
+    python -m benchmarks.load --users 2000 --requests 5000 --output benchmarks/results/load-sync.json
+    python -m benchmarks.load --mode async --baseline benchmarks/results/load-async.json
+
+Reports throughput and p50/p95/p99 per scenario and overall, and warns about
+routes the mix doesn't drive.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, NamedTuple
+
+from benchmarks import baseline
+
+SUITE = "load"
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    route: str  # path template, for coverage
+    weight: float
+    build: Callable[["Context"], dict]  # -> TestClient.request() keyword arguments
+
+class Context:
+    """Ids the scenarios draw from, plus the seeded RNG."""
+
+    def __init__(self, rng: random.Random, user_ids: List[int], region_ids: List[int]):
+        self.rng = rng
+        self.user_ids = user_ids
+        self.region_ids = region_ids
+        self.created = 0
+
+    def user(self) -> int:
+        return self.rng.choice(self.user_ids)
+
+    def region(self) -> int:
+        return self.rng.choice(self.region_ids)
+
+    def unique(self) -> str:
+        self.created += 1
+        return f"load_{os.getpid()}_{self.created}"
+
+    def checkin(self) -> dict:
+        return {
+            "user_id": self.user(),
+            "sleep_hours": round(self.rng.uniform(4, 9.5), 1),
+            "stress_level": self.rng.randint(1, 10),
+            "fatigue_level": self.rng.randint(1, 10),
+            "muscle_soreness": self.rng.randint(1, 10),
+            "available_time": self.rng.choice([20, 30, 45, 60, 90])
+        }
+
+    def environment(self) -> dict:
+        return {
+            "aqi": self.rng.randint(0, 400),
+            "temperature_celsius": round(self.rng.uniform(-5, 44), 1),
+            "is_heatwave": self.rng.random() < 0.1,
+            "lockdown_status": self.rng.choice(["none", "none", "none", "partial", "full"]),
+            "has_local_event": self.rng.random() < 0.05
+        }
+
+def _analytics_params(ctx: Context, **extra) -> dict:
+    end = date.today() + timedelta(days=1)
+    return {"start": (end - timedelta(days=30)).isoformat(), "end": end.isoformat(), **extra}
+
+def _bulk(ctx: Context, rows: int, ndjson: bool) -> dict:
+    items = [{"user_id": ctx.user(), **ctx.environment()} for _ in range(rows)]
+    if ndjson:
+        return {"content": "\n".join(json.dumps(i) for i in items), "headers": {"content-type": "application/x-ndjson"}}
+    return {"content": json.dumps(items), "headers": {"content-type": "application/json"}}
+
+# Roughly a dashboard-heavy day: reads dominate, every route is hit
+SCENARIOS = [
+    Scenario("readiness page (cached)", "GET", "/readiness/{user_id}", 15,
+             lambda c: {"url": f"/readiness/{c.user()}"}),
+    Scenario("readiness page (limit 20)", "GET", "/readiness/{user_id}", 4,
+             lambda c: {"url": f"/readiness/{c.user()}", "params": {"limit": 20}}),
+    Scenario("readiness page (projection)", "GET", "/readiness/{user_id}", 3,
+             lambda c: {"url": f"/readiness/{c.user()}", "params": {"fields": "date,readiness_score,decision"}}),
+    Scenario("environment impact", "GET", "/environment-impact/{user_id}", 15,
+             lambda c: {"url": f"/environment-impact/{c.user()}"}),
+    Scenario("environment history", "GET", "/environment-history/{user_id}", 5,
+             lambda c: {"url": f"/environment-history/{c.user()}"}),
+    Scenario("today's decision", "GET", "/decisions/{user_id}/today", 5,
+             lambda c: {"url": f"/decisions/{c.user()}/today"}),
+    Scenario("trends", "GET", "/trends/{user_id}", 5,
+             lambda c: {"url": f"/trends/{c.user()}"}),
+    Scenario("region environment", "GET", "/regions/{region_id}/environment", 3,
+             lambda c: {"url": f"/regions/{c.region()}/environment"}),
+    Scenario("submit readiness", "POST", "/readiness/", 10,
+             lambda c: {"url": "/readiness/", "json": c.checkin()}),
+    Scenario("combined readiness", "POST", "/combined-readiness/", 6,
+             lambda c: {"url": "/combined-readiness/", "json": {**c.checkin(), **c.environment()}}),
+    Scenario("combined readiness (region)", "POST", "/combined-readiness/", 3,
+             lambda c: {"url": "/combined-readiness/", "json": c.checkin()}),
+    Scenario("readiness batch (100)", "POST", "/readiness/batch", 2,
+             lambda c: {"url": "/readiness/batch", "json": {
+                 k: [v[k] for v in [c.checkin() for _ in range(100)]]
+                 for k in ("sleep_hours", "stress_level", "fatigue_level", "muscle_soreness", "available_time")
+             }}),
+    Scenario("environment input", "POST", "/environment-input", 4,
+             lambda c: {"url": "/environment-input", "json": {"user_id": c.user(), **c.environment()}}),
+    Scenario("environment bulk (50, json)", "POST", "/environment-input/bulk", 1,
+             lambda c: {"url": "/environment-input/bulk", **_bulk(c, 50, ndjson=False)}),
+    Scenario("environment bulk (50, ndjson)", "POST", "/environment-input/bulk", 1,
+             lambda c: {"url": "/environment-input/bulk", **_bulk(c, 50, ndjson=True)}),
+    Scenario("create user", "POST", "/users/", 1,
+             lambda c: {"url": "/users/", "json": {"username": (name := c.unique()), "email": f"{name}@example.com"}}),
+    Scenario("set user region", "PUT", "/users/{user_id}/region", 1,
+             lambda c: {"url": f"/users/{c.user()}/region", "json": {"region_id": c.region()}}),
+    Scenario("create region", "POST", "/regions/", 0.3,
+             lambda c: {"url": "/regions/", "json": {"name": c.unique()}}),
+    Scenario("region snapshot", "POST", "/regions/{region_id}/snapshots", 0.5,
+             lambda c: {"url": f"/regions/{c.region()}/snapshots", "json": c.environment()}),
+    Scenario("decision analytics (rollup)", "GET", "/analytics/decisions", 1,
+             lambda c: {"url": "/analytics/decisions", "params": _analytics_params(c)}),
+    Scenario("decision analytics (raw, by region)", "GET", "/analytics/decisions", 0.5,
+             lambda c: {"url": "/analytics/decisions", "params": _analytics_params(c, use_rollup=False, by_region=True)}),
+    Scenario("severity analytics", "GET", "/analytics/severity", 1,
+             lambda c: {"url": "/analytics/severity", "params": _analytics_params(c)}),
+    Scenario("export readiness (user, ndjson)", "GET", "/export/readiness", 1,
+             lambda c: {"url": "/export/readiness", "params": {"user_id": c.user()}}),
+    Scenario("export environment (user, csv)", "GET", "/export/environment", 1,
+             lambda c: {"url": "/export/environment", "params": {"user_id": c.user(), "format": "csv"}}),
+    Scenario("root", "GET", "/", 0.3, lambda c: {"url": "/"}),
+    Scenario("health db", "GET", "/health/db", 0.3, lambda c: {"url": "/health/db"}),
+    Scenario("health cache", "GET", "/health/cache", 0.3, lambda c: {"url": "/health/cache"}),
+    Scenario("health write-behind", "GET", "/health/write-behind", 0.3, lambda c: {"url": "/health/write-behind"}),
+    Scenario("metrics", "GET", "/metrics", 0.3, lambda c: {"url": "/metrics"}),
+]
+
+def undriven_routes(app) -> List[str]:
+    """API routes (from the OpenAPI document) no scenario sends requests to."""
+    driven = {(s.method, s.route) for s in SCENARIOS}
+    routes = []
+    for path, operations in app.openapi()["paths"].items():
+        for method in operations:
+            if (method.upper(), path) not in driven:
+                routes.append(f"{method.upper()} {path}")
+    return routes
+
+def run(client, ctx: Context, requests: int, warmup: int) -> Dict[str, dict]:
+    weights = [s.weight for s in SCENARIOS]
+    schedule = ctx.rng.choices(SCENARIOS, weights=weights, k=warmup + requests)
+    timings: Dict[str, List[float]] = {s.name: [] for s in SCENARIOS}
+    errors: Dict[str, int] = {s.name: 0 for s in SCENARIOS}
+    everything = []
+
+    started = None
+    for index, scenario in enumerate(schedule):
+        if index == warmup:
+            started = time.perf_counter()
+        kwargs = scenario.build(ctx)
+        sent = time.perf_counter()
+        response = client.request(scenario.method, **kwargs)
+        elapsed = time.perf_counter() - sent
+        if index < warmup:
+            continue
+        timings[scenario.name].append(elapsed)
+        everything.append(elapsed)
+        if response.status_code >= 400:
+            errors[scenario.name] += 1
+    total = time.perf_counter() - started if started is not None else 0.0
+
+    results = {}
+    for scenario in SCENARIOS:
+        if timings[scenario.name]:
+            results[scenario.name] = {**baseline.summarize(timings[scenario.name], digits=3),
+                                      "errors": errors[scenario.name]}
+    results["all"] = {**baseline.summarize(everything, elapsed=total, digits=3), "errors": sum(errors.values())}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="DB_ASYNC=0 or 1")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--max-days", type=int, default=365, help="Longest generated history")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="Default: a new SQLite file in a temporary directory")
+    baseline.add_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    # The app reads these at import
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["DB_ASYNC"] = "1" if args.mode == "async" else "0"
+    os.environ.setdefault("REDIS_HOST", "memory")
+    # Snapshots would otherwise start precompute jobs in worker processes mid-run
+    os.environ.setdefault("PRECOMPUTE_ON_SNAPSHOT", "0")
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from benchmarks import population
+
+    summary = population.generate(args.users, args.max_days, seed=args.seed)
+    print(
+        f"population: {summary['users']} users, {summary['checkins']} check-ins "
+        f"(history median {summary['history_p50']}, max {summary['history_max']} days), "
+        f"{summary['environment_reports']} environment reports in {summary['elapsed_s']}s",
+        flush=True
+    )
+    missing = undriven_routes(app)
+    if missing:
+        print(f"warning: routes not driven: {', '.join(missing)}", flush=True)
+
+    ctx = Context(random.Random(args.seed), summary["user_ids"], summary["region_ids"])
+    with TestClient(app) as client:
+        results = run(client, ctx, args.requests, args.warmup)
+
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        print(
+            f"{name:<{width}}  n={result['count']:<6} {result['per_s']:>9.1f} req/s  "
+            f"p50={result['p50_ms']:>7.2f}ms p95={result['p95_ms']:>7.2f}ms p99={result['p99_ms']:>7.2f}ms"
+            f"{'  errors=' + str(result['errors']) if result['errors'] else ''}"
+        )
+
+    settings = {key: getattr(args, key) for key in ("mode", "users", "max_days", "requests", "warmup", "seed")}
+    settings["write_behind"] = os.getenv("WRITE_BEHIND", "0")
+    sys.exit(baseline.finish(args, SUITE, results, settings))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Microbenchmarks for the engines and response serialization.
+
+Each case runs --repeat rounds of --number calls over a fixed, seeded set of
+inputs; percentiles are over the per-call time of each round, per_s is calls
+per second. No database or Redis is touched.
+
+    cd backend
+    python -m benchmarks.micro --output benchmarks/results/micro.json
+    python -m benchmarks.micro --baseline benchmarks/results/micro.json
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+# The app modules connect lazily but read their settings at import
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("REDIS_HOST", "memory")
+
+import numpy as np
+from app import engine, environment_engine, fast_json, metrics, schemas, services
+from benchmarks import baseline
+
+SUITE = "micro"
+INPUTS = 1000
+
+def _inputs(seed: int) -> List[dict]:
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "user_id": int(rng.integers(1, 10000)),
+            "sleep_hours": round(float(rng.uniform(3, 10)), 1),
+            "stress_level": int(rng.integers(1, 11)),
+            "fatigue_level": int(rng.integers(1, 11)),
+            "muscle_soreness": int(rng.integers(1, 11)),
+            "available_time": int(rng.choice([15, 20, 30, 45, 60, 90])),
+            "aqi": int(rng.integers(0, 400)),
+            "temperature_celsius": round(float(rng.uniform(-5, 45)), 1),
+            "is_heatwave": bool(rng.random() < 0.1),
+            "lockdown_status": str(rng.choice(["none", "partial", "full"])),
+            "has_local_event": bool(rng.random() < 0.05)
+        }
+        for _ in range(INPUTS)
+    ]
+
+def _history_rows(count: int) -> List[SimpleNamespace]:
+    """Stand-ins for loaded DailyReadiness rows (rendering reads attributes)."""
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i, data in enumerate(_inputs(7)[:count]):
+        score, decision, explanation = engine.calculate_readiness(
+            data["sleep_hours"], data["stress_level"], data["fatigue_level"], data["muscle_soreness"]
+        )
+        rows.append(SimpleNamespace(
+            id=count - i, user_id=1, date=now - timedelta(days=i), readiness_score=score, decision=decision,
+            explanation=explanation, **{k: data[k] for k in (
+                "sleep_hours", "stress_level", "fatigue_level", "muscle_soreness", "available_time")}
+        ))
+    return rows
+
+def cases(seed: int) -> Dict[str, Tuple[Callable, list]]:
+    """name -> (function of one input, inputs to cycle through)."""
+    data = _inputs(seed)
+    requests = [schemas.CombinedReadinessRequest(**d) for d in data]
+    impacts = [
+        environment_engine.calculate_environment_impact(
+            d["aqi"], d["temperature_celsius"], d["is_heatwave"], d["lockdown_status"], d["has_local_event"]
+        )
+        for d in data
+    ]
+    readiness = [
+        engine.calculate_readiness(d["sleep_hours"], d["stress_level"], d["fatigue_level"], d["muscle_soreness"])
+        for d in data
+    ]
+    responses = [services.combined_readiness(r)[0] for r in requests]
+    columns = {k: np.array([d[k] for d in data]) for k in (
+        "sleep_hours", "stress_level", "fatigue_level", "muscle_soreness", "available_time")}
+    history = _history_rows(services.HISTORY_DEFAULT_LIMIT)
+
+    return {
+        "engine.calculate_readiness": (
+            lambda d: engine.calculate_readiness(d["sleep_hours"], d["stress_level"], d["fatigue_level"], d["muscle_soreness"]),
+            data
+        ),
+        "engine.calculate_readiness_batch[1000]": (
+            lambda c: engine.calculate_readiness_batch(*c.values()),
+            [columns]
+        ),
+        "environment.calculate_environment_impact": (
+            lambda d: environment_engine.calculate_environment_impact(
+                d["aqi"], d["temperature_celsius"], d["is_heatwave"], d["lockdown_status"], d["has_local_event"]
+            ),
+            data
+        ),
+        "environment.apply_environment_to_readiness": (
+            lambda pair: environment_engine.apply_environment_to_readiness(
+                pair[1][1], pair[1][0], pair[0][0], pair[0][2]
+            ),
+            list(zip(impacts, readiness))
+        ),
+        "request.validate_combined": (
+            lambda d: schemas.CombinedReadinessRequest.model_validate(d),
+            data
+        ),
+        "services.combined_readiness": (
+            lambda r: services.combined_readiness(r),
+            requests
+        ),
+        "serialize.combined_response": (
+            lambda r: fast_json.render(schemas.CombinedReadinessResponse, r),
+            responses
+        ),
+        "serialize.combined_response (models)": (
+            lambda r: fast_json.reference(schemas.CombinedReadinessResponse, r),
+            responses
+        ),
+        f"serialize.readiness_page[{len(history)}]": (
+            lambda rows: fast_json.render_many(schemas.DailyReadinessResponse, rows),
+            [history]
+        ),
+        f"serialize.readiness_page[{len(history)}] (models)": (
+            lambda rows: fast_json.reference(schemas.DailyReadinessResponse, rows, many=True),
+            [history]
+        ),
+    }
+
+def measure(fn: Callable, inputs: list, number: int, repeat: int, warmup: int = 1) -> dict:
+    count = len(inputs)
+    per_call = []
+    for round_ in range(warmup + repeat):
+        started = time.perf_counter()
+        for i in range(number):
+            fn(inputs[i % count])
+        elapsed = time.perf_counter() - started
+        if round_ >= warmup:
+            per_call.append(elapsed / number)
+    result = baseline.summarize(per_call, digits=6)
+    result["calls"] = number * repeat
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="Calls per round")
+    parser.add_argument("--repeat", type=int, default=30, help="Rounds per case")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--filter", help="Only cases whose name contains this")
+    baseline.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    for name, (fn, inputs) in cases(args.seed).items():
+        if args.filter and args.filter not in name:
+            continue
+        # Batch and page cases do far more work per call
+        number = max(1, args.number // 100) if "[" in name else args.number
+        result = measure(fn, inputs, number, args.repeat)
+        results[name] = result
+        print(
+            f"{name:<48} {result['per_s']:>12.1f} /s  p50={result['p50_ms'] * 1000:>9.2f}us "
+            f"p95={result['p95_ms'] * 1000:>9.2f}us p99={result['p99_ms'] * 1000:>9.2f}us",
+            flush=True
+        )
+
+    settings = {"number": args.number, "repeat": args.repeat, "seed": args.seed,
+                "metrics_enabled": metrics.METRICS_ENABLED, "fast_json_enabled": fast_json.FAST_JSON_ENABLED}
+    sys.exit(baseline.finish(args, SUITE, results, settings))
+
+if __name__ == "__main__":
+    main()
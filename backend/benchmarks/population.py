@@ -0,0 +1,166 @@
+"""
+Synthetic user population for benchmarks.
+
+History lengths follow a long-tailed distribution like real sign-ups: most
+users have a few weeks of check-ins, a few have checked in daily for most of
+a year (lognormal, median HISTORY_MEDIAN_DAYS, capped at max_days). Users
+skip days at random; each check-in day may also carry a per-user
+environment report. A share of users belong to regions that have a current
+snapshot. Stored rows are scored with the real engines, so they look exactly
+like rows written through the API, and trends and analytics rollups are
+rebuilt from them.
+
+The app modules read DATABASE_URL at import: set it (and REDIS_HOST=memory)
+before importing this module.
+
+    cd backend
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.population --users 2000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, time as day_time, timedelta, timezone
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import insert
+
+from app import analytics, database, engine, environment_engine, explanations, migrations, models, services, trends
+
+HISTORY_MEDIAN_DAYS = 21
+INSERT_CHUNK = 5000
+LOCKDOWN_STATUSES = ("none", "partial", "full")
+
+def _environment(rng: np.random.Generator) -> dict:
+    """Mostly benign conditions with bad-air, heat and lockdown days mixed in."""
+    heat = rng.random() < 0.08
+    return {
+        "aqi": int(min(500, rng.gamma(2.0, 40.0))),
+        "temperature_celsius": round(float(rng.normal(36 if heat else 20, 6)), 1),
+        "is_heatwave": bool(heat),
+        "lockdown_status": str(rng.choice(LOCKDOWN_STATUSES, p=(0.93, 0.05, 0.02))),
+        "has_local_event": bool(rng.random() < 0.03)
+    }
+
+def history_lengths(rng: np.random.Generator, users: int, max_days: int) -> np.ndarray:
+    lengths = rng.lognormal(np.log(HISTORY_MEDIAN_DAYS), 1.0, users)
+    return np.clip(lengths.astype(np.int64), 1, max_days)
+
+def _checkin_inputs(rng: np.random.Generator, n: int) -> Dict[str, np.ndarray]:
+    return {
+        "sleep_hours": np.round(np.clip(rng.normal(7.0, 1.2, n), 3, 11), 1),
+        "stress_level": rng.integers(1, 11, n),
+        "fatigue_level": rng.integers(1, 11, n),
+        "muscle_soreness": rng.integers(1, 11, n),
+        "available_time": rng.choice(np.array([15, 20, 30, 45, 60, 90]), n)
+    }
+
+def _flush(db, model, rows: List[dict]):
+    if rows:
+        db.execute(insert(model), rows)
+        rows.clear()
+
+def generate(users: int = 1000, max_days: int = 365, regions: int = 10, region_share: float = 0.3,
+             environment_share: float = 0.3, seed: int = 42) -> dict:
+    """Insert a population into the configured database; returns ids and row counts."""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    migrations.upgrade(database.engine, models.Base.metadata)
+    explanations.register_catalog(database.engine)
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    run_id = f"{seed}_{int(time.time())}"
+
+    db = database.SessionLocal()
+    try:
+        # Regions with a current snapshot each
+        region_rows = [models.Region(name=f"bench_{run_id}_region_{i}") for i in range(regions)]
+        db.add_all(region_rows)
+        db.flush()
+        region_ids = [region.id for region in region_rows]
+        for region_id in region_ids:
+            conditions = _environment(rng)
+            impact = environment_engine.calculate_environment_impact(**conditions)
+            db.add(models.EnvironmentSnapshot(
+                region_id=region_id, date=now - timedelta(hours=1),
+                **conditions, **services.environment_policy_fields(*impact)
+            ))
+
+        user_rows = [
+            models.User(
+                username=f"bench_{run_id}_{i}",
+                email=f"bench_{run_id}_{i}@example.com",
+                region_id=int(rng.choice(region_ids)) if region_ids and rng.random() < region_share else None
+            )
+            for i in range(users)
+        ]
+        db.add_all(user_rows)
+        db.flush()
+        user_ids = [user.id for user in user_rows]
+        lengths = history_lengths(rng, users, max_days)
+
+        readiness, environment = [], []
+        counts = {"checkins": 0, "environment_reports": 0}
+        for user_id, length in zip(user_ids, lengths.tolist()):
+            # Check-in days within the last length / 0.8 days, newest today
+            span = min(max_days, int(length / 0.8) + 1)
+            offsets = np.sort(rng.choice(span, size=min(length, span), replace=False))[::-1]
+            days = [today - timedelta(days=int(offset)) for offset in offsets]
+            inputs = _checkin_inputs(rng, len(days))
+            scores, decisions, codes = engine.calculate_readiness_batch(
+                inputs["sleep_hours"], inputs["stress_level"], inputs["fatigue_level"],
+                inputs["muscle_soreness"], inputs["available_time"]
+            )
+            for i, day in enumerate(days):
+                stamp = datetime.combine(day, day_time(6), timezone.utc) + timedelta(minutes=int(rng.integers(0, 14 * 60)))
+                stamp = min(stamp, now)
+                readiness.append({
+                    "user_id": user_id,
+                    "date": stamp,
+                    **{name: values[i].item() for name, values in inputs.items()},
+                    "readiness_score": int(scores[i]),
+                    "decision": engine.DECISIONS[decisions[i]],
+                    "explanation": engine.explain_codes(int(codes[i]), int(scores[i]))
+                })
+                if rng.random() < environment_share:
+                    conditions = _environment(rng)
+                    impact = environment_engine.calculate_environment_impact(**conditions)
+                    environment.append({
+                        "user_id": user_id, "date": stamp, "created_at": stamp, "updated_at": stamp,
+                        **conditions, **services.environment_policy_fields(*impact)
+                    })
+                    counts["environment_reports"] += 1
+            counts["checkins"] += len(days)
+            if len(readiness) >= INSERT_CHUNK:
+                _flush(db, models.DailyReadiness, readiness)
+                _flush(db, models.EnvironmentPolicy, environment)
+        _flush(db, models.DailyReadiness, readiness)
+        _flush(db, models.EnvironmentPolicy, environment)
+        db.commit()
+    finally:
+        db.close()
+
+    trends.rebuild()
+    first = today - timedelta(days=max_days)
+    analytics.refresh_rollups(first, today)
+    return {
+        "user_ids": user_ids,
+        "region_ids": region_ids,
+        "users": users,
+        **counts,
+        "history_p50": int(np.median(lengths)),
+        "history_max": int(lengths.max()),
+        "elapsed_s": round(time.perf_counter() - started, 2)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic user population")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--max-days", type=int, default=365)
+    parser.add_argument("--regions", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    summary = generate(args.users, args.max_days, args.regions, seed=args.seed)
+    summary.pop("user_ids")
+    summary.pop("region_ids")
+    print(json.dumps(summary))
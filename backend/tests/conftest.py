@@ -0,0 +1,75 @@
+"""
+Test settings are environment variables read at import, so they are set
+here before anything imports the app: a throwaway SQLite database, the
+in-process Redis stand-in and the async engine (aiosqlite), so both the
+sync handlers in main.py and their async_api mirrors can be served.
+"""
+import itertools
+import os
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix="exercise-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}")
+os.environ.setdefault("REDIS_HOST", "memory")
+os.environ.setdefault("DB_ASYNC", "1")
+
+import pytest
+from fastapi.testclient import TestClient
+
+_usernames = itertools.count(1)
+
+@pytest.fixture(scope="session", autouse=True)
+def application():
+    """The app, on a schema created the way deploys do (importing it stores the explanation catalog)."""
+    from app import database, migrations, models
+
+    migrations.upgrade(database.engine, models.Base.metadata)
+    from app.main import app
+
+    return app
+
+@pytest.fixture(scope="session")
+def applications(application):
+    """
+    The app with each set of database handlers, "sync" (main.router) and
+    "async" (async_api.router); main.py serves one of them per process.
+    """
+    from fastapi import FastAPI
+    from app import async_api, main
+
+    handlers = {route.endpoint for route in [*main.router.routes, *async_api.router.routes]}
+    shared = [route for route in application.routes if getattr(route, "endpoint", None) not in handlers]
+    variants = {}
+    for name, router in (("sync", main.router), ("async", async_api.router)):
+        variant = FastAPI(title=application.title, lifespan=main.lifespan)
+        variant.router.routes.extend(shared)
+        variant.include_router(router)
+        variants[name] = variant
+    return variants
+
+@pytest.fixture(params=["sync", "async"])
+def client(request, applications):
+    """A client for each set of handlers: every API test runs against both."""
+    with TestClient(applications[request.param]) as test_client:
+        yield test_client
+
+@pytest.fixture
+def db():
+    from app import database
+
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def user_id(db):
+    """A new user, so cached reads from other tests never leak in."""
+    from app import models
+
+    n = next(_usernames)
+    user = models.User(username=f"test-user-{n}", email=f"test-user-{n}@example.com")
+    db.add(user)
+    db.commit()
+    return user.id
@@ -0,0 +1,75 @@
+"""The async handlers (async_api.py) against their sync counterparts in main.py."""
+import itertools
+
+import pytest
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+
+CHECKIN = {"sleep_hours": 6.5, "stress_level": 4, "fatigue_level": 5, "muscle_soreness": 3, "available_time": 25}
+# Differ between runs, not between handlers
+VOLATILE = {"id", "user_id", "region_id", "date", "computed_at", "readiness_id", "environment_snapshot_id",
+            "environment_policy_id", "valid_from", "valid_until", "name", "username", "email", "updated_at"}
+
+_runs = itertools.count(1)
+
+def _strip(value):
+    if isinstance(value, dict):
+        return {k: _strip(v) for k, v in value.items() if k not in VOLATILE}
+    if isinstance(value, list):
+        return [_strip(v) for v in value]
+    return value
+
+def _routes(router):
+    return {(route.path, method) for route in router.routes if isinstance(route, APIRoute) for method in route.methods}
+
+def test_every_sync_route_has_an_async_mirror():
+    from app import async_api, main
+
+    assert _routes(main.router) == _routes(async_api.router)
+
+def _scenario(client) -> list:
+    """The same requests against one set of handlers; returns (status, cache header, body) per request."""
+    from app import precompute
+
+    n = next(_runs)
+    user_id = client.post("/users/", json={"username": f"parity-{n}", "email": f"parity-{n}@example.com"}).json()["id"]
+    region_id = client.post("/regions/", json={"name": f"parity-{n}"}).json()["id"]
+    requests = [
+        ("post", "/environment-input", {"user_id": user_id, "aqi": 180, "temperature_celsius": 36.0}),
+        ("get", f"/environment-impact/{user_id}", None),
+        ("get", f"/environment-impact/{user_id}", None),
+        ("get", f"/environment-history/{user_id}", None),
+        ("post", "/readiness/", {**CHECKIN, "user_id": user_id}),
+        ("get", f"/readiness/{user_id}", None),
+        ("get", f"/readiness/{user_id}", None),
+        ("get", f"/readiness/{user_id}?fields=readiness_score,decision", None),
+        ("put", f"/users/{user_id}/region", {"region_id": region_id}),
+        # Dated before the environment input, so which one applies never depends on timing
+        ("post", f"/regions/{region_id}/snapshots", {"aqi": 320, "valid_from": "2020-01-01T00:00:00Z"}),
+        ("get", f"/regions/{region_id}/environment", None),
+        ("post", "/combined-readiness/", {**CHECKIN, "user_id": user_id}),
+        ("get", f"/trends/{user_id}", None),
+        ("get", f"/decisions/{user_id}/today", "precompute"),
+        ("post", "/readiness/", {**CHECKIN, "sleep_hours": 9, "user_id": user_id}),
+        ("get", f"/decisions/{user_id}/today", None),
+        ("get", f"/decisions/{user_id}/today", None),
+    ]
+    results = []
+    for method, path, body in requests:
+        if body == "precompute":
+            precompute.precompute_decisions(workers=1)
+            body = None
+        response = client.request(method, path, json=body)
+        content = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+        results.append((method, path.replace(str(user_id), "{user}").replace(str(region_id), "{region}"),
+                        response.status_code, response.headers.get("X-Cache"), _strip(content)))
+    return results
+
+def test_async_handlers_respond_like_the_sync_ones(applications):
+    responses = {}
+    for name, application in applications.items():
+        with TestClient(application) as client:
+            responses[name] = _scenario(client)
+    for sync, async_ in zip(responses["sync"], responses["async"]):
+        assert sync == async_
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import cache, services
+
+@pytest.fixture
+def redis(monkeypatch):
+    backend = cache.InMemoryRedis()
+    monkeypatch.setattr(cache, "client", cache.CacheClient(factory=lambda: backend))
+    yield backend
+    cache.client.close()
+
+def _drain():
+    cache.client.close()  # waits for queued writes
+
+def test_read_through_round_trip(redis):
+    assert cache.read(cache.READINESS_PAGE, 1) == (None, "0")
+    cache.write(cache.READINESS_PAGE, 1, "payload", "0")
+    _drain()
+    assert cache.read(cache.READINESS_PAGE, 1) == ("payload", "0")
+
+def test_write_of_a_read_from_before_an_invalidation_is_a_miss(redis):
+    _, generation = cache.read(cache.ENVIRONMENT_IMPACT, 2)
+    cache.invalidate(2, cache.ENVIRONMENT_IMPACT)  # a write commits while the read is still querying
+    cache.write(cache.ENVIRONMENT_IMPACT, 2, "stale", generation)
+    _drain()
+    value, newer = cache.read(cache.ENVIRONMENT_IMPACT, 2)
+    assert value is None and newer != generation
+
+def test_invalidations_are_replayed_after_an_outage(redis):
+    cache.write(cache.DAILY_DECISION, 3, "cached", "0")
+    _drain()
+    cache.client._redis = None  # Redis went away
+    cache.invalidate(3)
+    assert cache.client.stats()["pending_invalidations"] == len(cache.CACHE_TTLS)
+
+    cache.client._redis = redis
+    cache.client._replay_invalidations()
+    assert cache.client.stats()["pending_invalidations"] == 0
+    assert cache.read(cache.DAILY_DECISION, 3)[0] is None
+
+def test_nothing_is_cached_without_a_generation(redis):
+    cache.client._redis = None
+    value, generation = cache.read(cache.READINESS_PAGE, 4)
+    assert (value, generation) == (None, None)
+    cache.client._redis = redis
+    cache.write(cache.READINESS_PAGE, 4, "unverified", generation)
+    _drain()
+    assert cache.read(cache.READINESS_PAGE, 4)[0] is None
+
+def test_async_handlers_read_the_cache_off_the_event_loop(redis, monkeypatch):
+    threads = []
+    mget = redis.mget
+    monkeypatch.setattr(redis, "mget", lambda *keys: threads.append(threading.get_ident()) or mget(*keys))
+
+    async def read():
+        await services.acached_response(cache.READINESS_PAGE, 5)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(read())
+    assert threads and loop_thread not in threads
+
+def test_breaker_opens_after_consecutive_failures_and_probes_after_reset():
+    breaker = cache.CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()  # the probe
+    assert breaker.state == breaker.HALF_OPEN and not breaker.allow()
+    breaker.record_failure()  # a failed probe re-opens at once
+    assert breaker.state == breaker.OPEN and breaker.times_opened == 2
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED and breaker.allow()
+
+def test_reads_fail_fast_as_misses_while_the_breaker_is_open(redis, monkeypatch):
+    calls = []
+
+    def broken(*keys):
+        calls.append(keys)
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(redis, "mget", broken)
+    for _ in range(cache.client.breaker.failure_threshold + 5):
+        assert cache.client.get("some-key") is None
+    assert len(calls) == cache.client.breaker.failure_threshold
+    assert cache.client.stats()["breaker"]["state"] == cache.CircuitBreaker.OPEN
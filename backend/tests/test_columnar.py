@@ -0,0 +1,47 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from app import columnar, models
+
+CHECKIN = {"sleep_hours": 7, "stress_level": 4, "fatigue_level": 3, "muscle_soreness": 2, "available_time": 45}
+
+def _checkin(client, user_id) -> int:
+    return client.post("/readiness/", json={**CHECKIN, "user_id": user_id}).json()["id"]
+
+def _age(db, *conditions):
+    """Date the matching rows an hour ago."""
+    db.execute(update(models.DailyReadiness).where(*conditions)
+               .values(date=datetime.now(timezone.utc) - timedelta(hours=1)))
+    db.commit()
+
+def test_export_stops_before_rows_within_the_safety_lag(client, db, user_id, tmp_path):
+    old, recent, older_again = (_checkin(client, user_id) for _ in range(3))
+    _age(db, models.DailyReadiness.id <= old)  # including other tests' rows
+    _age(db, models.DailyReadiness.id == older_again)
+
+    columnar.export(str(tmp_path), safety_lag_seconds=600)
+    manifest = columnar.read_manifest(str(tmp_path))
+    # Everything from the first recent row on waits, even older-dated rows with higher ids
+    assert old <= manifest["last_id"] < recent
+
+    _age(db, models.DailyReadiness.id == recent)
+    columnar.export(str(tmp_path), safety_lag_seconds=600)
+    exported = columnar.ReadinessHistory(str(tmp_path)).column("id")
+    assert {old, recent, older_again} <= set(exported.tolist())
+    assert len(exported) == len(set(exported.tolist()))
+
+def test_export_rerun_after_a_crash_replaces_the_stale_segment(client, user_id, tmp_path):
+    _checkin(client, user_id)
+    columnar.export(str(tmp_path), safety_lag_seconds=0)
+    manifest = columnar.read_manifest(str(tmp_path))
+    _checkin(client, user_id)
+    first_summary = columnar.export(str(tmp_path), safety_lag_seconds=0)
+    # Crash after the segment was renamed into place but before the manifest was written
+    columnar._write_manifest(str(tmp_path), manifest)
+
+    summary = columnar.export(str(tmp_path), safety_lag_seconds=0)
+    assert summary["rows_added"] == first_summary["rows_added"]
+    names = {segment["name"] for segment in columnar.read_manifest(str(tmp_path))["segments"]}
+    assert set(os.listdir(tmp_path)) - {columnar.MANIFEST} == names
@@ -0,0 +1,44 @@
+"""calculate_readiness_batch against the scalar engine, as the API applies it (services.score_checkin)."""
+import itertools
+import random
+from types import SimpleNamespace
+
+from app import engine, services
+
+# Both sides of every threshold the engine and the time constraint use
+SLEEP_GRID = sorted(set(
+    [h / 4 for h in range(0, 49)]
+    + [4.999999, 5.000001, 6.499999, 6.500001, 7.999999, 8.000001, 0.1 + 0.2, 5 + 1e-12, 24.0]
+))
+LEVELS = range(1, 11)
+AVAILABLE_TIME = (0, 29, 30, 240)
+
+def _mismatches(rows):
+    scores, decisions, codes = engine.calculate_readiness_batch(*zip(*rows))
+    found = []
+    for row, score, decision, code in zip(rows, scores.tolist(), decisions.tolist(), codes.tolist()):
+        checkin = SimpleNamespace(sleep_hours=row[0], stress_level=row[1], fatigue_level=row[2],
+                                  muscle_soreness=row[3], available_time=row[4])
+        expected = services.score_checkin(checkin)
+        if (score, engine.DECISIONS[decision], engine.explain_codes(code, score)) != expected:
+            found.append((row, expected))
+            if len(found) >= 20:
+                break
+    return found
+
+def test_batch_matches_scalar_over_the_boundary_grid():
+    rows = list(itertools.product(SLEEP_GRID, LEVELS, LEVELS, LEVELS, AVAILABLE_TIME))
+    assert not _mismatches(rows)
+
+def test_batch_matches_scalar_on_random_inputs():
+    rng = random.Random(1)
+    rows = [
+        (round(rng.uniform(0, 14), rng.randint(0, 6)), rng.randint(1, 10), rng.randint(1, 10),
+         rng.randint(1, 10), rng.randint(0, 300))
+        for _ in range(50000)
+    ]
+    assert not _mismatches(rows)
+
+def test_empty_batch():
+    scores, decisions, codes = engine.calculate_readiness_batch([], [], [], [], [])
+    assert scores.shape == decisions.shape == codes.shape == (0,)
@@ -0,0 +1,17 @@
+from app import models, schemas, services
+
+def test_history_recomputes_rows_from_older_rules_without_writing(client, db, user_id):
+    data = schemas.EnvironmentInputCreate(user_id=user_id, aqi=320)
+    row = services.environment_policy_row(data, *services.evaluate_environment(data))
+    expected = row.max_intensity_percent
+    row.max_intensity_percent, row.rules_version = 100, 0  # as stored under older rules
+    db.add(row)
+    db.commit()
+
+    response = client.get(f"/environment-history/{user_id}")
+    assert response.status_code == 200
+    assert response.json()[0]["constraints"]["max_intensity_percent"] == expected
+
+    db.expire_all()
+    stored = db.get(models.EnvironmentPolicy, row.id)
+    assert (stored.max_intensity_percent, stored.rules_version) == (100, 0)
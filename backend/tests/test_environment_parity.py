@@ -0,0 +1,311 @@
+"""
+Parity of the compiled environment rule table with the hand-written rule
+chain that environment_rules.json replaced, kept here as the reference, over
+the full input grid. Rule edits in the JSON file are expected to fail this;
+update the reference with them.
+"""
+import functools
+import itertools
+from types import SimpleNamespace
+from typing import List, Tuple
+
+import pytest
+
+from app.environment_engine import EnvironmentAdjustment, WorkoutConstraints, calculate_environment_impact
+
+_FORMATTED_RULES = frozenset([
+    "AQI_HAZARDOUS", "AQI_VERY_UNHEALTHY", "AQI_UNHEALTHY", "AQI_MODERATE_SENSITIVE",
+    "TEMP_EXTREME_HOT", "TEMP_HOT", "TEMP_EXTREME_COLD"
+])
+
+REFERENCE_ADJUSTMENTS = {
+    "AQI_HAZARDOUS": EnvironmentAdjustment(
+        rule_id="AQI_HAZARDOUS",
+        trigger="AQI is hazardous ({aqi})",
+        action="Block all outdoor workouts, reduce intensity to 50%, limit duration to 30min",
+        reason="Air quality is hazardous (AQI {aqi}). Outdoor exercise poses severe health risks including respiratory damage."
+    ),
+    "AQI_VERY_UNHEALTHY": EnvironmentAdjustment(
+        rule_id="AQI_VERY_UNHEALTHY",
+        trigger="AQI is very unhealthy ({aqi})",
+        action="Block outdoor workouts, reduce intensity to 60%, limit duration to 45min",
+        reason="Air quality is very unhealthy (AQI {aqi}). Avoid all outdoor activities to prevent respiratory issues."
+    ),
+    "AQI_UNHEALTHY": EnvironmentAdjustment(
+        rule_id="AQI_UNHEALTHY",
+        trigger="AQI is unhealthy ({aqi})",
+        action="Reduce intensity to 70%, limit duration to 60min, prefer indoor",
+        reason="Air quality is unhealthy (AQI {aqi}). Outdoor high-intensity exercise may cause respiratory discomfort."
+    ),
+    "AQI_MODERATE_SENSITIVE": EnvironmentAdjustment(
+        rule_id="AQI_MODERATE_SENSITIVE",
+        trigger="AQI is unhealthy for sensitive groups ({aqi})",
+        action="Reduce intensity to 85%",
+        reason="Air quality is unhealthy for sensitive groups (AQI {aqi}). Consider reducing outdoor workout intensity."
+    ),
+    "TEMP_EXTREME_HOT": EnvironmentAdjustment(
+        rule_id="TEMP_EXTREME_HOT",
+        trigger="Temperature is extreme ({temperature_celsius}°C)",
+        action="Reduce intensity to 50%, limit duration to 30min, move indoors",
+        reason="Temperature is dangerously high ({temperature_celsius}°C). High risk of heat stroke and dehydration."
+    ),
+    "TEMP_HOT": EnvironmentAdjustment(
+        rule_id="TEMP_HOT",
+        trigger="Temperature is hot ({temperature_celsius}°C)",
+        action="Reduce intensity to 65%, limit duration to 45min",
+        reason="Temperature is very hot ({temperature_celsius}°C). Increase hydration and avoid peak sun hours."
+    ),
+    "TEMP_EXTREME_COLD": EnvironmentAdjustment(
+        rule_id="TEMP_EXTREME_COLD",
+        trigger="Temperature is extreme cold ({temperature_celsius}°C)",
+        action="Limit outdoor duration to 45min, suggest indoor alternatives",
+        reason="Temperature is below freezing ({temperature_celsius}°C). Risk of frostbite and hypothermia with prolonged exposure."
+    ),
+    "HEATWAVE_ACTIVE": EnvironmentAdjustment(
+        rule_id="HEATWAVE_ACTIVE",
+        trigger="Heatwave warning is active",
+        action="Reduce intensity to 60%, limit duration to 40min, prioritize indoor",
+        reason="A heatwave is in effect. Outdoor exercise should be minimized. Stay hydrated and exercise in cooled environments."
+    ),
+    "LOCKDOWN_FULL": EnvironmentAdjustment(
+        rule_id="LOCKDOWN_FULL",
+        trigger="Full lockdown is in effect",
+        action="Home-only workouts, block all outdoor and gym activities",
+        reason="Full lockdown restrictions are active. All workouts must be done at home. No outdoor or facility access permitted."
+    ),
+    "LOCKDOWN_PARTIAL": EnvironmentAdjustment(
+        rule_id="LOCKDOWN_PARTIAL",
+        trigger="Partial lockdown is in effect",
+        action="Avoid group activities and crowded spaces",
+        reason="Partial lockdown restrictions are active. Avoid group fitness classes and crowded gyms. Solo outdoor exercise permitted."
+    ),
+    "LOCAL_EVENT_ACTIVE": EnvironmentAdjustment(
+        rule_id="LOCAL_EVENT_ACTIVE",
+        trigger="Local event affecting safety/access",
+        action="Avoid affected outdoor areas, prefer indoor or private facilities",
+        reason="A local event may affect safety or access to outdoor workout areas. Consider indoor alternatives or different routes."
+    )
+}
+
+def aqi_band(aqi: int) -> str:
+    if aqi > 300:
+        return "hazardous"
+    elif aqi > 200:
+        return "very_unhealthy"
+    elif aqi > 150:
+        return "unhealthy"
+    elif aqi > 100:
+        return "unhealthy_sensitive"
+    return "acceptable"
+
+def temperature_band(temperature_celsius: float) -> str:
+    if temperature_celsius > 38:
+        return "extreme_hot"
+    elif temperature_celsius > 35:
+        return "hot"
+    elif temperature_celsius < 0:
+        return "cold_extreme"
+    return "mild"
+
+def environment_band_key(
+    aqi: int,
+    temperature_celsius: float,
+    is_heatwave: bool,
+    lockdown_status: str,
+    has_local_event: bool
+) -> Tuple[str, str, bool, str, bool]:
+    """The only inputs the rule outcome depends on; raw values just fill in text."""
+    return (
+        aqi_band(aqi),
+        temperature_band(temperature_celsius),
+        bool(is_heatwave),
+        "full" if lockdown_status == "full" else "partial" if lockdown_status == "partial" else "none",
+        bool(has_local_event)
+    )
+
+# The outcome only depends on the band key; cached so the full grid runs in reasonable time
+@functools.lru_cache(maxsize=None)
+def _reference_template(
+    aqi_band: str,
+    temperature_band: str,
+    is_heatwave: bool,
+    lockdown_status: str,
+    has_local_event: bool
+) -> Tuple[WorkoutConstraints, Tuple[EnvironmentAdjustment, ...], str]:
+    # Mutable copy of the defaults; the rules below were written against a mutable WorkoutConstraints
+    constraints = SimpleNamespace(
+        allow_outdoor=True, max_intensity_percent=100, max_duration_minutes=120, recommended_location="any",
+        blocked_workout_types=[], suggested_workout_types=[]
+    )
+    adjustments: List[EnvironmentAdjustment] = []
+    severity_scores = []
+
+    # === RULE 1: AQI Rules ===
+    if aqi_band == "hazardous":
+        constraints.allow_outdoor = False
+        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 50)
+        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 30)
+        constraints.recommended_location = "indoor"
+        constraints.blocked_workout_types.extend(["outdoor_running", "cycling", "hiking", "outdoor_sports"])
+        constraints.suggested_workout_types.extend(["indoor_yoga", "light_stretching", "indoor_strength"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["AQI_HAZARDOUS"])
+        severity_scores.append(4)
+    elif aqi_band == "very_unhealthy":
+        constraints.allow_outdoor = False
+        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 60)
+        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 45)
+        constraints.recommended_location = "indoor"
+        constraints.blocked_workout_types.extend(["outdoor_running", "cycling", "hiking"])
+        constraints.suggested_workout_types.extend(["indoor_cardio", "swimming_indoor", "yoga"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["AQI_VERY_UNHEALTHY"])
+        severity_scores.append(3)
+    elif aqi_band == "unhealthy":
+        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 70)
+        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 60)
+        constraints.recommended_location = "indoor"
+        constraints.blocked_workout_types.extend(["high_intensity_outdoor", "long_distance_running"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["AQI_UNHEALTHY"])
+        severity_scores.append(2)
+    elif aqi_band == "unhealthy_sensitive":
+        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 85)
+        adjustments.append(REFERENCE_ADJUSTMENTS["AQI_MODERATE_SENSITIVE"])
+        severity_scores.append(1)
+
+    # === RULE 2: Temperature Rules ===
+    if temperature_band == "extreme_hot":
+        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 50)
+        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 30)
+        constraints.recommended_location = "indoor"
+        constraints.blocked_workout_types.extend(["outdoor_running", "outdoor_hiit", "outdoor_sports"])
+        constraints.suggested_workout_types.extend(["swimming", "indoor_strength", "air_conditioned_gym"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["TEMP_EXTREME_HOT"])
+        severity_scores.append(4)
+    elif temperature_band == "hot":
+        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 65)
+        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 45)
+        constraints.suggested_workout_types.extend(["early_morning_workout", "evening_workout", "swimming"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["TEMP_HOT"])
+        severity_scores.append(2)
+    elif temperature_band == "cold_extreme":
+        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 45)
+        constraints.blocked_workout_types.extend(["outdoor_swimming"])
+        constraints.suggested_workout_types.extend(["indoor_cardio", "heated_gym", "indoor_sports"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["TEMP_EXTREME_COLD"])
+        severity_scores.append(2)
+
+    # === RULE 3: Heatwave Rules ===
+    if is_heatwave:
+        constraints.max_intensity_percent = min(constraints.max_intensity_percent, 60)
+        constraints.max_duration_minutes = min(constraints.max_duration_minutes, 40)
+        constraints.recommended_location = "indoor"
+        adjustments.append(REFERENCE_ADJUSTMENTS["HEATWAVE_ACTIVE"])
+        severity_scores.append(3)
+
+    # === RULE 4: Lockdown Rules ===
+    if lockdown_status == "full":
+        constraints.allow_outdoor = False
+        constraints.recommended_location = "home"
+        constraints.blocked_workout_types.extend(["gym", "outdoor_running", "group_classes", "swimming_public"])
+        constraints.suggested_workout_types.extend(["home_bodyweight", "home_yoga", "home_hiit", "resistance_bands"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["LOCKDOWN_FULL"])
+        severity_scores.append(4)
+    elif lockdown_status == "partial":
+        constraints.blocked_workout_types.extend(["group_classes", "crowded_gym"])
+        constraints.suggested_workout_types.extend(["solo_outdoor", "home_workout", "outdoor_solo_running"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["LOCKDOWN_PARTIAL"])
+        severity_scores.append(2)
+
+    # === RULE 5: Local Event Rules ===
+    if has_local_event:
+        constraints.blocked_workout_types.extend(["outdoor_running_streets", "cycling_roads", "public_parks"])
+        constraints.suggested_workout_types.extend(["indoor_gym", "home_workout", "private_facilities"])
+        adjustments.append(REFERENCE_ADJUSTMENTS["LOCAL_EVENT_ACTIVE"])
+        severity_scores.append(2)
+
+    # === Calculate Overall Severity ===
+    if not severity_scores:
+        severity = "low"
+    else:
+        max_severity = max(severity_scores)
+        if max_severity >= 4:
+            severity = "critical"
+        elif max_severity >= 3:
+            severity = "high"
+        elif max_severity >= 2:
+            severity = "moderate"
+        else:
+            severity = "low"
+
+    # Deduplicate suggested workout types
+    constraints.blocked_workout_types = list(set(constraints.blocked_workout_types))
+    constraints.suggested_workout_types = list(set(constraints.suggested_workout_types))
+    
+    # Remove blocked types from suggested
+    constraints.suggested_workout_types = [
+        w for w in constraints.suggested_workout_types 
+        if w not in constraints.blocked_workout_types
+    ]
+
+    constraints.blocked_workout_types = tuple(constraints.blocked_workout_types)
+    constraints.suggested_workout_types = tuple(constraints.suggested_workout_types)
+    return WorkoutConstraints(**vars(constraints)), tuple(adjustments), severity
+
+def reference_environment_impact(
+    aqi: int,
+    temperature_celsius: float,
+    is_heatwave: bool,
+    lockdown_status: str,
+    has_local_event: bool
+) -> Tuple[WorkoutConstraints, List[EnvironmentAdjustment], str]:
+    constraints, template_adjustments, severity = _reference_template(*environment_band_key(
+        aqi, temperature_celsius, is_heatwave, lockdown_status, has_local_event
+    ))
+    adjustments = [
+        EnvironmentAdjustment(
+            rule_id=a.rule_id,
+            trigger=a.trigger.format(aqi=aqi, temperature_celsius=temperature_celsius),
+            action=a.action,
+            reason=a.reason.format(aqi=aqi, temperature_celsius=temperature_celsius)
+        ) if a.rule_id in _FORMATTED_RULES else a
+        for a in template_adjustments
+    ]
+    return constraints, adjustments, severity
+
+
+# Boundary values on both sides of every threshold, plus a regular sweep
+TEMPERATURE_GRID = sorted(set(
+    [t / 2 for t in range(-100, 121)]
+    + [-0.01, 0.01, 34.99, 35.01, 37.99, 38.01, 35.000001, 38.000001]
+))
+AQI_GRID = range(0, 501)
+LOCKDOWN_GRID = ("none", "partial", "full", "unknown")
+
+@pytest.mark.parametrize("lockdown_status", LOCKDOWN_GRID)
+def test_rule_table_matches_reference(lockdown_status):
+    mismatches = []
+    for aqi, temperature, is_heatwave, has_local_event in itertools.product(
+        AQI_GRID, TEMPERATURE_GRID, (False, True), (False, True)
+    ):
+        inputs = (aqi, temperature, is_heatwave, lockdown_status, has_local_event)
+        if calculate_environment_impact(*inputs) != reference_environment_impact(*inputs):
+            mismatches.append(inputs)
+            if len(mismatches) >= 20:
+                break
+    assert not mismatches
+
+def test_shared_constraints_are_immutable():
+    constraints, _, _ = calculate_environment_impact(350, 40.0, True, "full", True)
+    assert constraints is calculate_environment_impact(360, 41.0, True, "full", True)[0]
+    with pytest.raises(AttributeError):
+        constraints.max_intensity_percent = 100
+    assert isinstance(constraints.blocked_workout_types, tuple)
+
+def test_rules_info_counts_lookups():
+    from app.environment_engine import rules_info
+
+    before = rules_info()
+    calculate_environment_impact(40, 20.0, False, "none", False)  # no rule fires
+    calculate_environment_impact(350, 20.0, False, "none", False)  # AQI text is formatted in
+    after = rules_info()
+    assert after["lookups"] - before["lookups"] == 2
+    assert after["formatted_lookups"] - before["formatted_lookups"] == 1
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from app import database, environment_engine, explanations, models
+
+HEATWAVE = {"user_id": None, "aqi": 320, "temperature_celsius": 36.5, "is_heatwave": True}
+
+def _restart_with_rules(monkeypatch, tmp_path, edit):
+    """Install an edited copy of the rules file and forget every catalog, as a restarted worker would."""
+    with open(environment_engine.RULES_PATH, encoding="utf-8") as f:
+        doc = json.load(f)
+    edit(doc)
+    path = tmp_path / "environment_rules.json"
+    path.write_text(json.dumps(doc), encoding="utf-8")
+    monkeypatch.setattr(environment_engine, "_rules", environment_engine.load_rules(str(path)))
+    monkeypatch.setattr(explanations, "_catalogs", {})
+    monkeypatch.setattr(explanations, "_stored", set())
+    monkeypatch.setattr(explanations, "_missing", set())
+    monkeypatch.setattr(explanations, "_current", None)
+    explanations.register_catalog(database.engine)
+
+def _drop_heatwave(doc):
+    doc["rules"] = [rule for rule in doc["rules"] if rule["id"] != "HEATWAVE_ACTIVE"]
+
+def _reword_heatwave(doc):
+    for rule in doc["rules"]:
+        if rule["id"] == "HEATWAVE_ACTIVE":
+            rule["reason"] = "Reworded heatwave advice."
+
+def test_explanation_round_trip(db, user_id):
+    explanations.register_catalog(database.engine)
+    explanation = {
+        "sleep": "Sleep was 5.5 hours",
+        "overall": "Your readiness score is 42, which is low.",
+        "env_heatwave_active": "A heatwave is in effect. Outdoor exercise should be minimized. Stay hydrated and exercise in cooled environments.",
+        "free_text": "Not from any template",
+    }
+    stored = explanations.encode_explanation(explanation)
+    assert stored["catalog"] == explanations._current_catalog().digest
+    assert {"free_text": "Not from any template"} in stored["codes"]
+    assert explanations.decode_explanation(stored) == explanation
+
+def test_adjustments_round_trip():
+    explanations.register_catalog(database.engine)
+    _, adjustments, _ = environment_engine.calculate_environment_impact(320, 36.5, True, "partial", True)
+    adjustments = [a.__dict__ for a in adjustments]
+    stored = explanations.encode_adjustments(adjustments)
+    assert all(not isinstance(entry, dict) for entry in stored["codes"])
+    assert explanations.decode_adjustments(stored) == adjustments
+
+def test_unstored_catalog_stores_text_verbatim(monkeypatch):
+    explanations.register_catalog(database.engine)
+    monkeypatch.setattr(explanations, "_stored", set())
+    monkeypatch.setattr(explanations, "_store_in_background", lambda catalog: None)
+    explanation = {"sleep": "Sleep was 5.5 hours"}
+    assert explanations.encode_explanation(explanation) is explanation
+
+@pytest.mark.parametrize("edit", [_drop_heatwave, _reword_heatwave])
+def test_stored_rows_render_with_their_own_rules(client, user_id, monkeypatch, tmp_path, edit):
+    explanations.register_catalog(database.engine)
+    posted = client.post("/environment-input", json={**HEATWAVE, "user_id": user_id}).json()
+    heatwave = next(a for a in posted["adjustments"] if a["rule_id"] == "HEATWAVE_ACTIVE")
+
+    _restart_with_rules(monkeypatch, tmp_path, edit)
+
+    for path in (f"/environment-impact/{user_id}", f"/environment-history/{user_id}"):
+        response = client.get(path)
+        assert response.status_code == 200
+        body = response.json()
+        adjustments = (body[0] if isinstance(body, list) else body)["adjustments"]
+        assert heatwave in adjustments
+
+def test_unknown_catalog_and_code_never_raise():
+    stored = {"catalog": "0000000000000000", "codes": ["NO_SUCH_RULE", ["ALSO_GONE", 12]]}
+    assert explanations.decode_adjustments(stored) == [
+        {"rule_id": "NO_SUCH_RULE", "trigger": "NO_SUCH_RULE", "action": "", "reason": ""},
+        {"rule_id": "ALSO_GONE", "trigger": "ALSO_GONE (12)", "action": "", "reason": ""},
+    ]
+    assert explanations.decode_explanation(stored) == {"NO_SUCH_RULE": "NO_SUCH_RULE", "ALSO_GONE": "ALSO_GONE (12)"}
+
+def test_catalogs_are_append_only(monkeypatch, tmp_path):
+    explanations.register_catalog(database.engine)
+    before = explanations._current_catalog().digest
+    _restart_with_rules(monkeypatch, tmp_path, _reword_heatwave)
+    with database.engine.connect() as conn:
+        digests = set(conn.execute(models.ExplanationCatalog.__table__.select()).scalars())
+    assert {before, explanations._current_catalog().digest} <= digests
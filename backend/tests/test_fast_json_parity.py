@@ -0,0 +1,138 @@
+"""
+Parity of fast_json with rendering through the pydantic models.
+
+Seeded random responses of every model the handlers pass to fast_json,
+built the way the handlers build them (engine dataclasses, stored-row
+stand-ins, response dicts), are rendered both ways and must match byte for
+byte. Values are skewed towards the edges: floats that orjson and json spell
+differently, NaN, naive and offset datetimes, non-ASCII and control
+characters, enum members where strings are expected.
+"""
+import random
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Callable, Dict, Tuple
+
+import pytest
+
+from app import environment_engine, fast_json, schemas, services
+
+FLOATS = [0.0, -0.0, 1.0, 7.5, 0.1, 1e-4, 9.99e-5, 1e-5, 1e-7, 123456.789, 1e15, 9.999e15, 1e16, 1e22,
+          -3.25, float("nan"), float("inf"), 7]
+STRINGS = ["", "plain", "quote \" and \\ backslash", "tab\tnew\nline\x00\x1f", "ünïcødé ✓ 日本", "  ",
+           "emoji \U0001F3C3"]
+TIMEZONES = [None, timezone.utc, timezone(timedelta(0), "UTC+0"), timezone(timedelta(hours=5, minutes=30)),
+             timezone(-timedelta(hours=8)), timezone(timedelta(hours=1, seconds=30))]
+
+def _float(rng: random.Random):
+    return rng.choice(FLOATS) if rng.random() < 0.3 else round(rng.uniform(-50, 60), rng.randint(0, 6))
+
+def _datetime(rng: random.Random) -> datetime:
+    value = datetime(2020, 1, 1) + timedelta(seconds=rng.randint(0, 10**8))
+    if rng.random() < 0.5:
+        value = value.replace(microsecond=rng.choice([0, 1, 500000, rng.randint(0, 999999)]))
+    return value.replace(tzinfo=rng.choice(TIMEZONES))
+
+def _str(rng: random.Random) -> str:
+    return rng.choice(STRINGS) if rng.random() < 0.3 else f"value {rng.randint(0, 999)}"
+
+def _explanation(rng: random.Random) -> Dict[str, str]:
+    return {_str(rng): _str(rng) for _ in range(rng.randint(0, 4))}
+
+def _conditions(rng: random.Random) -> dict:
+    return {
+        "aqi": rng.randint(0, 500),
+        "temperature_celsius": _float(rng),
+        "is_heatwave": rng.random() < 0.3,
+        "lockdown_status": rng.choice(["none", "partial", "full", schemas.LockdownStatus.FULL]),
+        "has_local_event": rng.random() < 0.3
+    }
+
+def _impact(conditions: dict):
+    lockdown = conditions["lockdown_status"]
+    temperature = conditions["temperature_celsius"]
+    return environment_engine.calculate_environment_impact(
+        conditions["aqi"], temperature if temperature == temperature else 20.0, conditions["is_heatwave"],
+        getattr(lockdown, "value", lockdown), conditions["has_local_event"]
+    )
+
+def readiness_row(rng: random.Random):
+    """Stand-in for a DailyReadiness row (GET/POST /readiness)."""
+    return SimpleNamespace(
+        id=rng.choice([None, rng.randint(1, 10**6)]), user_id=rng.randint(1, 10**6), date=_datetime(rng),
+        sleep_hours=_float(rng), stress_level=rng.randint(1, 10), fatigue_level=rng.randint(1, 10),
+        muscle_soreness=rng.randint(1, 10), available_time=rng.choice([15, 30, 60, 90]),
+        readiness_score=rng.randint(0, 100), decision=rng.choice(["TRAIN", "ACTIVE_RECOVERY", "REST"]),
+        explanation=_explanation(rng)
+    )
+
+def environment_response(rng: random.Random) -> dict:
+    """services.environment_response / region_environment_response of a stored row."""
+    conditions = _conditions(rng)
+    row = SimpleNamespace(**conditions, **services.environment_policy_fields(*_impact(conditions)))
+    response = {"id": rng.randint(1, 10**6), "user_id": rng.randint(1, 10**6), "date": _datetime(rng),
+                **services.environment_conditions(row)}
+    if rng.random() < 0.3:
+        response["region_id"] = rng.randint(1, 100)
+    return response
+
+def combined_response(rng: random.Random) -> dict:
+    """services.combined_readiness response fields (engine dataclasses inside)."""
+    request = schemas.CombinedReadinessRequest(
+        user_id=rng.randint(1, 10**6), sleep_hours=round(rng.uniform(0, 12), 1), stress_level=rng.randint(1, 10),
+        fatigue_level=rng.randint(1, 10), muscle_soreness=rng.randint(1, 10), available_time=rng.choice([15, 30, 60]),
+        **{**_conditions(rng), "temperature_celsius": round(rng.uniform(-20, 50), 2)}
+    )
+    response = services.combined_readiness(request)[0]
+    if rng.random() < 0.3:
+        response["environment_snapshot_id"] = rng.randint(1, 100)
+    return response
+
+def daily_decision(rng: random.Random):
+    """Stand-in for a DailyDecision row (GET /decisions/{user_id}/today)."""
+    return SimpleNamespace(
+        user_id=rng.randint(1, 10**6), day=date(2024, 1, 1) + timedelta(days=rng.randint(0, 1000)),
+        readiness_id=rng.randint(1, 10**6), environment_snapshot_id=rng.choice([None, 3]),
+        environment_policy_id=rng.choice([None, 9]), readiness_score=rng.randint(0, 100),
+        base_decision="TRAIN", final_decision=rng.choice(["TRAIN", "REST"]),
+        environment_severity=rng.choice(["low", "critical"]), computed_at=_datetime(rng)
+    )
+
+CASES: Dict[str, Tuple[type, Callable[[random.Random], object]]] = {
+    "readiness": (schemas.DailyReadinessResponse, readiness_row),
+    "environment": (schemas.EnvironmentImpactResponse, environment_response),
+    "combined": (schemas.CombinedReadinessResponse, combined_response),
+    "decision": (schemas.DailyDecisionResponse, daily_decision),
+}
+
+def _reference(model, value) -> bytes:
+    try:
+        return fast_json.reference(model, value)
+    except ValueError as e:  # pydantic's ValidationError, or json refusing NaN
+        return f"<{type(e).__name__}>".encode()
+
+@pytest.mark.parametrize("name", CASES)
+def test_fast_path_matches_pydantic(name):
+    model, build = CASES[name]
+    rng = random.Random(name)
+    mismatches = []
+    fast = 0
+    for _ in range(2000):
+        value = build(rng)
+        body = fast_json.try_render(model, value)
+        if body is None:
+            continue
+        fast += 1
+        expected = _reference(model, value)
+        if body != expected:
+            mismatches.append((value, expected, body))
+            if len(mismatches) >= 20:
+                break
+    assert not mismatches
+    assert fast > 0  # the edge cases must not push everything onto the fallback
+
+def test_unrenderable_values_fall_back_to_pydantic():
+    row = readiness_row(random.Random(0))
+    row.sleep_hours = 1e-7  # orjson and json spell it differently
+    assert fast_json.try_render(schemas.DailyReadinessResponse, row) is None
+    assert fast_json.render(schemas.DailyReadinessResponse, row) == _reference(schemas.DailyReadinessResponse, row)
@@ -0,0 +1,11 @@
+def test_bulk_body_that_is_not_utf8_is_rejected(client, user_id):
+    body = b'{"user_id": %d, "aqi": 80}\n\xff\xfe' % user_id
+    response = client.post("/environment-input/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 400
+    assert "UTF-8" in response.json()["detail"]
+
+def test_bulk_ndjson_keeps_valid_rows(client, user_id):
+    body = b'{"user_id": %d, "aqi": 80}\nnot json\n' % user_id
+    response = client.post("/environment-input/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert (response.json()["inserted"], response.json()["rejected"]) == (1, 1)
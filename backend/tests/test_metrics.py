@@ -0,0 +1,16 @@
+from app import metrics
+
+def test_monotonic_stats_are_counters_with_a_total_suffix():
+    text = metrics.render({"app_cache": {"writes_sent": 3, "queued_writes": 2, "breaker": {"times_opened": 1}}})
+    lines = text.splitlines()
+    assert "# TYPE app_cache_writes_sent_total counter" in lines
+    assert "app_cache_writes_sent_total 3" in lines
+    assert "app_cache_breaker_times_opened_total 1" in lines
+    assert "# TYPE app_cache_queued_writes gauge" in lines
+    assert not any(line.startswith("app_cache_writes_sent ") for line in lines)
+
+def test_metrics_endpoint_exposes_singleflight_counters(client, user_id):
+    client.get(f"/environment-impact/{user_id}")
+    lines = client.get("/metrics").text.splitlines()
+    assert any(line.startswith(("app_singleflight_sync_environment_impact_calls_total ",
+                                "app_singleflight_async_environment_impact_calls_total ")) for line in lines)
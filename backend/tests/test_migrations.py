@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, create_engine, inspect
+from sqlalchemy.pool import QueuePool
+
+from app import migrations
+
+def _metadata(*extra):
+    metadata = MetaData()
+    Table("items", metadata, Column("id", Integer, primary_key=True), *extra)
+    return metadata
+
+def test_upgrade_adds_columns_and_indexes_on_a_single_connection(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'm.db'}", poolclass=QueuePool, pool_size=1, max_overflow=0,
+                           pool_timeout=1)
+    migrations.upgrade(engine, _metadata())
+
+    name = Column("name", String)
+    migrations.upgrade(engine, _metadata(name, Index("ix_items_name", "name")))
+    migrations.upgrade(engine, _metadata(Column("name", String), Index("ix_items_name", "name")))  # again: no-op
+
+    inspector = inspect(engine)
+    assert "name" in {c["name"] for c in inspector.get_columns("items")}
+    assert "ix_items_name" in {i["name"] for i in inspector.get_indexes("items")}
+
+def test_postgres_indexes_are_built_concurrently():
+    from sqlalchemy.dialects import postgresql
+
+    metadata = _metadata(Column("name", String), Index("ix_items_name", "name", unique=True))
+    [index] = metadata.tables["items"].indexes
+    ddl = migrations._create_index(index, postgresql.dialect())
+    assert ddl.startswith("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_items_name")
@@ -0,0 +1,48 @@
+from app import precompute
+
+GOOD = {"sleep_hours": 8, "stress_level": 2, "fatigue_level": 2, "muscle_soreness": 1, "available_time": 60}
+BAD = {"sleep_hours": 3, "stress_level": 10, "fatigue_level": 10, "muscle_soreness": 10, "available_time": 15}
+
+def test_precompute_on_snapshot_is_off_by_default():
+    assert precompute.PRECOMPUTE_ON_SNAPSHOT is False
+    assert precompute.schedule(None) is False
+
+def test_checkin_after_precompute_refreshes_todays_decision(client, user_id):
+    client.post("/readiness/", json={**GOOD, "user_id": user_id})
+    precompute.precompute_decisions(workers=1)
+    first = client.get(f"/decisions/{user_id}/today").json()
+
+    later = client.post("/readiness/", json={**BAD, "user_id": user_id}).json()
+    decision = client.get(f"/decisions/{user_id}/today").json()
+    assert decision["readiness_id"] == later["id"] != first["readiness_id"]
+    assert decision["readiness_score"] == later["readiness_score"]
+
+def test_checkin_does_not_create_a_decision_before_the_days_precompute(client, user_id):
+    client.post("/readiness/", json={**GOOD, "user_id": user_id})
+    assert client.get(f"/decisions/{user_id}/today").json() is None
+
+def test_combined_checkin_applies_its_environment_to_todays_decision(client, user_id):
+    client.post("/readiness/", json={**GOOD, "user_id": user_id})
+    precompute.precompute_decisions(workers=1)
+
+    combined = client.post("/combined-readiness/", json={**GOOD, "user_id": user_id, "aqi": 350}).json()
+    decision = client.get(f"/decisions/{user_id}/today").json()
+    assert decision["environment_severity"] == combined["environment_severity"] == "critical"
+    assert decision["final_decision"] == combined["final_decision"]
+    assert decision["environment_policy_id"] is not None
+
+def test_buffered_checkins_update_todays_decision(client, db, user_id):
+    from app import models, schemas, services, write_behind
+
+    client.post("/readiness/", json={**GOOD, "user_id": user_id})
+    precompute.precompute_decisions(workers=1)
+
+    rows = [services.readiness_row(schemas.DailyReadinessCreate(**values, user_id=user_id)) for values in (GOOD, BAD)]
+    write_behind.WriteBehindBuffer(retry_backoff=0).flush(
+        [(models.DailyReadiness, write_behind.row_values(row)) for row in rows]
+    )
+    decision = client.get(f"/decisions/{user_id}/today").json()
+    latest = client.get(f"/readiness/{user_id}", params={"limit": 1}).json()[0]
+    assert decision["readiness_id"] == latest["id"]
+    assert decision["readiness_score"] == rows[1].readiness_score
+    assert decision["base_decision"] == rows[1].decision
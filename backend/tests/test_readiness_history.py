@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+from app import models
+
+def _add_checkins(db, user_id, dates):
+    rows = [
+        models.DailyReadiness(
+            user_id=user_id, date=day, sleep_hours=7.0, stress_level=3, fatigue_level=3, muscle_soreness=3,
+            available_time=30, readiness_score=70, decision="TRAIN", explanation={}
+        )
+        for day in dates
+    ]
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+def test_pages_follow_the_cursor_through_equal_dates(client, db, user_id):
+    start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    # Several rows share a timestamp, so the id has to break ties across page boundaries
+    dates = [start + timedelta(hours=h) for h in (0, 1, 1, 1, 2, 3, 3)]
+    rows = _add_checkins(db, user_id, dates)
+    expected = [r.id for r in sorted(rows, key=lambda r: (r.date, r.id), reverse=True)]
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 3, **({"before": cursor} if cursor else {})}
+        response = client.get(f"/readiness/{user_id}", params=params)
+        assert response.status_code == 200
+        seen += [item["id"] for item in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == 3
+
+def test_last_full_page_has_a_cursor_to_an_empty_page(client, db, user_id):
+    start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    _add_checkins(db, user_id, [start + timedelta(days=d) for d in range(2)])
+
+    first = client.get(f"/readiness/{user_id}", params={"limit": 2})
+    cursor = first.headers["X-Next-Cursor"]
+    last = client.get(f"/readiness/{user_id}", params={"limit": 2, "before": cursor})
+    assert last.json() == [] and "X-Next-Cursor" not in last.headers
@@ -0,0 +1,24 @@
+from sqlalchemy import update
+
+from app import models, rescore, trends
+
+CHECKIN = {"sleep_hours": 8, "stress_level": 2, "fatigue_level": 2, "muscle_soreness": 1, "available_time": 60}
+
+def test_rescore_invalidates_cached_reads_and_rebuilds_trends(client, db, user_id):
+    stored = client.post("/readiness/", json={**CHECKIN, "user_id": user_id}).json()
+    db.execute(update(models.DailyReadiness).where(models.DailyReadiness.id == stored["id"]).values(readiness_score=1))
+    db.commit()
+    assert client.get(f"/readiness/{user_id}").json()[0]["readiness_score"] == 1
+    assert client.get(f"/readiness/{user_id}").headers["x-cache"] == "HIT"
+
+    report = rescore.rescore("readiness", workers=1, checkpoint_path=None)
+    assert report["daily_readiness"]["updated"] >= 1
+
+    page = client.get(f"/readiness/{user_id}")
+    assert page.headers["x-cache"] == "MISS"
+    assert page.json()[0]["readiness_score"] == stored["readiness_score"]
+
+    derived = rescore.refresh_derived(report)
+    assert {"trends", "decisions"} <= derived.keys()
+    trend = db.execute(trends.trend_statement(user_id)).scalars().one()
+    assert trends.trends_response(trend)["acute"]["avg_readiness"] == stored["readiness_score"]
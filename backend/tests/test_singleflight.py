@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import singleflight
+
+def test_concurrent_calls_share_one_execution():
+    group = singleflight.Group()
+    executions = []
+    started = threading.Event()
+
+    def compute():
+        executions.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "result"
+
+    results = []
+
+    def call():
+        results.append(group.do(("kind", 1), compute))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    waiters = [threading.Thread(target=call) for _ in range(4)]
+    for thread in waiters:
+        thread.start()
+    for thread in [leader, *waiters]:
+        thread.join()
+
+    assert len(executions) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 4
+    assert group.counters.snapshot()["kind"] == {"calls": 5, "executions": 1, "coalesced": 4}
+
+def test_leader_errors_reach_waiters_and_are_not_kept():
+    group = singleflight.Group()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("query failed")
+
+    errors = []
+
+    def call():
+        try:
+            group.do("key", fail)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    waiter = threading.Thread(target=call)
+    waiter.start()
+    leader.join()
+    waiter.join()
+
+    assert len(errors) == 2
+    assert group.do("key", lambda: "fresh") == ("fresh", False)
+
+def test_async_waiters_compute_for_themselves_when_the_leader_is_cancelled():
+    group = singleflight.AsyncGroup()
+
+    async def slow():
+        await asyncio.sleep(1)
+        return "leader"
+
+    async def fast():
+        return "waiter"
+
+    async def main():
+        leader = asyncio.create_task(group.do("key", slow))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(group.do("key", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiter
+
+    assert asyncio.run(main()) == ("waiter", False)
@@ -0,0 +1,34 @@
+from app import database, models, trends
+
+def _checkin(user_id, score=70, decision="TRAIN"):
+    return {"user_id": user_id, "date": None, "readiness_score": score, "decision": decision, "available_time": 30}
+
+def _trend(user_id) -> models.UserTrend:
+    with database.SessionLocal() as db:
+        return db.execute(trends.trend_statement(user_id)).scalars().one()
+
+def test_first_checkin_creates_the_trend(db, user_id):
+    trends.record(db, [_checkin(user_id, 60), _checkin(user_id, 80)])
+    db.commit()
+    trend = _trend(user_id)
+    assert trends.trends_response(trend)["acute"]["checkins"] == 2
+    assert trends.trends_response(trend)["acute"]["avg_readiness"] == 70.0
+
+def test_concurrent_first_checkins_both_count(db, user_id, monkeypatch):
+    # Another transaction stores the user's first check-in after this one found no trend row
+    locked = trends._locked
+    calls = []
+
+    def racing_lock(session, user_ids):
+        if not calls:
+            calls.append(user_ids)
+            with database.SessionLocal() as other:
+                trends.record(other, [_checkin(user_id, 50)])
+                other.commit()
+            return {}
+        return locked(session, user_ids)
+
+    monkeypatch.setattr(trends, "_locked", racing_lock)
+    trends.record(db, [_checkin(user_id, 90)])
+    db.commit()
+    assert trends.trends_response(_trend(user_id))["acute"]["checkins"] == 2
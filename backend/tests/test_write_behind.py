@@ -0,0 +1,77 @@
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app import database, models, schemas, services, write_behind
+
+def _item(user_id, **values):
+    row = services.readiness_row(schemas.DailyReadinessCreate(
+        user_id=user_id, sleep_hours=7.5, stress_level=3, fatigue_level=3, muscle_soreness=2, available_time=45
+    ))
+    row.date = datetime.now(timezone.utc)
+    return models.DailyReadiness, {**write_behind.row_values(row), **values}
+
+def _stored(db, user_id) -> int:
+    return db.execute(select(func.count()).where(models.DailyReadiness.user_id == user_id)).scalar()
+
+def test_flush_retries_transient_failures(db, user_id):
+    failures = [RuntimeError("connection reset"), RuntimeError("lock timeout")]
+
+    def flaky_session():
+        session = database.SessionLocal()
+        if failures:
+            error = failures.pop(0)
+
+            def execute(*args, **kwargs):
+                raise error
+            session.execute = execute
+        return session
+
+    buffer = write_behind.WriteBehindBuffer(session_factory=flaky_session, retry_backoff=0)
+    buffer.flush([_item(user_id) for _ in range(3)])
+    stats = buffer.stats()
+    assert (stats["rows_written"], stats["rows_failed"], stats["flush_retries"]) == (3, 0, 2)
+    assert _stored(db, user_id) == 3
+
+def test_flush_dead_letters_only_failing_rows(db, user_id, tmp_path):
+    next_id = (db.execute(select(func.max(models.DailyReadiness.id))).scalar() or 0) + 1000
+    ids = list(range(next_id, next_id + 7))
+    # The fifth row reuses the first row's id, so it can never be inserted
+    ids[4] = ids[0]
+    dead_letter_path = tmp_path / "dead_letters.jsonl"
+    buffer = write_behind.WriteBehindBuffer(retry_backoff=0, dead_letter_path=str(dead_letter_path))
+    buffer.flush([_item(user_id, id=row_id) for row_id in ids])
+
+    stats = buffer.stats()
+    assert (stats["rows_written"], stats["rows_failed"]) == (6, 1)
+    assert stats["flush_retries"] == 0  # rejected rows aren't retried
+    assert _stored(db, user_id) == 6
+    [letter] = [json.loads(line) for line in dead_letter_path.read_text().splitlines()]
+    assert (letter["table"], letter["values"]["id"]) == ("daily_readiness", ids[0])
+
+def test_flush_keeps_retrying_through_an_outage(db, user_id, monkeypatch):
+    outage = [OperationalError("INSERT", {}, Exception("server closed the connection"))] * 8
+    write = write_behind.WriteBehindBuffer._write
+
+    def flaky_write(self, batch):
+        return outage.pop() if outage else write(self, batch)
+
+    monkeypatch.setattr(write_behind.WriteBehindBuffer, "_write", flaky_write)
+    buffer = write_behind.WriteBehindBuffer(retry_backoff=0.001, retry_backoff_max=0.004)
+    buffer.flush([_item(user_id) for _ in range(3)])
+    stats = buffer.stats()
+    assert (stats["rows_written"], stats["rows_failed"], stats["flush_retries"]) == (3, 0, 8)
+    assert _stored(db, user_id) == 3
+
+def test_failed_invalidation_after_commit_keeps_the_rows_counted(db, user_id, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("redis gone")
+
+    monkeypatch.setattr(write_behind.cache, "invalidate_many", broken)
+    buffer = write_behind.WriteBehindBuffer(retry_backoff=0)
+    buffer.flush([_item(user_id) for _ in range(2)])
+    stats = buffer.stats()
+    assert (stats["rows_written"], stats["flush_retries"]) == (2, 0)
+    assert _stored(db, user_id) == 2